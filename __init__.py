@@ -1,6 +1,7 @@
 from .ezfit import FitPDF
 from .ezconstraints import Ezrestraint
 from .contribution import Contribution
+from .fit_record import FitRecord, stack_records
 
 
-__all__ = ['FitPDF', 'Ezrestraint', 'Contribution']
+__all__ = ['FitPDF', 'Ezrestraint', 'Contribution', 'FitRecord', 'stack_records']
@@ -0,0 +1,215 @@
+"""Benchmarks of the fit pipeline on synthetic PDF data.
+
+Synthetic G(r) is calculated from the bundled rsc/d4Al2O3.cif for every
+case, written as a .gr file and fitted with FitPDF. Timed are recipe
+construction (cold and with the structure cache warm), a single residual
+evaluation with all variables free, a full multi-stage run_fit, calc_scale
+and save_results. The results are written as JSON and can be compared with
+an earlier run:
+
+    python -m ezfit.benchmarks.bench_fit --out new.json --compare old.json
+"""
+import argparse
+import json
+import sys
+import tempfile
+import typing
+from pathlib import Path
+import numpy as np
+import toml
+import diffpy.srfit.pdf.characteristicfunctions as CF
+from diffpy.srfit.pdf import PDFGenerator
+from .. import crystal_cache
+from .. import diffpy_wrap as dw
+from ..contribution import Contribution
+from ..ezfit import FitPDF
+from .common import compare, environment, timeit
+
+
+RSC = Path(__file__).resolve().parents[1].joinpath("rsc")
+CIF = "d4Al2O3"
+
+# phases of the synthetic data: (characteristic function, scale, psize,
+# relative change of the lattice parameters)
+PHASES = [
+    ("sphericalCF", 0.6, 40., 1.0),
+    ("bulkCF", 0.4, None, 1.01),
+]
+
+CASES = [
+    {"name": "1phase_r30", "phases": 1, "rmax": 30., "rstep": 0.01},
+    {"name": "1phase_r60", "phases": 1, "rmax": 60., "rstep": 0.02},
+    {"name": "2phase_r30", "phases": 2, "rmax": 30., "rstep": 0.01},
+    {"name": "2phase_r60_coarse", "phases": 2, "rmax": 60., "rstep": 0.05},
+]
+
+QMAX = 25.
+QDAMP = 0.03
+QBROAD = 0.01
+RMIN = 1.2
+
+
+def synthetic_gr(
+        path: Path,
+        phases: int,
+        rmax: float,
+        rstep: float,
+        noise: float = 0.01,
+        seed: int = 0
+) -> None:
+    """Write the G(r) of the first phases of PHASES plus noise to path."""
+    r = np.arange(RMIN, rmax + rstep / 2, rstep)
+    g = np.zeros_like(r)
+    for i, (cf, scale, psize, lat) in enumerate(PHASES[:phases]):
+        pg = PDFGenerator(f"phase{i}")
+        pg.setStructure(
+            crystal_cache.load_crystal(RSC.joinpath(f"{CIF}.cif")),
+            periodic=True
+        )
+        pg.scatteringfactortable = "neutron"
+        pg.setQmax(QMAX)
+        pg.qdamp.value = QDAMP
+        pg.qbroad.value = QBROAD
+        pg.scale.value = scale
+        for par in pg.phase.sgpars.latpars:
+            if par.name in ("a", "b", "c"):
+                par.value *= lat
+        gi = pg(r)
+        if cf == "sphericalCF":
+            gi = gi * CF.sphericalCF(r, psize)
+        g += gi
+    rng = np.random.default_rng(seed)
+    g += rng.normal(0., noise * np.abs(g).max(), len(r))
+    header = (
+        "# synthetic PDF of ezfit.benchmarks\n"
+        f"# qmax = {QMAX}\n"
+        "#### start data\n"
+    )
+    np.savetxt(path, np.column_stack([r, g]), header=header, comments="")
+
+
+def write_config(directory: Path, rmax: float, rstep: float) -> Path:
+    config = {
+        "PDF": {"qdamp": QDAMP, "qbroad": QBROAD},
+        "Measurement": {"keV": 59.798},
+        "R_val": {"rmin": RMIN, "rmax": rmax, "rstep": rstep},
+        "files": {"cifs": f"{RSC}/", "out": str(directory.joinpath("out"))},
+        "Calculator": {"parallel": 1, "evaluator": "OPTIMIZED", "cache": True},
+        "Fit": {"jac_workers": 1, "profile": False},
+        "Verbose": {"step": False, "results": False},
+        "Restraints": {
+            "delta2": [0.0, 8.0, 1.0],
+            "scale": [0.0, 1.0, 0.1],
+            "adp": [0.0, 5.0, 0.1],
+            "cfs": [0.0, 100.0, 50.0],
+            "occ": [0.0, 1.0, 1.0],
+            "lat": 0.5,
+        },
+        "param_order": [
+            {"free": ["lat", "scale"], "fix": []},
+            {"free": ["cfs", "occ"], "fix": []},
+            {"free": ["delta2", "adp"], "fix": []},
+        ],
+    }
+    path = directory.joinpath("config.toml")
+    path.write_text(toml.dumps(config))
+    return path
+
+
+def run_case(case: dict, directory: Path, repeats: int = 3) -> dict:
+    rmax, rstep = case["rmax"], case["rstep"]
+    data = directory.joinpath(f"{case['name']}.gr")
+    synthetic_gr(data, case["phases"], rmax, rstep)
+    config = str(write_config(directory, rmax, rstep))
+    contributions = [
+        Contribution(cif_name=CIF, cf_name=cf, formula="Al2O3")
+        for cf, *_ in PHASES[:case["phases"]]
+    ]
+
+    def build():
+        fit = FitPDF(str(data), contributions, config)
+        fit.update_recipe()
+        return fit
+
+    timings = {}
+    timings["recipe_cold"] = timeit(
+        build, repeats, setup=crystal_cache.clear_cache
+    )
+    timings["recipe"] = timeit(build, repeats)
+
+    fit = build()
+    fit.apply_restraints()
+    recipe = fit.recipe
+    initial = fit.get_values()
+    recipe.free("all")
+    x = recipe.getValues()
+    steps = iter(range(1, 1 + repeats))
+    # a new point every call, so no generator can reuse its last result
+    timings["residual"] = timeit(
+        lambda: recipe.residual(x * (1 + 1e-6 * next(steps))), repeats
+    )
+    recipe.fix("all")
+    fit.LoadResFromValues(initial)
+
+    timings["run_fit"] = timeit(
+        fit.run_fit, repeats,
+        setup=lambda: fit.swap_data(str(data), reset="initial")
+    )
+    timings["calc_scale"] = timeit(fit.calc_scale, repeats)
+    out = directory.joinpath("out")
+    timings["save_results"] = timeit(
+        lambda: dw.save_results(
+            recipe, footer=case["name"], directory=str(out),
+            file_stem=case["name"], pg_names=fit.phases
+        ),
+        repeats
+    )
+    return {
+        **case,
+        "points": len(recipe.PDF.profile.x),
+        "variables": len(recipe._parameters),
+        "rw": fit.res.rw,
+        "timings": timings,
+    }
+
+
+def run(
+        cases: typing.List[dict] = None,
+        repeats: int = 3
+) -> dict:
+    cases = CASES if cases is None else cases
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for case in cases:
+            print(f"benchmark {case['name']}", file=sys.stderr)
+            directory = Path(tmp).joinpath(case["name"])
+            directory.mkdir()
+            results.append(run_case(case, directory, repeats))
+    return {"environment": environment(), "cases": results}
+
+
+def main(argv: typing.List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--cases", nargs="+", choices=[case["name"] for case in CASES]
+    )
+    parser.add_argument("--compare", help="earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    cases = CASES
+    if args.cases:
+        cases = [case for case in CASES if case["name"] in args.cases]
+    results = run(cases, args.repeats)
+    Path(args.out).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text())
+        if compare(results, old, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
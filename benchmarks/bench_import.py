@@ -0,0 +1,113 @@
+"""Import-time benchmark of ezfit.
+
+Every statement is run in a fresh interpreter, which reports its import
+time and which of the heavy dependencies got loaded. None of them may be
+loaded by the statements below; they belong to the recipe, fit, scale and
+save paths. The exit code is 1 if one was loaded, if an import took longer
+than --max-time or, with --compare, if it got slower than an earlier run:
+
+    python -m ezfit.benchmarks.bench_import --out import.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import typing
+from pathlib import Path
+from .common import compare, environment
+
+
+PACKAGE = __package__.rpartition(".")[0]
+
+HEAVY = [
+    "diffpy.srfit",
+    "diffpy.srreal",
+    "pyobjcryst",
+    "scipy.optimize",
+    "scipy.constants",
+    "pandas",
+    "molmass",
+    "toml",
+    "ezpdf",
+    "matplotlib",
+]
+
+CASES = {
+    "import": f"import {PACKAGE}",
+    "from_import": f"from {PACKAGE} import FitPDF, Contribution, Ezrestraint",
+    "stream": f"import {PACKAGE}.stream",
+}
+
+_CHILD = """
+import sys, time, json
+start = time.perf_counter()
+exec(sys.argv[1])
+duration = time.perf_counter() - start
+heavy = json.loads(sys.argv[2])
+print(json.dumps({
+    "time": duration, "loaded": [m for m in heavy if m in sys.modules]
+}))
+"""
+
+
+def measure(statement: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD, statement, json.dumps(HEAVY)],
+        capture_output=True, text=True, check=True, env=env
+    ).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def run(repeats: int = 5) -> dict:
+    results = []
+    for name, statement in CASES.items():
+        runs = [measure(statement) for _ in range(repeats)]
+        times = [r["time"] for r in runs]
+        results.append({
+            "name": name,
+            "statement": statement,
+            "loaded": sorted({m for r in runs for m in r["loaded"]}),
+            "timings": {
+                "import": {
+                    "min": min(times),
+                    "median": statistics.median(times),
+                    "mean": statistics.fmean(times),
+                    "times": times,
+                }
+            },
+        })
+    return {"environment": environment(), "cases": results}
+
+
+def main(argv: typing.List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default="import.json")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-time", type=float, default=1.0)
+    parser.add_argument("--compare", help="earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    results = run(args.repeats)
+    Path(args.out).write_text(json.dumps(results, indent=2))
+    failed = False
+    for case in results["cases"]:
+        t = case["timings"]["import"]["median"]
+        print(f"{case['statement']:<60}{t:>8.3f} s")
+        if case["loaded"]:
+            print(f"    loads {', '.join(case['loaded'])}")
+            failed = True
+        if t > args.max_time:
+            failed = True
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text())
+        if compare(results, old, args.threshold):
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
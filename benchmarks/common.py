@@ -0,0 +1,76 @@
+import importlib.metadata
+import os
+import platform
+import statistics
+import time
+import typing
+from datetime import datetime
+
+
+def timeit(
+        fun: typing.Callable,
+        repeats: int,
+        setup: typing.Callable = None
+) -> typing.Dict[str, typing.Union[float, typing.List[float]]]:
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fun()
+        times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "times": times,
+    }
+
+
+def environment() -> dict:
+    versions = {}
+    for package in [
+        "numpy", "scipy", "diffpy.srfit", "diffpy.srreal", "pyobjcryst"
+    ]:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "versions": versions,
+    }
+
+
+def compare(
+        new: dict,
+        old: dict,
+        threshold: float = 1.2
+) -> typing.List[str]:
+    """Print the ratio of the median times new / old of every benchmark.
+
+    Returns the benchmarks that got slower than threshold.
+    """
+    old_cases = {case["name"]: case for case in old["cases"]}
+    slower = []
+    print(f"{'benchmark':<36}{'old [s]':>10}{'new [s]':>10}{'ratio':>8}")
+    for case in new["cases"]:
+        if case["name"] not in old_cases:
+            continue
+        old_timings = old_cases[case["name"]]["timings"]
+        for name, timing in case["timings"].items():
+            if name not in old_timings:
+                continue
+            t_old = old_timings[name]["median"]
+            t_new = timing["median"]
+            ratio = t_new / t_old if t_old else float("inf")
+            key = f"{case['name']}/{name}"
+            flag = ""
+            if ratio > threshold:
+                slower.append(key)
+                flag = " !"
+            print(f"{key:<36}{t_old:>10.4f}{t_new:>10.4f}{ratio:>8.2f}{flag}")
+    return slower
@@ -0,0 +1,73 @@
+"""Per-stage checkpoints of a fit.
+
+A checkpoint is a JSON file, replaced atomically after every completed
+``param_order`` stage, with
+
+    file          the data file
+    data          size and mtime of the data file when it was fitted
+    stage         index of the last completed stage
+    stages        number of stages of the param_order
+    done          True once the last stage is completed
+    values        values of all variables by name
+    free          names of the free variables after the stage
+    recipe        phases, equation, param_order and constraints of the
+                  recipe the checkpoint belongs to
+
+A checkpoint is only used to resume a recipe with the same "recipe" entry,
+and a data file that was not rewritten since.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import typing
+from pathlib import Path
+
+
+def checkpoint_path(directory: str, file: str) -> Path:
+    """Checkpoint of the data file in directory.
+
+    The name is the stem of the file and a hash of its absolute path, so
+    files with the same name in different directories do not collide.
+    """
+    file = Path(file).expanduser().resolve()
+    digest = hashlib.sha1(str(file).encode()).hexdigest()[:8]
+    return Path(directory).expanduser().joinpath(f"{file.stem}-{digest}.json")
+
+
+def data_signature(file: str) -> dict:
+    """Size and mtime of the data file, which change when it is rewritten."""
+    stat = Path(file).expanduser().stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_checkpoint(path: str, checkpoint: dict) -> None:
+    """Write checkpoint to path, atomically.
+
+    The JSON is written to a temporary file in the same directory and
+    moved over path, so path holds either the old or the new checkpoint
+    if the process is killed.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(checkpoint, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def read_checkpoint(path: str) -> typing.Optional[dict]:
+    """The checkpoint at path, None if there is none."""
+    try:
+        return json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return None
+
@@ -0,0 +1,348 @@
+"""Command line driver for batches of fits.
+
+    python -m ezfit fit --config FitPDF_config.toml \\
+        --phases CeO2:bulkCF:CeO2 data/*.gr --jobs 16 --threads 2
+    python -m ezfit screen --config FitPDF_config.toml sample.gr \\
+        --max-phases 2 --jobs 16
+    python -m ezfit fit --config FitPDF_config.toml --phases CeO2 \\
+        data/*.gr --serve 0.0.0.0:5000
+    python -m ezfit worker node0:5000 --threads 4
+
+fit appends every successful fit to a ResultsStore (default
+``<files.out>/store`` of the config). Files that are already in the store
+are skipped, so an interrupted batch continues where it stopped when the
+same command is run again; with ``checkpoint = true`` in ``[Fit]`` an
+interrupted fit also continues after its last completed stage. --restart
+moves the store aside and fits everything into a new one. screen ranks
+phase combinations, see screening.screen. fit --serve hands the fits out
+to the workers that connect to it, see distributed.py.
+"""
+import argparse
+import csv
+import sys
+import typing
+from pathlib import Path
+from .contribution import Contribution
+from . import distributed
+from .ezfit import FitPDF, load_config
+from .results_store import ResultsStore
+from .screening import screen as screen_phases
+
+
+def parse_phase(spec: str) -> Contribution:
+    """Contribution from "cif[:cf[:formula[:name]]]", e.g. "CeO2:bulkCF:CeO2".
+
+    The characteristic function defaults to bulkCF and the formula to the
+    CIF name.
+    """
+    parts = spec.split(":")
+    if not 1 <= len(parts) <= 4 or not parts[0]:
+        raise argparse.ArgumentTypeError(
+            f"phase {spec} is not cif[:cf[:formula[:name]]]"
+        )
+    cif_name = parts[0]
+    cf_name = parts[1] if len(parts) > 1 and parts[1] else "bulkCF"
+    formula = parts[2] if len(parts) > 2 and parts[2] else cif_name
+    name = parts[3] if len(parts) > 3 and parts[3] else None
+    return Contribution(
+        cif_name=cif_name, cf_name=cf_name, formula=formula, name=name
+    )
+
+
+def parse_phases(specs: str) -> typing.List[Contribution]:
+    """Comma separated phases, see parse_phase."""
+    return [parse_phase(spec) for spec in specs.split(",") if spec]
+
+
+def _progress(total: int) -> typing.Callable[[dict], None]:
+    done = 0
+
+    def report(result: dict) -> None:
+        nonlocal done
+        done += 1
+        if result["error"]:
+            status = "failed"
+        else:
+            status = f"Rw = {result['rw']:.4f}"
+        print(f"[{done}/{total}] {Path(result['file']).name}: {status}",
+              flush=True)
+    return report
+
+
+def summary_rows(
+        results: typing.List[dict],
+        phases: typing.List[str]
+) -> typing.List[dict]:
+    rows = []
+    for result in results:
+        row = {"file": result["file"], "rw": None, "error": None}
+        if result["error"]:
+            row["error"] = result["error"].strip().splitlines()[-1]
+        else:
+            row["rw"] = result["rw"]
+            for key in ("mol_scale", "wt_scale"):
+                scales = result.get(key) or {}
+                for phase in phases:
+                    row[f"{phase}_{key}"] = scales.get(phase)
+        rows.append(row)
+    return rows
+
+
+def print_summary(rows: typing.List[dict], phases: typing.List[str]) -> None:
+    columns = [f"{phase}_wt_scale" for phase in phases]
+    width = max([len(Path(row["file"]).name) for row in rows] + [4])
+    print(f"{'file':<{width}}  {'Rw':>8}" + "".join(
+        f"  {c:>{max(len(c), 8)}}" for c in columns
+    ))
+    for row in rows:
+        line = f"{Path(row['file']).name:<{width}}  "
+        if row["error"]:
+            print(line + f"failed: {row['error']}")
+            continue
+        line += f"{row['rw']:>8.4f}"
+        for c in columns:
+            value = row.get(c)
+            text = "-" if value is None else f"{value:.4f}"
+            line += f"  {text:>{max(len(c), 8)}}"
+        print(line)
+
+
+def write_summary(path: str, rows: typing.List[dict]) -> None:
+    fields = []
+    for row in rows:
+        fields.extend(k for k in row if k not in fields)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _retire_store(store: str) -> None:
+    """Move an existing store aside to <store>.<n>, keeping its fits."""
+    path = Path(store).expanduser()
+    if not path.is_dir() or not any(path.iterdir()):
+        return
+    n = 1
+    while path.with_name(f"{path.name}.{n}").exists():
+        n += 1
+    path.rename(path.with_name(f"{path.name}.{n}"))
+    print(f"moved {path} to {path.name}.{n}, starting a new store")
+
+
+def fit(args: argparse.Namespace) -> int:
+    config_location = ""
+    if args.config:
+        config_location = str(Path(args.config).expanduser().resolve())
+    config = load_config(config_location)
+    store = args.store or str(Path(config["files"]["out"]).joinpath("store"))
+
+    files = [str(Path(f).resolve()) for f in args.files]
+    # a resumed series needs the refined values of the stored frames, which
+    # fit_sequential takes from their checkpoints
+    checkpoints = config.get("Fit", {}).get("checkpoint", False)
+    if args.restart:
+        _retire_store(store)
+    elif not (args.sequential and checkpoints):
+        stored = set(ResultsStore(store).files)
+        skipped = [f for f in files if f in stored]
+        files = [f for f in files if f not in stored]
+        if skipped:
+            print(f"{len(skipped)} files already in {store}, skipped")
+    if not files:
+        print("nothing to fit")
+        return 0
+
+    report = _progress(len(files))
+    if args.serve:
+        results = distributed.serve(
+            files, args.phases, config_location,
+            address=distributed.parse_address(args.serve), store=store,
+            threads=args.threads, timeout=args.timeout, on_result=report,
+            on_listen=_print_listen, resume=not args.restart
+        )
+    elif args.sequential:
+        results = FitPDF.fit_sequential(
+            files, args.phases, config_location, store=store,
+            threads=args.threads, on_result=report, resume=not args.restart
+        )
+    else:
+        results = FitPDF.fit_many(
+            files, args.phases, config_location, jobs=args.jobs, store=store,
+            threads=args.threads, on_result=report, resume=not args.restart
+        )
+
+    phases = next(
+        (list(r["wt_scale"]) for r in results if r.get("wt_scale")), []
+    )
+    rows = summary_rows(results, phases)
+    print_summary(rows, phases)
+    if args.summary:
+        write_summary(args.summary, rows)
+    failed = sum(1 for result in results if result["error"])
+    if failed:
+        print(f"{failed} of {len(results)} fits failed")
+    return 1 if failed else 0
+
+
+def screen(args: argparse.Namespace) -> int:
+    rows = screen_phases(
+        args.file,
+        candidates=args.candidates,
+        config_location=args.config or "",
+        max_phases=args.max_phases,
+        cf_name=args.cf,
+        jobs=args.jobs,
+        threads=args.threads,
+        quick_rmax=args.quick_rmax,
+        prune=args.prune,
+        keep=args.keep,
+        top=args.top,
+    )
+    width = max([len(" + ".join(row["phases"])) for row in rows] + [6])
+    print(f"{'phases':<{width}}  {'quick Rw':>8}  {'Rw':>8}")
+    for row in rows:
+        line = f"{' + '.join(row['phases']):<{width}}  "
+        for key in ("quick_rw", "rw"):
+            line += "       -  " if row[key] is None else f"{row[key]:>8.4f}  "
+        if row["error"]:
+            line += f"failed: {row['error'].strip().splitlines()[-1]}"
+        print(line.rstrip())
+    if args.summary:
+        write_summary(args.summary, [
+            {**row, "phases": " + ".join(row["phases"]),
+             "error": row["error"] and row["error"].strip().splitlines()[-1]}
+            for row in rows
+        ])
+    return 0 if any(row["rw"] is not None for row in rows) else 1
+
+
+def _print_listen(address: distributed.Address, authkey: bytes) -> None:
+    print("waiting for workers on {}:{}".format(*address))
+    if distributed.default_authkey() is None:
+        print(f"start them with EZFIT_AUTHKEY={authkey.decode()}")
+    sys.stdout.flush()
+
+
+def worker(args: argparse.Namespace) -> int:
+    if distributed.default_authkey() is None:
+        print("set EZFIT_AUTHKEY to the key of the coordinator")
+        return 1
+    done = distributed.work(
+        distributed.parse_address(args.address), heartbeat=args.heartbeat,
+        threads=args.threads
+    )
+    print(f"{done} fits done")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="ezfit", description=__doc__.splitlines()[0]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser(
+        "fit", help="fit many data files with the same phases"
+    )
+    p.add_argument("files", nargs="+", help="data files (.gr)")
+    p.add_argument(
+        "--config", help="config TOML, default the first *.toml in the cwd"
+    )
+    p.add_argument(
+        "--phases", action="extend", type=parse_phases, required=True,
+        metavar="CIF[:CF[:FORMULA[:NAME]]],...",
+        help="phases of the fit, comma separated or repeated, e.g. "
+        "CeO2:bulkCF:CeO2,Ni:sphericalCF:Ni"
+    )
+    p.add_argument(
+        "--jobs", type=int, default=None,
+        help="fits running in parallel, default the number of cores"
+    )
+    p.add_argument(
+        "--threads", type=int, default=None,
+        help="PDF calculator workers per fit, overrides [Calculator] parallel"
+    )
+    p.add_argument(
+        "--sequential", action="store_true",
+        help="refine the files in order, each starting from the previous one"
+    )
+    p.add_argument(
+        "--store", help="ResultsStore directory, default <files.out>/store"
+    )
+    p.add_argument(
+        "--restart", action="store_true",
+        help="fit all files again, even those already in the store or "
+        "checkpointed, into a new store; an existing store is moved to "
+        "<store>.1, <store>.2, ..."
+    )
+    p.add_argument(
+        "--serve", metavar="HOST:PORT",
+        help="hand the fits out to ezfit workers connecting to HOST:PORT "
+        "instead of fitting them here"
+    )
+    p.add_argument(
+        "--timeout", type=float, default=60.,
+        help="with --serve, seconds without heartbeat after which a "
+        "worker's fit is handed to another worker"
+    )
+    p.add_argument("--summary", help="write the summary table as CSV")
+    p.set_defaults(func=fit)
+
+    p = commands.add_parser(
+        "worker", help="fit the files of a fit --serve coordinator"
+    )
+    p.add_argument("address", metavar="HOST:PORT")
+    p.add_argument(
+        "--threads", type=int, default=None,
+        help="PDF calculator workers, overrides [Calculator] parallel"
+    )
+    p.add_argument(
+        "--heartbeat", type=float, default=5.,
+        help="seconds between heartbeats, well below the --timeout of serve"
+    )
+    p.set_defaults(func=worker)
+
+    p = commands.add_parser(
+        "screen", help="rank combinations of candidate phases for one file"
+    )
+    p.add_argument("file", help="data file (.gr)")
+    p.add_argument(
+        "--config", help="config TOML, default the first *.toml in the cwd"
+    )
+    p.add_argument(
+        "--candidates", nargs="+",
+        help="CIF names in files.cifs, default all of them"
+    )
+    p.add_argument("--max-phases", type=int, default=2)
+    p.add_argument(
+        "--cf", default="bulkCF", help="characteristic function of all phases"
+    )
+    p.add_argument("--jobs", type=int, default=None)
+    p.add_argument("--threads", type=int, default=1)
+    p.add_argument(
+        "--quick-rmax", type=float, default=20.,
+        help="rmax of the first pass"
+    )
+    p.add_argument(
+        "--prune", type=float, default=1.5,
+        help="drop candidates with Rw above prune times the best one"
+    )
+    p.add_argument(
+        "--keep", type=int, default=8,
+        help="candidates kept for the combinations"
+    )
+    p.add_argument(
+        "--top", type=int, default=5,
+        help="combinations refined with the full param_order"
+    )
+    p.add_argument("--summary", help="write the ranking as CSV")
+    p.set_defaults(func=screen)
+    return parser
+
+
+def main(argv: typing.List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import typing
+from pathlib import Path
+
+if typing.TYPE_CHECKING:
+    from pyobjcryst.crystal import Crystal
+
+
+# (path, mtime_ns, size) -> content hash, so unchanged files are not rehashed
+_hashes: typing.Dict[tuple, str] = {}
+# (path, mtime_ns, content hash) -> ObjCryst XML of the parsed structure
+_structures: typing.Dict[tuple, str] = {}
+
+
+def _cache_key(cif_file: str) -> tuple:
+    path = Path(cif_file).expanduser().resolve()
+    stat = path.stat()
+    stat_key = (str(path), stat.st_mtime_ns, stat.st_size)
+    digest = _hashes.get(stat_key)
+    if digest is None:
+        # the file is new or was rewritten, forget its older versions
+        _forget(str(path))
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        _hashes[stat_key] = digest
+    return str(path), stat.st_mtime_ns, digest
+
+
+def _forget(path: str) -> None:
+    """Drop the in-process entries of every version of the file at path."""
+    for cache in (_hashes, _structures):
+        for key in [key for key in cache if key[0] == path]:
+            del cache[key]
+
+
+def _disk_path(key: tuple, cache_dir: str) -> Path:
+    name = hashlib.sha256("|".join(map(str, key)).encode()).hexdigest()
+    return Path(cache_dir).expanduser().joinpath(f"{name}.xml")
+
+
+def _read_disk(key: tuple, cache_dir: str) -> typing.Optional[str]:
+    path = _disk_path(key, cache_dir)
+    if not path.is_file():
+        return None
+    return path.read_text()
+
+
+def _write_disk(key: tuple, cache_dir: str, xml: str) -> None:
+    path = _disk_path(key, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(xml)
+    os.replace(tmp, path)
+
+
+def _from_xml(xml: str) -> "Crystal":
+    from pyobjcryst.crystal import Crystal
+    crystal = Crystal()
+    crystal.XMLInput(xml)
+    return crystal
+
+
+def load_crystal(cif_file: str, cache_dir: str = None) -> "Crystal":
+    """Load a Crystal from a CIF file through the structure cache.
+
+    Parameters
+    ----------
+    cif_file :
+        Path of the CIF file.
+    cache_dir :
+        Directory of the on-disk cache. If None, only the in-process cache
+        is used.
+
+    Returns
+    -------
+    A new Crystal object, rebuilt from the cached ObjCryst XML. Every call
+    returns an independent copy, so refining one structure never changes
+    another one loaded from the same file.
+    """
+    key = _cache_key(cif_file)
+    xml = _structures.get(key)
+    if xml is None and cache_dir:
+        xml = _read_disk(key, cache_dir)
+    if xml is None:
+        from pyobjcryst import loadCrystal
+        xml = loadCrystal(str(cif_file)).xml()
+        if cache_dir:
+            _write_disk(key, cache_dir, xml)
+    _structures[key] = xml
+    return _from_xml(xml)
+
+
+def clear_cache() -> None:
+    """Drop the in-process cache. The on-disk cache is left untouched."""
+    _hashes.clear()
+    _structures.clear()
@@ -1,4 +1,10 @@
+import atexit
+import functools
+import inspect
+import multiprocessing
+import os
 import typing
+from collections import OrderedDict
 from typing import Tuple
 from pathlib import Path
 import numpy as np
@@ -6,37 +12,234 @@ from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
 from diffpy.srfit.fitbase.parameterset import ParameterSet
 from diffpy.srfit.pdf import PDFGenerator, PDFParser
 from diffpy.srfit.fitbase import FitResults
-from ezpdf import get_gr
-from pyobjcryst import loadCrystal
-from pyobjcryst.crystal import Crystal
-from scipy.optimize import least_squares
+from .crystal_cache import load_crystal
+from .ezconstraints import RestraintArray
+from .profiling import FitProfile
+
+if typing.TYPE_CHECKING:
+    from pyobjcryst.crystal import Crystal
+
+
+# worker pools shared by the PDFGenerators of all recipes in this process,
+# by size. A pool is never replaced: generators of earlier recipes may
+# still use it.
+_pools: typing.Dict[int, "multiprocessing.pool.Pool"] = {}
+
+
+def _shared_pool(ncpu: int) -> "multiprocessing.pool.Pool":
+    pool = _pools.get(ncpu)
+    if pool is None:
+        if not _pools:
+            atexit.register(_close_pools)
+        pool = _pools[ncpu] = multiprocessing.Pool(ncpu)
+    return pool
+
+
+def _close_pools() -> None:
+    for pool in _pools.values():
+        pool.terminate()
+    _pools.clear()
+
+
+def _available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def calculator_workers(
+        parallel: typing.Union[int, str] = 32,
+        concurrent_fits: int = 1
+) -> int:
+    """Number of worker processes for the PDF calculation.
+
+    parallel is either a number of workers or "auto". In auto mode the
+    available cores are split between the fits running at the same time.
+    The phases do not count against the cores, because all PDFGenerators
+    of a process share one pool and are evaluated one after another.
+    """
+    if parallel == "auto":
+        return max(1, _available_cpus() // max(1, concurrent_fits))
+    return int(parallel)
+
+
+class CachedPDFGenerator(PDFGenerator):
+    """PDFGenerator that skips the PDF calculation if only scale changed.
+
+    srreal applies the scale factor to the finished PDF, so the PDF is
+    calculated at unit scale and kept together with the values of every
+    structural parameter (lattice, xyz, ADPs, occupancies) and of delta1,
+    delta2, qdamp, qbroad, qmin and qmax. As long as those do not change,
+    a call only multiplies the kept PDF by the current scale.
+    """
+
+    _cache_key = None
+    _cache_y = None
+
+    def _serial_calc(self):
+        return getattr(self._calc, "pqobj", self._calc)
+
+    def _structure_key(self) -> tuple:
+        calc = self._serial_calc()
+        return tuple(par.value for par in self._phase.iterPars()) + tuple(
+            getattr(calc, name)
+            for name in ("delta1", "delta2", "qdamp", "qbroad", "qmin", "qmax")
+        )
+
+    def clear_cache(self) -> None:
+        self._cache_key = None
+        self._cache_y = None
+
+    def processMetaData(self):
+        self.clear_cache()
+        PDFGenerator.processMetaData(self)
+
+    def __call__(self, r):
+        if not np.array_equal(r, self._lastr):
+            self.clear_cache()
+        key = self._structure_key()
+        if key != self._cache_key:
+            calc = self._serial_calc()
+            scale = calc.scale
+            calc.scale = 1.
+            try:
+                y = PDFGenerator.__call__(self, r)
+            finally:
+                calc.scale = scale
+            self._cache_key = key
+            self._cache_y = y
+        return self._serial_calc().scale * self._cache_y
+
+
+class CachedFunction:
+    """LRU cache around a function registered in a FitContribution.
+
+    srfit re-evaluates a registered function whenever one of its arguments
+    changed since the last call, so e.g. the characteristic functions are
+    recalculated after every finite-difference step of their size
+    parameters. This keeps the last maxsize results, keyed by the argument
+    values and, for array arguments such as r, by the grid. A grid is
+    identified by its content, which is only hashed again when it differs
+    from the last grid.
+    """
+
+    def __init__(self, f: typing.Callable, maxsize: int = 8):
+        self.f = f
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._grid = None
+        self._grid_key = None
+
+    def _key(self, arg) -> typing.Hashable:
+        if isinstance(arg, np.ndarray) and arg.ndim:
+            if self._grid is None or not np.array_equal(arg, self._grid):
+                self._grid = arg.copy()
+                self._grid_key = (arg.shape, hash(arg.tobytes()))
+            return self._grid_key
+        return float(arg)
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+        self._grid = None
+        self._grid_key = None
+
+    def __call__(self, *args):
+        key = tuple(self._key(arg) for arg in args)
+        y = self._cache.get(key)
+        if y is not None:
+            self._cache.move_to_end(key)
+            return y
+        y = self.f(*args)
+        if isinstance(y, np.ndarray):
+            y.setflags(write=False)
+        self._cache[key] = y
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return y
+
+
+class ArrayRestraintRecipe(FitRecipe):
+    """FitRecipe with a RestraintArray for restraints added in bulk.
+
+    The residual is that of FitRecipe, with the entries of restraint_array
+    appended as one array instead of one element per Restraint object.
+    Use ArrayFitResults for its results.
+    """
+
+    def __init__(self, name: str = "fit"):
+        FitRecipe.__init__(self, name)
+        self.restraint_array = RestraintArray()
+
+    def residual(self, p=[]):
+        chiv = FitRecipe.residual(self, p)
+        return np.concatenate([chiv, self.restraint_array.residual()])
+
+
+class ArrayFitResults(FitResults):
+    """FitResults that also account for the restraint array of a recipe.
+
+    Every entry of the array adds its penalty and counts as one point for
+    rchi2, like one srfit Restraint. Recipes without one get plain
+    FitResults.
+    """
+
+    def update(self):
+        FitResults.update(self)
+        array = getattr(self.recipe, "restraint_array", None)
+        if array is not None and self.recipe._contributions:
+            self.penalty += array.penalty()
+
+    def _calculateMetrics(self):
+        FitResults._calculateMetrics(self)
+        n = len(getattr(self.recipe, "restraint_array", ()))
+        if n:
+            numpoints = (
+                sum(len(con.x) for con in self.conresults.values())
+                + len(self.recipe._restraintlist)
+                + n
+            )
+            self.rchi2 = self.chi2 / (numpoints - len(self.varnames))
 
 
 def _create_recipe(
         equation: str,
-        crystals: typing.Dict[str, Crystal],
+        crystals: typing.Dict[str, "Crystal"],
         functions: typing.Dict[
                 str, typing.Tuple[typing.Callable, typing.List[str]]
             ],
         profile: Profile,
-        fc_name: str = "PDF"
+        fc_name: str = "PDF",
+        calculator: typing.Dict[str, typing.Union[str, int]] = None,
+        concurrent_fits: int = 1
 ) -> Tuple[FitRecipe, PDFGenerator]:
+    if calculator is None:
+        calculator = {}
+    ncpu = calculator_workers(
+        calculator.get("parallel", 32), concurrent_fits
+    )
+    evaluator = calculator.get("evaluator")
+    generator = (
+        CachedPDFGenerator if calculator.get("cache", True) else PDFGenerator
+    )
     pgs = {}
-    fr = FitRecipe()
+    fr = ArrayRestraintRecipe()
     fc = FitContribution(fc_name)
     for name, crystal in crystals.items():
-        pg = PDFGenerator(name)
+        pg = generator(name)
         pg.setStructure(crystal, periodic=True)
-        pg.parallel(32)
+        if evaluator:
+            pg._calc.evaluatortype = evaluator
+        if ncpu > 1:
+            pg.parallel(ncpu, mapfunc=_shared_pool(ncpu).imap_unordered)
         pg.scatteringfactortable = "neutron"
-        #pg._calc.evaluatortype = 'OPTIMIZED'
-        #pg._calc.evaluatortype = 'BASIC'
         fc.addProfileGenerator(pg)
 
         pgs[name] = pg
 
     if functions:
         for name, (f, argnames) in functions.items():
+            if calculator.get("cache", True):
+                f = CachedFunction(f, calculator.get("function_cache", 8))
             fc.registerFunction(f, name=name, argnames=argnames)
     fc.setEquation(equation)
     fc.setProfile(profile, xname="r", yname="G", dyname="dG")
@@ -157,15 +360,25 @@ def _initialize_recipe(
         functions: typing.Dict[
                 str, typing.Tuple[typing.Callable, typing.List[str]]
             ],
-        crystals: typing.Dict[str, Crystal],
+        crystals: typing.Dict[str, "Crystal"],
         fc_name: str = "PDF",
-        meta_data=None
+        meta_data=None,
+        function_phases: typing.Dict[str, str] = None
 ) -> None:
 
     fc: FitContribution = getattr(recipe, fc_name)
+    if function_phases is None:
+        function_phases = {}
     if functions:
-        for (name, (_, argnames)), penisname in zip(functions.items(), crystals.keys()):
-            _add_params_in_fc(recipe, fc, argnames[1:], tags=[name, "cfs", penisname])
+        for name, (_, argnames) in functions.items():
+            # not every phase has a function (bulkCF is left out of the
+            # equation), so the phase of each one is given explicitly
+            if function_phases.get(name) not in crystals:
+                raise ValueError(f"no phase for function {name}")
+            _add_params_in_fc(
+                recipe, fc, argnames[1:],
+                tags=[name, "cfs", function_phases[name]]
+            )
     for name in crystals.keys():
         pg: PDFGenerator = getattr(fc, name)
         _add_params_in_pg(recipe, pg, meta_data)
@@ -173,6 +386,42 @@ def _initialize_recipe(
     return
 
 
+def _load_profile(
+        profile: Profile,
+        data_file: str,
+        meta_data: typing.Dict[str, typing.Union[str, int, float]]
+) -> None:
+    pp = PDFParser()
+    pp.parseFile(data_file)
+    profile.loadParsedData(pp)
+    profile.meta.update(meta_data)
+    return
+
+
+def swap_profile(
+        recipe: FitRecipe,
+        data_file: str,
+        meta_data: typing.Dict[str, typing.Union[str, int, float]] = None,
+        fc_name: str = "PDF"
+) -> None:
+    """Load a new data file into the Profile of an existing recipe.
+
+    The Profile object is reused, so the generators, registered functions,
+    variables, constraints and restraints of the recipe stay in place. The
+    metadata of the new file is passed on to the PDFGenerators the same way
+    a freshly built recipe would receive it.
+    """
+    if meta_data is None:
+        meta_data = {}
+    fc: FitContribution = getattr(recipe, fc_name)
+    profile: Profile = fc.profile
+    _load_profile(profile, data_file, meta_data)
+    for pg in fc._generators.values():
+        pg.meta.update(profile.meta)
+        pg.processMetaData()
+    return
+
+
 def create_recipe_from_files(
         equation: str,
         cif_files: typing.Dict[str, str],
@@ -181,22 +430,27 @@ def create_recipe_from_files(
                 str, typing.Tuple[typing.Callable, typing.List[str]]
             ] = {},
         meta_data: typing.Dict[str, typing.Union[str, int, float]] = None,
-        fc_name: str = "PDF"
+        fc_name: str = "PDF",
+        cache_dir: str = None,
+        calculator: typing.Dict[str, typing.Union[str, int]] = None,
+        concurrent_fits: int = 1,
+        function_phases: typing.Dict[str, str] = None
 ) -> typing.Tuple[FitRecipe, typing.Dict[str, PDFGenerator]]:
 
     if meta_data is None:
         meta_data = {}
-    crystals = {n: loadCrystal(f) for n, f in cif_files.items()}
-    pp = PDFParser()
-    pp.parseFile(data_file)
+    crystals = {
+        n: load_crystal(f, cache_dir=cache_dir) for n, f in cif_files.items()
+    }
     profile = Profile()
-    profile.loadParsedData(pp)
-    profile.meta.update(meta_data)
+    _load_profile(profile, data_file, meta_data)
     recipe, pgs = _create_recipe(
-        equation, crystals, functions, profile, fc_name=fc_name
+        equation, crystals, functions, profile, fc_name=fc_name,
+        calculator=calculator, concurrent_fits=concurrent_fits
     )
     _initialize_recipe(
-        recipe, functions, crystals, fc_name=fc_name, meta_data=meta_data
+        recipe, functions, crystals, fc_name=fc_name, meta_data=meta_data,
+        function_phases=function_phases
     )
     return recipe, pgs
 
@@ -209,23 +463,87 @@ def optimize_params(
     rstep: float = None,
     print_step: bool = True,
     fc_name: str = "PDF",
+    start: int = 0,
+    jac_workers: int = 1,
+    profile: FitProfile = None,
+    rw_tol: float = None,
+    early_stop: bool = True,
+    free: typing.List[str] = None,
+    on_stage: typing.Callable[[int, dict], None] = None,
     **kwargs
-) -> None:
+) -> typing.List[dict]:
+    """Refine the recipe in stages.
+
+    Every entry of steps is a dict with the tags to "free" and "fix" in that
+    stage. An entry may also set its own "rmin", "rmax" and "rstep"; entries
+    without them use the rmin, rmax and rstep arguments. This allows the
+    early stages to run on a short or coarse grid. "ftol", "xtol", "gtol"
+    and "max_nfev" of an entry override the keyword arguments passed on to
+    least_squares for that stage.
+
+    rw_tol (or "rw_tol" of an entry) turns on convergence monitoring: a
+    stage is stopped after the first iteration that improves Rw by less
+    than rw_tol (relative), and skipped if a linearized step from the
+    current values would not improve Rw by rw_tol ("skip": false in an
+    entry disables that check). With early_stop=False stages run to their
+    least_squares tolerances and only report when they could have stopped.
+    Needs scipy >= 1.16 for stopping within a stage.
+
+    Stages before start are not run, but their free/fix is applied, unless
+    free, the names of the variables to free, is given instead.
+    on_stage(i, report) is called after every executed stage i.
+
+    If a FitProfile is given, the wall time, residual and Jacobian
+    evaluations, PDFGenerator timings and Rw trajectory of every executed
+    stage are recorded in it.
+
+    Returns a report of every executed stage: "stage" (1-based), "status"
+    ("skipped", "rw_tol" or the least_squares status), "iterations" (the
+    Jacobian evaluations), "nfev" and "saved", the iterations saved by
+    rw_tol, which is only known exactly with early_stop=False (None
+    otherwise, and with scipy < 1.16).
+    """
 
     n = len(steps)
+    if start < 0:
+        start += n
     free_steps = [order["free"] for order in steps]
     fix_steps = [order["fix"] for order in steps]
 
+    ranges = [
+        (
+            order.get("rmin", rmin),
+            order.get("rmax", rmax),
+            order.get("rstep", rstep)
+        )
+        for order in steps
+    ]
+
     fc: FitContribution = getattr(recipe, fc_name)
     p: Profile = fc.profile
-    p.setCalculationRange(xmin=rmin, xmax=rmax, dx=rstep)
-    for step in free_steps:
-        recipe.fix(*step)
+    reports = []
+    if free is None:
+        for step in free_steps:
+            recipe.fix(*step)
+    else:
+        recipe.fix("all")
+        if free:
+            recipe.free(*free)
+    if start >= n > 0:
+        # nothing left to refine, evaluate on the range of the last stage
+        xmin, xmax, dx = ranges[-1]
+        p.setCalculationRange(xmin=xmin, xmax=xmax, dx=dx)
     for i, (free_step, fix_step) in enumerate(zip(free_steps, fix_steps)):
+        if i < start and free is not None:
+            continue
         if free_step:
             recipe.free(*free_step)
         if fix_step:
             recipe.fix(*fix_step)
+        if i < start:
+            continue
+        xmin, xmax, dx = ranges[i]
+        p.setCalculationRange(xmin=xmin, xmax=xmax, dx=dx)
         if print_step:
             print(
                 "Step {} / {}: params {}".format(
@@ -233,12 +551,403 @@ def optimize_params(
                 ),
                 end="\r"
             )
-        least_squares(
-            recipe.residual,
-            recipe.getValues(),
-            bounds=recipe.getBounds2(),
-            **kwargs
+        stage_kwargs = dict(kwargs)
+        stage_kwargs.update(
+            {k: steps[i][k] for k in _STAGE_OPTIONS if k in steps[i]}
         )
+        tol = steps[i].get("rw_tol", rw_tol)
+        monitor = None
+        if tol is not None:
+            monitor = ConvergenceMonitor(p, tol, early_stop)
+            stage_kwargs["skip"] = steps[i].get("skip", True)
+        if profile is None:
+            res = _least_squares(
+                recipe, jac_workers, monitor=monitor, **stage_kwargs
+            )
+        else:
+            with profile.stage(recipe, i, ranges[i], fc_name) as stage:
+                res = _least_squares(
+                    recipe, jac_workers, profile=profile, stage=stage,
+                    fc_name=fc_name, monitor=monitor, **stage_kwargs
+                )
+                stage.status = "skipped" if res is None else int(res.status)
+        reports.append(_stage_report(i, res, monitor))
+        if print_step and monitor is not None:
+            print(_format_report(reports[-1], tol))
+        if on_stage is not None:
+            on_stage(i, reports[-1])
+    return reports
+
+
+# keys of a param_order entry passed on to least_squares
+_STAGE_OPTIONS = ("ftol", "xtol", "gtol", "max_nfev")
+
+
+class ConvergenceMonitor:
+    """least_squares callback that stops once Rw stops improving.
+
+    Rw is calculated from the data part of the residual of a single
+    contribution, like FitResults. The monitor stops the optimization
+    (raises StopIteration) after the first iteration that improves Rw by
+    less than tol, relative to the Rw before it, or only records that
+    iteration if stop is False.
+    """
+
+    def __init__(self, profile: Profile, tol: float, stop: bool = True):
+        self.tol = tol
+        self.stop = stop
+        self.npoints = len(profile.y)
+        yw = np.abs(profile.y) / profile.dy
+        self.yw2 = np.dot(yw, yw) or 1.
+        self.rw: typing.List[float] = []
+        self.iterations = 0
+        self.converged_at = None
+
+    def rw_of(self, f: np.ndarray) -> float:
+        chiv = f[:self.npoints]
+        return float(np.sqrt(np.dot(chiv, chiv) / self.yw2))
+
+    def wrap(self, fun: typing.Callable) -> typing.Callable:
+        """Record the Rw of the first evaluation, the starting point."""
+        def residual(x):
+            f = fun(x)
+            if not self.rw:
+                self.rw.append(self.rw_of(f))
+            return f
+        return residual
+
+    def satisfied(self, f: np.ndarray, jac: np.ndarray) -> bool:
+        """True if a Gauss-Newton step from f, jac improves Rw by < tol."""
+        step = np.linalg.lstsq(jac, -f, rcond=None)[0]
+        predicted = f + jac @ step
+        rw0 = self.rw_of(f)
+        return rw0 == 0 or (rw0 - self.rw_of(predicted)) / rw0 < self.tol
+
+    def __call__(self, intermediate_result) -> None:
+        self.iterations += 1
+        rw = self.rw_of(intermediate_result.fun)
+        previous = self.rw[-1] if self.rw else rw
+        self.rw.append(rw)
+        if self.converged_at is not None:
+            return
+        if previous == 0 or (previous - rw) / previous < self.tol:
+            self.converged_at = self.iterations
+            if self.stop:
+                raise StopIteration
+
+
+def _stage_report(i: int, res, monitor: ConvergenceMonitor = None) -> dict:
+    if res is None:
+        return {
+            "stage": i + 1, "status": "skipped", "iterations": 0, "nfev": 0,
+            "saved": None,
+        }
+    report = {
+        "stage": i + 1,
+        "status": int(res.status),
+        "iterations": int(res.njev or 0),
+        "nfev": int(res.nfev),
+        "saved": None,
+    }
+    # without the callback of least_squares the monitor sees no iterations
+    if monitor is not None and _has_callback():
+        if res.status == -2:
+            report["status"] = "rw_tol"
+        elif monitor.converged_at is not None:
+            report["saved"] = monitor.iterations - monitor.converged_at
+        else:
+            report["saved"] = 0
+    return report
+
+
+def _format_report(report: dict, tol: float) -> str:
+    text = f"Step {report['stage']}: "
+    if report["status"] == "skipped":
+        return text + f"skipped, Rw would improve by less than {tol:g}"
+    text += f"{report['iterations']} iterations, {report['nfev']} evaluations"
+    if report["status"] == "rw_tol":
+        return text + f", stopped at Rw improvement < {tol:g}"
+    if report["saved"]:
+        text += f", rw_tol {tol:g} would save {report['saved']} iterations"
+    return text
+
+
+def _least_squares(
+        recipe: FitRecipe,
+        jac_workers: int = 1,
+        profile: FitProfile = None,
+        stage=None,
+        fc_name: str = "PDF",
+        monitor: ConvergenceMonitor = None,
+        skip: bool = False,
+        **kwargs
+):
+    """Run least_squares on the free variables of recipe.
+
+    Returns the least_squares result, or None if the monitor found the
+    current values good enough to skip the stage.
+    """
+    from scipy.optimize import least_squares
+    bounds = recipe.getBounds2()
+    parallel = None
+    if jac_workers > 1 and _can_fork():
+        jac = parallel = ParallelJacobian(recipe, jac_workers, bounds)
+        fun = jac.residual
+    elif (profile is not None or skip) and _approx_derivative() is not None:
+        # scipy's own "2-point" Jacobian, but as a callable that can be timed
+        # and used to decide on skipping
+        jac = FiniteDifference(recipe, bounds, kwargs.get("diff_step"))
+        fun = jac.residual
+    else:
+        # without FiniteDifference the profile counts the Jacobian
+        # evaluations as residual calls and no stage is skipped
+        jac, fun = "2-point", recipe.residual
+    if profile is not None:
+        fun = profile.residual(stage, fun, getattr(recipe, fc_name).profile)
+        if callable(jac):
+            jac = profile.jacobian(stage, jac)
+    if monitor is not None:
+        fun = monitor.wrap(fun)
+        if _has_callback():
+            kwargs["callback"] = monitor
+    try:
+        x0 = recipe.getValues()
+        if (
+            skip and callable(jac) and len(x0)
+            and monitor.satisfied(fun(x0), jac(x0))
+        ):
+            return None
+        return least_squares(fun, x0, jac=jac, bounds=bounds, **kwargs)
+    finally:
+        if parallel is not None:
+            parallel.close()
+
+
+def _has_callback() -> bool:
+    """least_squares takes a callback since scipy 1.16."""
+    from scipy.optimize import least_squares
+    return "callback" in inspect.signature(least_squares).parameters
+
+
+@functools.lru_cache(maxsize=None)
+def _approx_derivative() -> typing.Optional[typing.Callable]:
+    """approx_derivative of scipy, None if it is not available.
+
+    It lives in the private scipy.optimize._numdiff, so it is only used if
+    it is found there with the arguments FiniteDifference passes.
+    """
+    try:
+        from scipy.optimize._numdiff import approx_derivative
+    except ImportError:
+        return None
+    parameters = inspect.signature(approx_derivative).parameters
+    if not {"method", "rel_step", "f0", "bounds"} <= set(parameters):
+        return None
+    return approx_derivative
+
+
+class FiniteDifference:
+    """The "2-point" Jacobian of least_squares as a callable.
+
+    Reuses the residual of the last evaluated point as scipy does, so
+    passing it as jac gives the same steps as jac="2-point". The Jacobian
+    of the last point is kept for one more call at the same point, so the
+    one calculated to decide on skipping a stage is not calculated again
+    by least_squares. Needs _approx_derivative().
+    """
+
+    def __init__(
+            self,
+            recipe: FitRecipe,
+            bounds: typing.Tuple[np.ndarray, np.ndarray],
+            diff_step: float = None
+    ):
+        self.recipe = recipe
+        self.bounds = bounds
+        self.diff_step = diff_step
+        self._x = None
+        self._f = None
+        self._jac = None
+
+    def residual(self, x: np.ndarray) -> np.ndarray:
+        f = self.recipe.residual(x)
+        self._x = np.array(x, copy=True)
+        self._f = f
+        return f
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        jac = _reuse_jacobian(self, x)
+        if jac is not None:
+            return jac
+        f0 = None
+        if self._x is not None and np.array_equal(x, self._x):
+            f0 = self._f
+        jac = _approx_derivative()(
+            self.recipe.residual, x, method="2-point",
+            rel_step=self.diff_step, f0=f0, bounds=self.bounds
+        )
+        self._jac = (np.array(x, copy=True), jac)
+        return jac
+
+
+def _reuse_jacobian(
+        jacobian: typing.Union["FiniteDifference", "ParallelJacobian"],
+        x: np.ndarray
+) -> typing.Optional[np.ndarray]:
+    """The kept Jacobian of jacobian if it was calculated at x, only once."""
+    kept, jacobian._jac = jacobian._jac, None
+    if kept is not None and np.array_equal(x, kept[0]):
+        return kept[1]
+    return None
+
+
+def _can_fork() -> bool:
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+# recipe replica of a Jacobian worker, inherited when the worker is forked
+_jac_recipe = None
+
+
+def _init_jac_worker() -> None:
+    global _pools
+    # the calculator pools belong to the parent process
+    _pools = {}
+    for fc in _jac_recipe._contributions.values():
+        for pg in fc._generators.values():
+            if hasattr(pg, "parallel"):
+                pg.parallel(1)
+
+
+def _jac_columns(
+        args: typing.Tuple[np.ndarray, np.ndarray, np.ndarray]
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    x, h, columns = args
+    res = []
+    for j in columns:
+        xj = x.copy()
+        xj[j] += h[j]
+        res.append(_jac_recipe.residual(xj))
+    return columns, np.array(res).T
+
+
+def _two_point_steps(
+        x: np.ndarray,
+        lb: np.ndarray,
+        ub: np.ndarray
+) -> np.ndarray:
+    """Forward-difference steps of scipy's "2-point" approx_derivative.
+
+    The relative step sqrt(eps) points away from zero (forward at 0) and
+    is reversed if it would leave the bounds, or shortened to the larger
+    distance to a bound if neither direction fits. The steps are
+    returned as the representable differences (x + h) - x, which the
+    Jacobian columns are divided by.
+    """
+    sign = np.where(x >= 0, 1., -1.)
+    h = np.finfo(float).eps**0.5 * sign * np.maximum(1., np.abs(x))
+    lower, upper = x - lb, ub - x
+    violated = (x + h < lb) | (x + h > ub)
+    fitting = np.abs(h) <= np.maximum(lower, upper)
+    h = np.where(violated & fitting, -h, h)
+    h = np.where(~fitting & (upper >= lower), upper, h)
+    h = np.where(~fitting & (upper < lower), -lower, h)
+    return (x + h) - x
+
+
+class ParallelJacobian:
+    """Forward-difference Jacobian of recipe.residual over worker processes.
+
+    The workers are forked when the object is created, so each one holds a
+    replica of the recipe with the current free/fixed state, constraints
+    and restraints. Create a new instance whenever that state changes, e.g.
+    once per refinement stage. The columns are split evenly between the
+    workers and the steps are those of scipy's "2-point" scheme with the
+    default relative step, see _two_point_steps. Like FiniteDifference,
+    the Jacobian of the last point is kept for one more call at the same
+    point.
+    """
+
+    def __init__(
+            self,
+            recipe: FitRecipe,
+            workers: int,
+            bounds: typing.Tuple[np.ndarray, np.ndarray] = None
+    ):
+        global _jac_recipe
+        self.recipe = recipe
+        self.workers = workers
+        if bounds is None:
+            bounds = recipe.getBounds2()
+        self.lb, self.ub = bounds
+        self._x = None
+        self._f = None
+        self._jac = None
+        _jac_recipe = recipe
+        try:
+            self.pool = multiprocessing.get_context("fork").Pool(
+                workers, initializer=_init_jac_worker
+            )
+        finally:
+            _jac_recipe = None
+
+    def residual(self, x: np.ndarray) -> np.ndarray:
+        f = self.recipe.residual(x)
+        self._x = np.array(x, copy=True)
+        self._f = f
+        return f
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        jac = _reuse_jacobian(self, x)
+        if jac is not None:
+            return jac
+        if self._x is not None and np.array_equal(x, self._x):
+            f0 = self._f
+        else:
+            f0 = self.residual(x)
+        h = _two_point_steps(x, self.lb, self.ub)
+        chunks = [
+            c for c in np.array_split(np.arange(len(x)), self.workers)
+            if len(c)
+        ]
+        jac = np.empty((len(f0), len(x)))
+        tasks = [(x, h, c) for c in chunks]
+        for columns, res in self.pool.imap_unordered(_jac_columns, tasks):
+            jac[:, columns] = (res - f0[:, None]) / h[columns]
+        self._jac = (np.array(x, copy=True), jac)
+        return jac
+
+    def close(self) -> None:
+        self.pool.terminate()
+        self.pool.join()
+
+
+def get_var_values(recipe: FitRecipe) -> typing.Dict[str, float]:
+    """Return the values of all variables, free and fixed, by name."""
+    return {name: par.value for name, par in recipe._parameters.items()}
+
+
+def get_constraints(recipe: FitRecipe) -> typing.List[typing.List[str]]:
+    """Return [name, equation] of every constraint of the recipe."""
+    return sorted(
+        [par.name, getattr(con, "eqstr", "")]
+        for par, con in recipe._constraints.items()
+    )
+
+
+def set_var_values(
+        recipe: FitRecipe,
+        values: typing.Dict[str, float]
+) -> None:
+    """Set the variables of the recipe that appear in values.
+
+    Works like initializeRecipe, but takes the values directly instead
+    of a results file, so no FitResults text has to be written or parsed.
+    """
+    for name in recipe._parameters.keys():
+        value = values.get(name)
+        if value is not None:
+            recipe.get(name).value = float(value)
     return
 
 
@@ -268,6 +977,7 @@ def save_results(
     -------
     None.
     """
+    from ezpdf import get_gr
     r, gobs, gcalc, gdiff, baseline, gr_composition = get_gr(recipe)
     phases = list(gr_composition.keys())
     header = ['r', 'g(r)', 'g(r)_calc', 'g(r)_diff', *phases]
@@ -276,7 +986,7 @@ def save_results(
     d_path = Path(directory)
     d_path.mkdir(parents=True, exist_ok=True)
     f_path = d_path.joinpath(file_stem)
-    fr = FitResults(recipe)
+    fr = ArrayFitResults(recipe)
     fr.saveResults(str(f_path.with_suffix(".res")), footer=f'{footer}')
     fc: FitContribution = getattr(recipe, fc_name)
     # profile: Profile = fc.profile
@@ -290,7 +1000,7 @@ def save_results(
     if pg_names is not None:
         for pg_name in pg_names:
             pg: PDFGenerator = getattr(fc, pg_name)
-            stru: Crystal = pg.stru
+            stru: "Crystal" = pg.stru
             cif_path = f_path.with_name(
                 "{}_{}".format(f_path.stem, pg_name)
             ).with_suffix(".cif")
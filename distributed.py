@@ -0,0 +1,308 @@
+"""Spread the fits of a campaign over several machines.
+
+    python -m ezfit fit --config FitPDF_config.toml --phases CeO2 \\
+        data/*.gr --serve 0.0.0.0:5000
+    python -m ezfit worker node0:5000 --threads 4   # on every node
+
+A Coordinator hands out (data file, contributions, config, resume) jobs
+over TCP to the workers that connect and collects their results as
+FitRecords. Data files, CIFs, checkpoints and the config must be readable
+by every worker under the same paths, e.g. on a shared filesystem. A
+worker that disconnects or stops sending heartbeats loses its job back to
+the queue.
+
+Messages are pickled, so coordinator and workers must share an authkey
+(the EZFIT_AUTHKEY environment variable) and should only be used on a
+trusted network. Without EZFIT_AUTHKEY the coordinator makes up a random
+key, which fit --serve prints for the workers.
+"""
+import collections
+import os
+import queue
+import secrets
+import threading
+import typing
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from .ezfit import _fit_file, _store_result, _stored_files
+from .fit_record import FitRecord
+
+Address = typing.Tuple[str, int]
+
+
+def default_authkey() -> typing.Optional[bytes]:
+    """The EZFIT_AUTHKEY environment variable, None if it is not set."""
+    key = os.environ.get("EZFIT_AUTHKEY")
+    return key.encode() if key else None
+
+
+def parse_address(address: str) -> Address:
+    """("host", port) from "host:port"."""
+    host, _, port = address.rpartition(":")
+    return host or "localhost", int(port)
+
+
+class Coordinator:
+    """Work queue of fit jobs served over TCP.
+
+    Every job is a (data file, contributions, config location, resume)
+    tuple, the arguments of FitPDF.fit_many for one file.
+    Workers get one job at a time. A worker that disconnects or sends
+    nothing for timeout seconds is lost; its job goes back to the front of
+    the queue, and fails after max_attempts lost workers. The results of
+    run() keep the order of the jobs: a FitRecord, or a dict with "file"
+    and "error" for failed fits. Without authkey and EZFIT_AUTHKEY a random
+    key is used; the workers need the key in authkey.
+    """
+
+    def __init__(
+            self,
+            jobs: typing.Sequence[tuple],
+            address: Address = ("localhost", 0),
+            authkey: bytes = None,
+            timeout: float = 60.,
+            max_attempts: int = 3,
+            curves: bool = False,
+            threads: int = None,
+    ):
+        self.jobs = list(jobs)
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.curves = curves
+        self.threads = threads
+        self.results: typing.List = [None] * len(self.jobs)
+        self.attempts = [0] * len(self.jobs)
+        self.authkey: bytes = (
+            authkey or default_authkey() or secrets.token_hex(16).encode()
+        )
+        self._pending = collections.deque(range(len(self.jobs)))
+        self._done = 0
+        self._closed = False
+        self._completed = queue.Queue()
+        self._cond = threading.Condition()
+        self._accepting: typing.Optional[threading.Thread] = None
+        self._listener = Listener(address, authkey=self.authkey)
+        self.address: Address = self._listener.address
+
+    def run(
+            self,
+            on_result: typing.Callable[[int, typing.Any], None] = None
+    ) -> typing.List:
+        """Serve the jobs until all are done.
+
+        on_result(i, result) is called as every job completes.
+        """
+        self._accepting = threading.Thread(target=self._accept, daemon=True)
+        self._accepting.start()
+        try:
+            for _ in range(len(self.jobs)):
+                i = self._completed.get()
+                if on_result is not None:
+                    on_result(i, self.results[i])
+        finally:
+            self.close()
+        return self.results
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._accepting is not None:
+            # wake up the accept thread
+            host, port = self.address
+            try:
+                Client(
+                    ("localhost" if host in ("", "0.0.0.0") else host, port),
+                    authkey=self.authkey
+                ).close()
+            except OSError:
+                pass
+        self._listener.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._closed:
+                    return
+                # e.g. a client with the wrong authkey
+                continue
+            if self._closed:
+                conn.close()
+                return
+            threading.Thread(
+                target=self._serve_worker, args=(conn,), daemon=True
+            ).start()
+
+    def _next_job(self) -> typing.Optional[int]:
+        with self._cond:
+            while True:
+                while self._pending:
+                    i = self._pending.popleft()
+                    if self.results[i] is None:
+                        self.attempts[i] += 1
+                        return i
+                if self._closed or self._done == len(self.jobs):
+                    return None
+                self._cond.wait()
+
+    def _finish(self, i: int, result) -> None:
+        with self._cond:
+            # a re-queued job can be finished twice, the first result wins
+            if self.results[i] is not None:
+                return
+            self.results[i] = result
+            self._done += 1
+            self._cond.notify_all()
+        self._completed.put(i)
+
+    def _requeue(self, i: int) -> None:
+        with self._cond:
+            if self.results[i] is not None:
+                return
+            if self.attempts[i] < self.max_attempts:
+                self._pending.appendleft(i)
+                self._cond.notify_all()
+                return
+        self._finish(i, {
+            "file": str(self.jobs[i][0]),
+            "error": f"lost {self.attempts[i]} workers while fitting",
+        })
+
+    def _serve_worker(self, conn) -> None:
+        job = None
+        try:
+            while True:
+                if not conn.poll(self.timeout):
+                    break
+                message = conn.recv()
+                if message[0] == "heartbeat":
+                    continue
+                if message[0] == "result" and message[1] == job:
+                    self._finish(job, message[2])
+                    job = None
+                job = self._next_job()
+                if job is None:
+                    conn.send(("stop",))
+                    break
+                conn.send(
+                    ("job", job, self.jobs[job], self.curves, self.threads)
+                )
+        except (EOFError, OSError):
+            pass
+        finally:
+            if job is not None:
+                self._requeue(job)
+            conn.close()
+
+
+def _run_job(file, contributions, config_location, resume, curves, threads):
+    summary = _fit_file(
+        file, contributions, config_location, curves=curves, threads=threads,
+        resume=resume
+    )
+    if summary["error"]:
+        return summary
+    return FitRecord.from_summary(summary)
+
+
+def work(
+        address: Address,
+        authkey: bytes = None,
+        heartbeat: float = 5.,
+        threads: int = None,
+) -> int:
+    """Fit jobs of the coordinator at address until it has none left.
+
+    threads overrides the calculator workers per fit of the coordinator
+    for this worker. A heartbeat is sent every heartbeat seconds, also
+    during a fit, so it has to be well below the timeout of the
+    coordinator. authkey defaults to EZFIT_AUTHKEY. Returns the number of
+    jobs done.
+    """
+    authkey = authkey or default_authkey()
+    if authkey is None:
+        raise ValueError("no authkey, set EZFIT_AUTHKEY")
+    conn = Client(address, authkey=authkey)
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(heartbeat):
+            with lock:
+                try:
+                    conn.send(("heartbeat",))
+                except OSError:
+                    return
+
+    threading.Thread(target=beat, daemon=True).start()
+    done = 0
+    message = ("ready",)
+    try:
+        while True:
+            with lock:
+                conn.send(message)
+            reply = conn.recv()
+            if reply[0] == "stop":
+                break
+            _, i, job, curves, job_threads = reply
+            result = _run_job(*job, curves, threads or job_threads)
+            message = ("result", i, result)
+            done += 1
+    except (EOFError, OSError):
+        # the coordinator is gone
+        pass
+    finally:
+        stop.set()
+        with lock:
+            conn.close()
+    return done
+
+
+def serve(
+        files: typing.List[str],
+        contributions: list,
+        config_location: str = "",
+        address: Address = ("localhost", 0),
+        authkey: bytes = None,
+        store: str = None,
+        threads: int = None,
+        timeout: float = 60.,
+        max_attempts: int = 3,
+        on_result: typing.Callable[[dict], None] = None,
+        on_listen: typing.Callable[[Address, bytes], None] = None,
+        resume: bool = False,
+) -> typing.List[dict]:
+    """Fit every file with the same contributions on remote workers.
+
+    Works like FitPDF.fit_many, but the fits run in the workers that
+    connect to address (see work), and returns the same result dicts.
+    on_listen is called with the address the coordinator listens on and
+    the authkey of the workers. resume works as in fit_many.
+    """
+    if config_location:
+        config_location = str(Path(config_location).expanduser().resolve())
+    coordinator = Coordinator(
+        [(str(f), contributions, config_location, resume) for f in files],
+        address=address, authkey=authkey, timeout=timeout,
+        max_attempts=max_attempts, curves=store is not None, threads=threads,
+    )
+    if on_listen is not None:
+        on_listen(coordinator.address, coordinator.authkey)
+    results = [None] * len(coordinator.jobs)
+    stored = _stored_files(store) if resume else set()
+
+    def collect(i, result):
+        if isinstance(result, FitRecord):
+            result = result.to_summary()
+        results[i] = result
+        if result["file"] not in stored:
+            _store_result(store, result)
+        if on_result is not None:
+            on_result(result)
+
+    coordinator.run(collect)
+    return results
@@ -1,6 +1,51 @@
 from collections import defaultdict
+import numpy as np
 
 
+class RestraintArray:
+    """Box restraints of many parameters, evaluated as one array.
+
+    The penalty of every entry is ((max(0, lb - val, val - ub)) / sig)**2,
+    the same as a srfit Restraint, but all entries are evaluated together
+    instead of through one Restraint and Equation per parameter. A recipe
+    that holds one (see diffpy_wrap.ArrayRestraintRecipe) appends the
+    square roots of the penalties to its residual, one element per entry,
+    and diffpy_wrap.ArrayFitResults reports them like srfit Restraints.
+    """
+
+    def __init__(self):
+        self.pars = []
+        self._lb = np.empty(0)
+        self._ub = np.empty(0)
+        self._sig = np.empty(0)
+
+    def __len__(self):
+        return len(self.pars)
+
+    def add(self, pars, lb=-np.inf, ub=np.inf, sig=1.):
+        """Restrain pars; lb, ub and sig are scalars or one per parameter."""
+        pars = list(pars)
+        n = len(pars)
+        self.pars.extend(pars)
+        self._lb = np.append(self._lb, np.broadcast_to(lb, n))
+        self._ub = np.append(self._ub, np.broadcast_to(ub, n))
+        self._sig = np.append(self._sig, np.broadcast_to(sig, n))
+
+    def residual(self) -> np.ndarray:
+        """Square root of the penalty of every entry."""
+        val = np.fromiter((par.value for par in self.pars), float, len(self))
+        return np.maximum(0., np.maximum(self._lb - val, val - self._ub)) \
+            / self._sig
+
+    def penalty(self) -> float:
+        """Total penalty, as reported by FitResults.
+
+        The entries are not scaled by the chi2 of the fit, like srfit
+        Restraints with scaled=False, so there is no weight to pass.
+        """
+        res = self.residual()
+        return float(np.dot(res, res))
+
 
 class Ezrestraint:
     def __init__(self, fit):
@@ -32,19 +77,25 @@ class Ezrestraint:
     def shared_occ(self, phase):
         pg = getattr(self.fc, phase)
         atoms = pg.phase.getScatterers()
+        recipe = self.recipe
         atom_xyz = {i: (i.x.value, i.y.value, i.z.value) for i in atoms}
-        for atom in atoms:
-            self.recipe.restrain(f"{phase}_{atom.name}_occ", lb=0.0, ub=1.0, sig=1e-3)
+        self._restrain(
+            [getattr(recipe, f"{phase}_{atom.name}_occ") for atom in atoms],
+            lb=0.0, ub=1.0, sig=1e-3
+        )
         duplicate_keys = Ezrestraint.find_duplicate_keys(atom_xyz)
         for _, shared_atoms in duplicate_keys:
-            occ_eq = []
-            for atom in shared_atoms:
-                occ_eq.append(f"{phase}_{atom.name}_occ")
-                self.recipe.restrain(f"{phase}_{atom.name}_occ", lb=0.0, ub=1.0, sig=1e-3)
-            occ_eq = " + ".join(occ_eq)
-            self.recipe.newVar(f"{phase}_{atom.name}_Occ_sum")
-            self.recipe.constrain(f"{phase}_{atom.name}_Occ_sum", f'{occ_eq}')
-            self.recipe.restrain(f"{phase}_{atom.name}_Occ_sum", lb=0.0, ub=1.0, sig=1e-3)
+            occ_names = [f"{phase}_{atom.name}_occ" for atom in shared_atoms]
+            self._restrain(
+                [getattr(recipe, name) for name in occ_names],
+                lb=0.0, ub=1.0, sig=1e-3
+            )
+            occ_sum = f"{phase}_{shared_atoms[-1].name}_Occ_sum"
+            recipe.newVar(occ_sum)
+            recipe.constrain(occ_sum, " + ".join(occ_names))
+            self._restrain(
+                [getattr(recipe, occ_sum)], lb=0.0, ub=1.0, sig=1e-3
+            )
 
     @staticmethod
     def find_duplicate_keys(dictionary):
@@ -60,6 +111,39 @@ class Ezrestraint:
 
         return duplicate_keys
 
+    def _tag_index(self):
+        """Variables of the recipe by tag (and by name), built once.
+
+        The index is rebuilt when the recipe or its number of variables
+        changed. Variables keep the order of the recipe.
+        """
+        recipe = self.recipe
+        key = (id(recipe), len(recipe._parameters))
+        if getattr(self, "_tag_index_key", None) != key:
+            order = {
+                id(par): i for i, par in enumerate(recipe._parameters.values())
+            }
+            self._tags = {
+                tag: sorted(
+                    (par for par in pars if id(par) in order),
+                    key=lambda par: order[id(par)]
+                )
+                for tag, pars in recipe._tagmanager._tagdict.items()
+            }
+            self._tag_index_key = key
+        return self._tags
+
+    def _restrain(self, pars, lb, ub, sig):
+        """Restrain pars in bulk if the recipe has a RestraintArray."""
+        array = getattr(self.recipe, "restraint_array", None)
+        if array is not None:
+            array.add(pars, lb, ub, sig)
+            return
+        lb = np.broadcast_to(lb, len(pars))
+        ub = np.broadcast_to(ub, len(pars))
+        for par, lbi, ubi in zip(pars, lb, ub):
+            self.recipe.restrain(par, lb=lbi, ub=ubi, sig=sig)
+
     def restrain_param(self, param, config):
         initial = None
         lr = None
@@ -74,15 +158,18 @@ class Ezrestraint:
                 lb, ub = lb_ub_ini
         else:
             lr = lb_ub_ini
-        recipe.fix("all")
-        recipe.free(param)
-        for param_name in recipe.getNames():
-            param = getattr(recipe, param_name)
-            if lr:
-                lb = param.value - lr
-                ub = param.value + lr
-            recipe.restrain(param, lb=lb, ub=ub, sig=1e-3)
-            if initial:
-                param.value = initial
+        tagged = self._tag_index().get(param)
+        if tagged is None:
+            raise ValueError(f"Variables or tags cannot be found ({param})")
+        # constrained variables are never free, so they are not restrained
+        pars = [par for par in tagged if not par.constrained]
+        if lr:
+            values = np.array([par.value for par in pars])
+            lb = values - lr
+            ub = values + lr
+        self._restrain(pars, lb=lb, ub=ub, sig=1e-3)
+        if initial:
+            for par in pars:
+                par.value = initial
         recipe.fix("all")
         return self
@@ -1,15 +1,30 @@
-import diffpy.srfit.pdf.characteristicfunctions as CF
-from diffpy.srfit.fitbase import FitResults, initializeRecipe
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+)
+from concurrent.futures.process import BrokenProcessPool
 from itertools import count
 from pathlib import Path
-from typing import List
-from . import diffpy_wrap as dw
+from typing import Callable, List, Optional, Tuple
+import multiprocessing
+import traceback
+import numpy as np
 from .contribution import Contribution
-import toml
+from .lazy import lazy_import
+from .results_store import ResultsStore
+from .fit_record import FitRecord
+from .checkpoint import (
+    checkpoint_path, data_signature, read_checkpoint, write_checkpoint
+)
+from .profiling import FitProfile, span
 from .get_scales import GetScales
 from .ezconstraints import Ezrestraint
 import os
 
+# diffpy.srfit, pyobjcryst, scipy.optimize and ezpdf are only loaded when
+# a recipe is built or a fit is run
+dw = lazy_import(".diffpy_wrap", __package__)
+
 
 def _phase_counter(self, phase):
     if not hasattr(self, f"{phase}_count"):
@@ -31,6 +46,7 @@ def _parse_phases(self, phases):
 
 
 def _fetch_function(phase, function):
+    import diffpy.srfit.pdf.characteristicfunctions as CF
     func_param = {
         "sphericalCF":
             (CF.sphericalCF, ["r", f"{phase}_psize"]),
@@ -47,7 +63,7 @@ def _fetch_function(phase, function):
         "shellCF2":
             (CF.shellCF, ["r", f"{phase}_a", f"{phase}_delta"]),
         "bulkCF":
-            (lambda r: 1, ["r"]),
+            (lambda r: np.broadcast_to(1., np.shape(r)), ["r"]),
     }
     return func_param[function]
 
@@ -64,7 +80,11 @@ def create_cif_files_string(phases, config):
 def create_equation_string(phases, nanoparticle_shapes):
     equation_list = []
     for phase, function in zip(phases, nanoparticle_shapes):
-        equation_list.append(f"{phase} * {phase}{function}")
+        if function == "bulkCF":
+            # constant 1, no need to evaluate and multiply it
+            equation_list.append(f"{phase}")
+        else:
+            equation_list.append(f"{phase} * {phase}{function}")
     equation = " + ".join(equation_list)
 
     return equation
@@ -72,11 +92,27 @@ def create_equation_string(phases, nanoparticle_shapes):
 
 def create_functions(phases, nanoparticle_shapes):
     functions = {}
+    function_phases = {}
     for phase, function in zip(phases, nanoparticle_shapes):
+        if function == "bulkCF":
+            continue
         function_definition = _fetch_function(phase, function)
         functions[f"{phase}{function}"] = function_definition
+        function_phases[f"{phase}{function}"] = phase
+
+    return functions, function_phases
+
 
-    return functions
+def load_config(config_location: str = "") -> dict:
+    if config_location:
+        config_path = Path(config_location).expanduser().resolve()
+    else:
+        cwd = Path().resolve()
+        print(cwd)
+        config_path = list(Path(cwd).glob("*.toml"))[0]
+    import toml
+    config: dict = toml.load(config_path)
+    return config
 
 
 class FitPDF(Ezrestraint, GetScales):
@@ -109,35 +145,66 @@ class FitPDF(Ezrestraint, GetScales):
             self.phases,
             self.nanoparticle_shapes
         )
-        self.functions = create_functions(
+        self.functions, self.function_phases = create_functions(
             self.phases,
             self.nanoparticle_shapes
         )
         self.dw = dw
+        self.concurrent_fits = 1
+        # timings of recipe building and fitting, see profiling.FitProfile
+        self.profile = None
+        if self.config.get("Fit", {}).get("profile", False):
+            self.profile = FitProfile()
+        # per-stage checkpoints, see checkpoint.py
+        self.checkpoint_dir = None
+        if self.config.get("Fit", {}).get("checkpoint", False):
+            self.checkpoint_dir = self.config["files"].get("checkpoints") or str(
+                Path(self.config["files"]["out"]).joinpath("checkpoints")
+            )
 
     def load_toml_config(self, config_location: str = ""):
-        if config_location:
-            config_path = Path(config_location).expanduser().resolve()
-        else:
-            cwd = Path().resolve()
-            print(cwd)
-            config_path = list(Path(cwd).glob("*.toml"))[0]
-        config: dict = toml.load(config_path)
-        return config
+        return load_config(config_location)
+
+    def set_threads(self, threads: int = None) -> None:
+        """Use threads calculator workers per fit instead of the config."""
+        if threads is not None:
+            self.config.setdefault("Calculator", {})["parallel"] = threads
 
     def update_recipe(self):
 
-        self.recipe, self.pgs = dw.create_recipe_from_files(
-            data_file=self.file,
-            meta_data=self.config["PDF"],
-            equation=self.equation,
-            cif_files=self.cif_files,
-            functions=self.functions,
-        )
+        with span(self.profile, "update_recipe"):
+            self.recipe, self.pgs = dw.create_recipe_from_files(
+                data_file=self.file,
+                meta_data=self.config["PDF"],
+                equation=self.equation,
+                cif_files=self.cif_files,
+                functions=self.functions,
+                function_phases=self.function_phases,
+                cache_dir=self.config["files"].get("cache"),
+                calculator=self.config.get("Calculator"),
+                concurrent_fits=self.concurrent_fits,
+            )
         if not self.config["PDF"]:
             self.add_instr_params()
 
         self.fc = self.recipe.PDF
+        self._restraints_applied = False
+        self._initial_values = None
+
+    def swap_data(self, file: str, reset: str = "initial"):
+        """Fit another data file with the recipe that is already built.
+
+        Only the observed profile is replaced. With ``reset="initial"`` the
+        variables go back to the values the first fit started from, with
+        ``reset="previous"`` they keep their current (refined) values.
+        """
+        if reset not in ("initial", "previous"):
+            raise ValueError(f"unknown reset mode {reset}")
+        self.file = file
+        with span(self.profile, "swap_data"):
+            dw.swap_profile(self.recipe, file, meta_data=self.config["PDF"])
+        if reset == "initial" and self._initial_values is not None:
+            self.LoadResFromValues(self._initial_values)
 
     def add_instr_params(self) -> None:
         print("attempting to fit instrumental parameters")
@@ -155,10 +222,14 @@ class FitPDF(Ezrestraint, GetScales):
         self.config["param_order"][-1]["free"].extend(["qdamp", "qbroad"])
 
     def apply_restraints(self):
-        for param in self.config["Restraints"].keys():
-            self.restrain_param(param, self.config)
-        for phase in self.phases:
-            self.shared_occ(phase)
+        if getattr(self, "_restraints_applied", False):
+            return
+        self._restraints_applied = True
+        with span(self.profile, "restraints"):
+            for param in self.config["Restraints"].keys():
+                self.restrain_param(param, self.config)
+            for phase in self.phases:
+                self.shared_occ(phase)
 
 
     def create_param_order(self):
@@ -175,7 +246,92 @@ class FitPDF(Ezrestraint, GetScales):
                 order["free"].extend(nCF)
                 
     def LoadResFromFile(self, path_to_results: str):
+        if str(path_to_results).endswith(".json"):
+            self.load_checkpoint(path_to_results)
+            return
+        from diffpy.srfit.fitbase import initializeRecipe
         initializeRecipe(self.recipe, path_to_results)
+
+    def LoadResFromValues(self, values: dict):
+        dw.set_var_values(self.recipe, values)
+
+    def get_values(self) -> dict:
+        return dw.get_var_values(self.recipe)
+
+    def checkpoint_file(self) -> Optional[Path]:
+        """Checkpoint of the current data file, None without checkpoints."""
+        if self.checkpoint_dir is None:
+            return None
+        return checkpoint_path(self.checkpoint_dir, self.file)
+
+    def _recipe_signature(self) -> dict:
+        import json
+        signature = {
+            "phases": self.phases,
+            "equation": self.equation,
+            "param_order": self.config["param_order"],
+            "constraints": dw.get_constraints(self.recipe),
+        }
+        # as it reads back from the checkpoint
+        return json.loads(json.dumps(signature))
+
+    def save_checkpoint(self, stage: int) -> None:
+        """Checkpoint the fit of the current file after stage."""
+        n = len(self.config["param_order"])
+        write_checkpoint(self.checkpoint_file(), {
+            "file": str(self.file),
+            "data": data_signature(self.file),
+            "stage": stage,
+            "stages": n,
+            "done": stage >= n - 1,
+            "values": self.get_values(),
+            "free": self.recipe.getNames(),
+            "recipe": self._recipe_signature(),
+        })
+
+    def load_checkpoint(self, path: str = None) -> Optional[dict]:
+        """Load the values of a checkpoint, default the current file's.
+
+        Restraints are applied first, as for a fit. Returns the checkpoint,
+        or None if there is none, it belongs to a different recipe or the
+        current data file was rewritten since it was checkpointed.
+        """
+        path = path or self.checkpoint_file()
+        if path is None:
+            return None
+        self.apply_restraints()
+        self.create_param_order()
+        checkpoint = read_checkpoint(path)
+        if checkpoint is None:
+            return None
+        if checkpoint["recipe"] != self._recipe_signature():
+            print(f"checkpoint {path} belongs to another recipe, not used")
+            return None
+        same_file = (
+            Path(checkpoint["file"]).expanduser().resolve()
+            == Path(self.file).expanduser().resolve()
+        )
+        if same_file and checkpoint.get("data") != data_signature(self.file):
+            print(f"{self.file} changed since checkpoint {path}, not used")
+            return None
+        if self._initial_values is None:
+            self._initial_values = self.get_values()
+        self.LoadResFromValues(checkpoint["values"])
+        return checkpoint
+
+    def resume(self, path: str = None, max_nfev: int = None):
+        """Continue the fit after the last stage of its checkpoint.
+
+        Without a (matching) checkpoint all stages are run.
+        """
+        checkpoint = self.load_checkpoint(path)
+        if checkpoint is None:
+            return self.run_fit(max_nfev=max_nfev)
+        return self.run_fit(
+            start_stage=checkpoint["stage"] + 1,
+            max_nfev=max_nfev,
+            free=checkpoint["free"],
+        )
         
     def clean_cif_files(self):
         VEST_bin = self.config["VESTA"]["bin"]
@@ -188,10 +344,18 @@ class FitPDF(Ezrestraint, GetScales):
             )
             self.cif_files[key] = f"{cif_name}_clean.cif"
         
-    def run_fit(self):
+    def run_fit(
+        self,
+        start_stage: int = 0,
+        max_nfev: int = None,
+        free: List[str] = None,
+    ):
         self.apply_restraints()
         self.create_param_order()
-        dw.optimize_params(
+        if self._initial_values is None:
+            self._initial_values = self.get_values()
+        fit_config = self.config.get("Fit", {})
+        self.stages = dw.optimize_params(
             self.recipe,
             self.config["param_order"],
             rmin=self.config["R_val"]["rmin"],
@@ -199,14 +363,30 @@ class FitPDF(Ezrestraint, GetScales):
             rstep=self.config["R_val"]["rstep"],
             ftol=1e-5,
             print_step=self.config["Verbose"]["step"],
+            start=start_stage,
+            max_nfev=max_nfev,
+            jac_workers=fit_config.get("jac_workers", 1),
+            profile=self.profile,
+            rw_tol=fit_config.get("rw_tol"),
+            early_stop=fit_config.get("early_stop", True),
+            free=free,
+            on_stage=None if self.checkpoint_dir is None else (
+                lambda i, report: self.save_checkpoint(i)
+            ),
         )
-        self.res = FitResults(self.recipe)
+        with span(self.profile, "FitResults"):
+            self.res = dw.ArrayFitResults(self.recipe)
 #        self.molscale, self.weighscale = self.calc_scale()
 #        self.all_scales = {'mol_scale': self.molscale, 'wt_scale': self.weighscale}
 #        print('Mol Scales:\n', [f'{k} = {v:1.3}' for k, v in self.molscale.items()])
 #        print('Weight Scales:\n', [f'{k} = {v:1.3}' for k, v in self.weighscale.items()])
+        # the FitPDF is reused between files, the scales of the previous
+        # one must not outlive a failed calc_scale
+        self.molscale = self.weightscale = None
+        self.scale_norms = self.molar_masses = None
         try:
-            self.molscale, self.weightscale = self.calc_scale()
+            with span(self.profile, "calc_scale"):
+                self.molscale, self.weightscale = self.calc_scale()
             self.scale_msg = 'Mol Scales:\n' + f'{self.molscale}\n' + 'Weight Scales:\n' + f'{self.weightscale}'
             print(self.scale_msg)
         except:
@@ -214,3 +394,326 @@ class FitPDF(Ezrestraint, GetScales):
         if self.config["Verbose"]["results"]:
             self.res.printResults()
         return self.res
+
+    def summary(self, curves: bool = False) -> dict:
+        summary = {
+            "file": str(self.file),
+            "rw": self.res.rw,
+            "names": list(self.res.varnames),
+            "values": list(self.res.varvals),
+            "uncertainties": list(self.res.varunc),
+            "mol_scale": getattr(self, "molscale", None),
+            "wt_scale": getattr(self, "weightscale", None),
+            "scale_norm": getattr(self, "scale_norms", None),
+            "molar_mass": getattr(self, "molar_masses", None),
+            "stages": getattr(self, "stages", None),
+            "error": None,
+        }
+        if curves:
+            from ezpdf import get_gr
+            r, gobs, gcalc, _, _, gr_composition = get_gr(self.recipe)
+            summary.update(
+                r=r, gobs=gobs, gcalc=gcalc, phases=gr_composition
+            )
+        return summary
+
+    def record(self, curves: bool = False) -> FitRecord:
+        """Compact record of the last fit, see fit_record.FitRecord."""
+        phases, data = (), None
+        if curves:
+            from ezpdf import get_gr
+            r, gobs, gcalc, _, _, gr_composition = get_gr(self.recipe)
+            phases = tuple(gr_composition)
+            data = np.column_stack([r, gobs, gcalc, *gr_composition.values()])
+        return FitRecord(
+            self.file, self.res.varnames, self.res.varvals, self.res.varunc,
+            self.res.rw, getattr(self, "molscale", None),
+            getattr(self, "weightscale", None), phases, data,
+        )
+
+    def detach(self, curves: bool = False) -> FitRecord:
+        """Record of the last fit, then drop the recipe and FitResults.
+
+        The generators and structures can be freed afterwards; the FitPDF
+        needs update_recipe before it can fit again.
+        """
+        record = self.record(curves)
+        for name in ("res", "recipe", "pgs", "fc"):
+            self.__dict__.pop(name, None)
+        self._restraints_applied = False
+        self._initial_values = None
+        return record
+
+    @classmethod
+    def fit_many(
+        cls,
+        files: List[str],
+        contributions: List[Contribution],
+        config_location: str = "",
+        jobs: int = None,
+        store: str = None,
+        threads: int = None,
+        on_result: Callable[[dict], None] = None,
+        resume: bool = False,
+    ) -> List[dict]:
+        """Fit every file with the same contributions in a process pool.
+
+        Each worker process builds its own recipe once and then swaps in
+        the data of every file it is handed, resetting the variables to their
+        starting values, so the fits stay independent.
+        A fit that raises is reported through the ``error`` entry of its
+        result instead of aborting the batch. Results keep the order of
+        ``files``. If ``store`` is given, every successful fit is appended to
+        the ResultsStore in that directory as soon as it completes.
+        ``threads`` overrides ``[Calculator] parallel`` of the config and
+        ``on_result`` is called with every result as it completes.
+        With ``resume``, files with a checkpoint (``[Fit] checkpoint``)
+        continue after its last stage, completed ones are only evaluated,
+        and files already in the store are not appended again.
+        """
+        files = list(files)
+        if config_location:
+            config_location = str(Path(config_location).expanduser().resolve())
+        jobs = jobs or os.cpu_count() or 1
+        results = [None] * len(files)
+        curves = store is not None
+        stored = _stored_files(store) if resume else set()
+
+        def done(i, result):
+            results[i] = result
+            if result["file"] not in stored:
+                _store_result(store, result)
+            if on_result is not None:
+                on_result(result)
+
+        # a worker process that dies (segfault, out of memory) breaks the
+        # pool: the files it had not started go to a new pool, the ones
+        # that were running are fitted again, each in a process of its own.
+        # If the pool broke before any fit started (killed at start-up, a
+        # failing initializer), a new pool would most likely do the same, so
+        # the remaining files are all fitted in processes of their own, at
+        # most jobs at a time
+        args = (contributions, config_location, jobs, curves, threads, resume)
+        pending = list(range(len(files)))
+        while pending:
+            n = len(pending)
+            running, pending = _fit_batch(files, pending, jobs, args, done)
+            if not running and len(pending) == n:
+                running, pending = pending, []
+            _fit_isolated(files, running, jobs, args, done)
+        return results
+
+    @classmethod
+    def fit_sequential(
+        cls,
+        files: List[str],
+        contributions: List[Contribution],
+        config_location: str = "",
+        start_stage: int = None,
+        max_nfev: int = None,
+        store: str = None,
+        threads: int = None,
+        on_result: Callable[[dict], None] = None,
+        resume: bool = False,
+    ) -> List[dict]:
+        """Refine a series of frames, seeding each with the previous one.
+
+        The recipe is built once and only the data profile is swapped
+        between frames. The first frame runs every ``param_order`` stage
+        from the default values. Later frames start from the refined values of the last
+        successful frame and begin at ``start_stage``; the free/fix state of
+        the skipped stages is still applied. ``start_stage`` and ``max_nfev``
+        default to the ``[Sequential]`` section of the config, or to the
+        last stage and no evaluation limit. If ``store`` is given, every
+        successful frame is appended to the ResultsStore in that directory.
+        ``threads``, ``on_result`` and ``resume`` work as in fit_many; the
+        first frame without a completed checkpoint continues after the last
+        stage of its checkpoint and seeds the frames after it.
+        """
+        results = []
+        stored = _stored_files(store) if resume else set()
+        previous = None
+        fit = None
+        for file in files:
+            try:
+                if fit is None:
+                    fit = cls(file, contributions, config_location)
+                    fit.set_threads(threads)
+                    fit.update_recipe()
+                else:
+                    fit.swap_data(file, reset="previous")
+                seq = fit.config.get("Sequential", {})
+                checkpoint = fit.load_checkpoint() if resume else None
+                if checkpoint is not None:
+                    fit.run_fit(
+                        start_stage=checkpoint["stage"] + 1,
+                        free=checkpoint["free"],
+                    )
+                elif previous is None:
+                    fit.run_fit()
+                else:
+                    fit.LoadResFromValues(previous)
+                    fit.run_fit(
+                        start_stage=_first_not_none(
+                            start_stage, seq.get("start_stage"), -1
+                        ),
+                        max_nfev=_first_not_none(
+                            max_nfev, seq.get("max_nfev")
+                        ),
+                    )
+                previous = fit.get_values()
+                results.append(fit.summary(curves=store is not None))
+            except Exception:
+                fit = None
+                results.append(_failed_result(file))
+            if results[-1]["file"] not in stored:
+                _store_result(store, results[-1])
+            if on_result is not None:
+                on_result(results[-1])
+        return results
+
+
+def _first_not_none(*values):
+    return next((v for v in values if v is not None), None)
+
+
+def _stored_files(store) -> set:
+    if store is None:
+        return set()
+    return set(ResultsStore(store).files)
+
+
+def _store_result(store, result: dict) -> None:
+    if store is None or result["error"]:
+        return
+    ResultsStore(store).append(result)
+    for key in ("r", "gobs", "gcalc", "phases"):
+        result.pop(key, None)
+
+
+def _failed_result(file) -> dict:
+    return {"file": str(file), "error": traceback.format_exc()}
+
+
+# FitPDF objects of a batch worker process, reused between files
+_worker_fits = {}
+
+# indices of the files a batch worker process started, see _fit_batch
+_started = None
+
+
+def _init_batch_worker(started) -> None:
+    global _started
+    _started = started
+
+
+def _fit_batch_file(i, *args):
+    _started.put(i)
+    return _fit_file(*args)
+
+
+def _fit_batch(
+    files: List[str],
+    indices: List[int],
+    jobs: int,
+    args: tuple,
+    done: Callable[[int, dict], None],
+) -> Tuple[List[int], List[int]]:
+    """Fit files[indices] in a pool, done(i, result) as fits complete.
+
+    If a worker process dies, the pool breaks and all fits that did not
+    complete are lost. Returns the indices of those that had started and
+    those that had not.
+    """
+    started = multiprocessing.SimpleQueue()
+    lost = set()
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_batch_worker, initargs=(started,)
+    ) as pool:
+        futures = {}
+        for i in indices:
+            # the pool can already break while the files are submitted
+            try:
+                futures[pool.submit(_fit_batch_file, i, files[i], *args)] = i
+            except BrokenProcessPool:
+                lost.add(i)
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                lost.add(i)
+                continue
+            except Exception:
+                result = _failed_result(files[i])
+            done(i, result)
+    running = set()
+    while not started.empty():
+        running.add(started.get())
+    return (
+        [i for i in indices if i in lost and i in running],
+        [i for i in indices if i in lost and i not in running],
+    )
+
+
+def _fit_isolated(
+    files: List[str],
+    indices: List[int],
+    jobs: int,
+    args: tuple,
+    done: Callable[[int, dict], None],
+) -> None:
+    """Fit every file in a process of its own, at most jobs at a time.
+
+    A file whose process dies fails, without affecting the others.
+    """
+    started = multiprocessing.SimpleQueue()
+    queued = deque(indices)
+    # future -> (index, pool of the future)
+    running = {}
+    try:
+        while queued or running:
+            while queued and len(running) < jobs:
+                i = queued.popleft()
+                pool = ProcessPoolExecutor(
+                    max_workers=1, initializer=_init_batch_worker,
+                    initargs=(started,)
+                )
+                future = pool.submit(_fit_batch_file, i, files[i], *args)
+                running[future] = i, pool
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i, pool = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception:
+                    result = _failed_result(files[i])
+                pool.shutdown()
+                done(i, result)
+    finally:
+        for _, pool in running.values():
+            pool.shutdown()
+
+
+def _fit_file(
+    file, contributions, config_location, concurrent_fits=1, curves=False,
+    threads=None, resume=False
+):
+    key = (repr(contributions), config_location, threads)
+    try:
+        fit = _worker_fits.pop(key, None)
+        if fit is None:
+            fit = FitPDF(file, contributions, config_location)
+            fit.concurrent_fits = concurrent_fits
+            fit.set_threads(threads)
+            fit.update_recipe()
+        else:
+            fit.swap_data(file, reset="initial")
+        if resume:
+            fit.resume()
+        else:
+            fit.run_fit()
+        _worker_fits[key] = fit
+        return fit.summary(curves=curves)
+    except Exception:
+        return _failed_result(file)
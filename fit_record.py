@@ -0,0 +1,149 @@
+import typing
+import numpy as np
+
+
+class FitRecord:
+    """Compact result of one fit, without references to the recipe.
+
+    Holds the parameter names, refined values and uncertainties, Rw, the
+    mol and weight scales by phase and optionally the curves as one
+    (n_points, 3 + n_phases) array of r, gobs, gcalc and the G(r) of every
+    phase. A FitPDF can be dropped once its record is taken, see
+    FitPDF.detach. Records of many fits are stacked into one structured
+    array with stack_records.
+    """
+
+    __slots__ = (
+        "file", "names", "values", "uncertainties", "rw", "mol_scale",
+        "wt_scale", "phases", "curves",
+    )
+
+    def __init__(
+            self,
+            file: str,
+            names: typing.Sequence[str],
+            values: typing.Sequence[float],
+            uncertainties: typing.Sequence[float],
+            rw: float,
+            mol_scale: typing.Dict[str, float] = None,
+            wt_scale: typing.Dict[str, float] = None,
+            phases: typing.Sequence[str] = (),
+            curves: np.ndarray = None,
+    ):
+        self.file = str(file)
+        self.names = tuple(names)
+        self.values = np.array(values, dtype=np.float64)
+        self.uncertainties = np.array(uncertainties, dtype=np.float64)
+        self.rw = float(rw)
+        self.mol_scale = dict(mol_scale or {})
+        self.wt_scale = dict(wt_scale or {})
+        self.phases = tuple(phases)
+        self.curves = None if curves is None else np.array(
+            curves, dtype=np.float64
+        )
+
+    @classmethod
+    def from_summary(cls, summary: dict) -> "FitRecord":
+        """Record of a successful result of FitPDF.summary."""
+        if summary.get("error"):
+            raise ValueError(f"fit of {summary['file']} failed")
+        curves = None
+        phases = ()
+        if "r" in summary:
+            phases = tuple(summary["phases"])
+            curves = np.column_stack([
+                summary["r"], summary["gobs"], summary["gcalc"],
+                *summary["phases"].values()
+            ])
+        return cls(
+            summary["file"], summary["names"], summary["values"],
+            summary["uncertainties"], summary["rw"],
+            summary.get("mol_scale"), summary.get("wt_scale"),
+            phases, curves,
+        )
+
+    def to_summary(self) -> dict:
+        """The record as a result of FitPDF.summary, e.g. for ResultsStore."""
+        summary = {
+            "file": self.file,
+            "rw": self.rw,
+            "names": list(self.names),
+            "values": list(self.values),
+            "uncertainties": list(self.uncertainties),
+            "mol_scale": self.mol_scale or None,
+            "wt_scale": self.wt_scale or None,
+            "error": None,
+        }
+        if self.curves is not None:
+            summary.update(
+                r=self.r, gobs=self.gobs, gcalc=self.gcalc,
+                phases=dict(zip(self.phases, self.curves[:, 3:].T)),
+            )
+        return summary
+
+    @property
+    def r(self) -> typing.Optional[np.ndarray]:
+        return None if self.curves is None else self.curves[:, 0]
+
+    @property
+    def gobs(self) -> typing.Optional[np.ndarray]:
+        return None if self.curves is None else self.curves[:, 1]
+
+    @property
+    def gcalc(self) -> typing.Optional[np.ndarray]:
+        return None if self.curves is None else self.curves[:, 2]
+
+    def gr(self, phase: str) -> np.ndarray:
+        """G(r) of one phase."""
+        return self.curves[:, 3 + self.phases.index(phase)]
+
+    def __getitem__(self, name: str) -> float:
+        return float(self.values[self.names.index(name)])
+
+    def __repr__(self) -> str:
+        return (
+            f"FitRecord({self.file!r}, rw={self.rw:.4f}, "
+            f"{len(self.names)} parameters)"
+        )
+
+
+def stack_records(records: typing.Sequence[FitRecord]) -> np.ndarray:
+    """One structured array row per record.
+
+    The fields are "file", "rw", every parameter, "<parameter>_unc" and
+    "<phase>_mol_scale" and "<phase>_wt_scale" for every phase of the
+    scales of the first record. All records must have the same
+    parameters; missing scales are NaN.
+    """
+    if not records:
+        return np.empty(0, dtype=[("file", "O"), ("rw", "f8")])
+    names = records[0].names
+    for record in records:
+        if record.names != names:
+            raise ValueError(
+                f"parameters of {record.file} do not match {records[0].file}"
+            )
+    scales = [
+        (key, phase)
+        for key in ("mol_scale", "wt_scale")
+        for phase in getattr(records[0], key)
+    ]
+    columns = (
+        list(names)
+        + [f"{name}_unc" for name in names]
+        + [f"{phase}_{key}" for key, phase in scales]
+    )
+    dtype = [("file", "O"), ("rw", "f8")] + [(c, "f8") for c in columns]
+    table = np.empty(len(records), dtype=dtype)
+    table["file"] = [record.file for record in records]
+    table["rw"] = [record.rw for record in records]
+    values = np.stack([record.values for record in records])
+    unc = np.stack([record.uncertainties for record in records])
+    for i, name in enumerate(names):
+        table[name] = values[:, i]
+        table[f"{name}_unc"] = unc[:, i]
+    for key, phase in scales:
+        table[f"{phase}_{key}"] = [
+            getattr(record, key).get(phase, np.nan) for record in records
+        ]
+    return table
@@ -0,0 +1,78 @@
+import typing
+from pathlib import Path
+import numpy as np
+
+
+TABLE_PATH = Path(__file__).resolve().parent.joinpath("rsc", "f1.npz")
+
+# loaded on first use, see _load_table
+_table: typing.Dict[str, np.ndarray] = {}
+_numbers: typing.Dict[str, int] = {}
+
+
+def _load_table() -> typing.Dict[str, np.ndarray]:
+    """Load the f1 table of H to U.
+
+    The table holds one row per element, indexed by atomic number - 1:
+    "keV" and "f1" are the tabulated energies and values, padded to equal
+    length with inf and the last f1 value, and "n" the number of tabulated
+    points of each element.
+    """
+    if not _table:
+        with np.load(TABLE_PATH) as data:
+            _table.update({key: data[key] for key in data.files})
+        _numbers.update(
+            {str(s): int(z) for s, z in zip(_table["symbol"], _table["z"])}
+        )
+    return _table
+
+
+def atomic_number(elements) -> np.ndarray:
+    """Atomic numbers of element symbols; numbers are passed through."""
+    _load_table()
+    elements = np.asarray(elements)
+    if elements.dtype.kind in "iu":
+        return elements
+    return np.vectorize(_atomic_number, otypes=[int])(elements)
+
+
+def _atomic_number(element: str) -> int:
+    element = str(element)
+    if element.isdigit():
+        return int(element)
+    if element not in _numbers:
+        raise ValueError(f"unknown element {element}")
+    return _numbers[element]
+
+
+def f1(elements, keV) -> np.ndarray:
+    """Real part of the x-ray atomic form factor.
+
+    Parameters
+    ----------
+    elements :
+        Element symbol(s) or atomic number(s).
+    keV :
+        Photon energy(ies) in keV. Broadcast against elements.
+
+    Returns
+    -------
+    f1 linearly interpolated in the tabulated energies. Outside the
+    tabulated range the first or last value is returned, like numpy.interp.
+    """
+    table = _load_table()
+    z, energy = np.broadcast_arrays(
+        atomic_number(elements), np.asarray(keV, dtype=float)
+    )
+    rows = z.ravel() - 1
+    e = energy.ravel()
+    grid = table["keV"][rows]
+    values = table["f1"][rows]
+    n = table["n"][rows]
+    hi = np.clip((grid < e[:, None]).sum(axis=1), 1, n - 1)
+    lo = hi - 1
+    i = np.arange(len(rows))
+    x0, x1 = grid[i, lo], grid[i, hi]
+    y0, y1 = values[i, lo], values[i, hi]
+    t = np.clip((e - x0) / (x1 - x0), 0., 1.)
+    return (y0 + t * (y1 - y0)).reshape(z.shape)
@@ -1,22 +1,123 @@
-import pandas as pd
+import re
+from collections import OrderedDict
+from functools import lru_cache
 import numpy as np
-from scipy.constants import c, e, m_e, epsilon_0, pi
-from glob import glob
-from molmass import Formula
+from .formfactor import f1 as atomic_f1
+
+
+def unique_positions(frac, tol=1e-4):
+    """
+    args:
+    frac: (m, n, 3) n symmetry images of each of m sites in fractional coordinates
+    tol: positions closer than tol in every coordinate are the same
+    returns:
+    list of m arrays with the distinct positions of each site, wrapped into the unit cell
+    """
+    unique = []
+    # one site at a time, an (m, n, n, 3) comparison gets large for big cells
+    for images in np.asarray(frac) % 1:
+        diff = images[:, None, :] - images[None, :, :]
+        diff -= np.round(diff)
+        same = np.all(np.abs(diff) < tol, axis=-1)
+        # an image is a duplicate if it matches any image before it
+        duplicate = np.any(np.triu(same, 1), axis=0)
+        unique.append(images[~duplicate])
+    return unique
+
+@lru_cache(maxsize=None)
+def electron_radius():
+    """classical electron radius, scattering length per electron in m"""
+    from scipy.constants import c, e, m_e, epsilon_0, pi
+    return e**2 / (4 * pi * epsilon_0 * m_e * c**2)
+
+
+# (space group, rounded site coordinates) -> site multiplicities of the
+# _max_multiplicities most recently used structures
+_multiplicities = OrderedDict()
+_max_multiplicities = 256
+
+
+def site_multiplicities(spacegroup, xyz, tol=1e-4):
+    """
+    args:
+    spacegroup: pyobjcryst SpaceGroup
+    xyz: (m, 3) fractional coordinates of m sites
+    returns:
+    number of distinct equivalent positions of each site; memoized (LRU) on
+    the space group and the coordinates rounded to tol
+    """
+    xyz = np.asarray(xyz, dtype=float).reshape(-1, 3)
+    key = (
+        spacegroup.GetName(),
+        spacegroup.GetNbSymmetrics(),
+        tuple(np.round(xyz / tol).astype(int).ravel()),
+    )
+    mult = _multiplicities.get(key)
+    if mult is not None:
+        _multiplicities.move_to_end(key)
+        return mult
+    images = np.array([spacegroup.GetAllSymmetrics(*pos) for pos in xyz])
+    mult = np.array([len(pos) for pos in unique_positions(images, tol)])
+    _multiplicities[key] = mult
+    if len(_multiplicities) > _max_multiplicities:
+        _multiplicities.popitem(last=False)
+    return mult
+
+
+@lru_cache(maxsize=None)
+def scattering_lengths(elements, keV):
+    """
+    args:
+    elements: tuple of element symbols
+    keV: x-ray energy
+    returns:
+    x-ray scattering length of each element in m
+    """
+    return electron_radius() * atomic_f1(list(elements), keV)
+
+
+@lru_cache(maxsize=None)
+def molar_mass(formula):
+    from molmass import Formula
+    return Formula(formula).isotope.mass
+
+
+def mol_fractions(scales, norms):
+    """
+    args:
+    scales: refined scale factors with the phases along the last axis; the
+    results of a batch of fits can be stacked along the first axis
+    norms: number density * average scattering length**2 of each phase
+    returns:
+    mol fractions with the shape of scales
+    """
+    s = np.asarray(scales) / np.asarray(norms)
+    return s / s.sum(axis=-1, keepdims=True)
+
+
+def weight_fractions(mol, masses):
+    """
+    args:
+    mol: mol fractions with the phases along the last axis
+    masses: molar mass of the formula of each phase
+    returns:
+    weight fractions with the shape of mol
+    """
+    w = np.asarray(mol) * np.asarray(masses)
+    return w / w.sum(axis=-1, keepdims=True)
 
 class GetScales():
     '''
     Class
 
+    Everything is read from the structures loaded in the PDFGenerators
+    (self.pgs), so the refined lattice and occupancies are used and no CIF
+    is parsed again.
     '''
 
     def calc_scale(self):
-        self.get_cifs()
         self.get_scales()
         self.get_cell_volume()
-        self.get_sym_constraints()
-        self.get_fract_cord()
-        self.gen_site_pos()
         self.count_atom()
         self.get_number_density()
         self.get_xray_scat_len()
@@ -33,119 +134,33 @@ class GetScales():
             self.scales[phase] = scale
         return self.scales
 
-    def get_cifs(self):
-        self.cif_contents = {}
-        for phase in self.phases:
-            with open(self.cif_files[phase], 'r') as f:
-                lines = f.readlines()
-            lines = [line.strip() for line in lines]
-            self.cif_contents[phase] = lines
-        return self.cif_contents
-
     def get_cell_volume(self):
         """
-        -----
-        ToDo:
-        if _cell_volume not found, calculate from lat params
+        returns:
+        cell_volume: dictionary with phase as keys and volume of the refined unit cell in m^3 as values
         """
         self.cell_volume = {}
-        tag = '_cell_volume'
         for phase in self.phases:
-            lines = self.cif_contents[phase]
-            cell_line = [i for i in lines if i.startswith(tag)]
-            self.cell_volume[phase] = float(cell_line[0].split()[-1].split('(')[0])
-            self.cell_volume[phase] = self.cell_volume[phase] * 10**-30
+            self.cell_volume[phase] = self.pgs[phase].stru.GetVolume() * 10**-30
         return self.cell_volume
 
-    def get_sym_constraints(self):
-        """
-        args:
-        cif_file
-        returns:
-        symmetrie operations
-        """
-        self.transforms = {}
-        for phase in self.phases:
-            lines = self.cif_contents[phase]
-            xyz_index1 = [i for i, l in enumerate(lines) if '_xyz' in l]
-            xyz_index2 = [i for i, l in enumerate(lines) if i > xyz_index1[0] and 'loop_' in l]
-            xyz_lines = lines[xyz_index1[0]+1:xyz_index2[0]]
-            xyz_lines = [line.strip() for line in xyz_lines if line.strip()] #removes any emtpy entry
-            #print(phase, xyz_lines) 
-            if '_space_group_symop_id' in lines:
-                xyz_lines = [xyz[len(f'{i+1}'):] for i, xyz in enumerate(xyz_lines)]
-            for ch in [' ', '\t', "'"]:
-                xyz_lines = [line.replace(ch, '') for line in xyz_lines] 
-            self.transforms[phase] = [lambda x, y, z, coef=i: eval(f'[{coef}]') for i in xyz_lines] 
-        return self.transforms#, print("transforms", self.transforms)
-
-    def get_fract_cord(self):
-        """
-        args:
-        cif_file
-        returns:
-        dataframe with fractional coordinates
-        """
-        self.fract_cord = {}
-        for phase in self.phases:
-            lines = self.cif_contents[phase]
-            site_ind = [
-                ind for ind, line in enumerate(lines) if '_atom_site_' in line
-            ]
-            site_slice = slice(site_ind[0], site_ind[-1]+1)
-            col_names = [line.split('_atom_site_')[-1] for line in lines[site_slice]]
-            l_site = site_ind[-1] + 1
-            number_symb_ind = [l_site + i for i, line in enumerate(lines[l_site + 1:])
-                            if '#' in line]
-            if number_symb_ind:
-                data = [line.split() for line in lines[site_ind[-1]+1:number_symb_ind[0]] if line != '']
-            else:
-                data = [line.split() for line in lines[site_ind[-1]+1:] if line != '']
-            self.fract_cord[phase] = pd.DataFrame(data, columns=col_names)
-        return self.fract_cord#, print("fract_cord", self.fract_cord)
-
-    def gen_site_pos(self):
-        """
-        args:
-        df: dataframe with fractional coordinates,
-        transforms: symmetrie operations
-        returns:
-        site_pos: dictionary with phase as keys, labels as keys and fractional coordinates as values
-        """
-        self.site_pos = {}
-        for phase in self.phases:
-            self.site_pos[phase] = {}
-            for lab in self.fract_cord[phase].label.unique(): 
-                row = self.fract_cord[phase].loc[self.fract_cord[phase].label == lab, :]
-                x, y, z = [row[xyz].to_numpy()[0]
-                        for xyz in ['fract_x', 'fract_y', 'fract_z']]
-                x, y, z = [float(i.split('(')[0]) for i in [x, y, z]]
-                frac = np.unique([t(x, y, z) for t in self.transforms[phase]], axis=0)
-                frac = frac % 1
-                for i, (x, y, z) in enumerate(frac):
-                    x = round(x, 4)
-                    y = round(y, 4)
-                    z = round(z, 4)
-                    frac[i] = [x, y, z]
-                frac = np.unique(frac, axis=0)
-                self.site_pos[phase][lab] = frac
-        return self.site_pos#, print("site_pos", self.site_pos)
-
     def count_atom(self):
         """
         args: 
-        df: dataframe with fractional coordinates,
-        site_pos: dictionary with labels as keys and fractional coordinates as values
+        site multiplicities (memoized, see site_multiplicities),
+        occupancies of the refined structure
         returns:
         atom_mult: dictionary with phase as key, labels as keys and number of atoms as values
         """
         self.atom_mult = {}
         for phase in self.phases:
-            self.atom_mult[phase] = {}
-            for label, pos in self.site_pos[phase].items():
-                self.atom_mult[phase][label] = np.array(pos).shape[0]
-            for label, occ in zip(self.fract_cord[phase].label, self.fract_cord[phase].occupancy):
-                self.atom_mult[phase][label] *= float(occ)
+            pg = self.pgs[phase]
+            atoms = pg.phase.getScatterers()
+            xyz = [(atom.x.value, atom.y.value, atom.z.value) for atom in atoms]
+            mult = site_multiplicities(pg.stru.GetSpaceGroup(), xyz)
+            self.atom_mult[phase] = {
+                atom.name: m * atom.occ.value for atom, m in zip(atoms, mult)
+            }
         return self.atom_mult#, print("atom_mult", self.atom_mult)
 
     def get_number_density(self):
@@ -167,34 +182,22 @@ class GetScales():
     def get_xray_scat_len(self):
         """
         args: 
-        atom_multiplicity: we get the atom label and use it to track the atomic form factor
-        xray_energy: still needs to be put in manually
+        atoms: the element of each atom site is taken from the structure
+        xray_energy: keV in the [Measurement] section of the config
         returns:
-        f1: dictionary, keys = phases, values = list of real part of atomic form factor for each atom site
         b1: dictionary, keys = phases, values = list of scattering length for each atom site
         """
-        f1 = {}
         self.b1 = {}
         elements = {}
         for phase in self.phases:
-            elements[phase] = []
-            f1[phase] = []
-            self.b1[phase] = []
-            for keys in self.atom_mult[phase]:
-                element = str()
-                for symbol in keys:
-                    if symbol.isalpha():
-                        element += symbol.lower() if element else symbol  # Convert to lowercase if not the first character
-                elements[phase].append(element.capitalize())  # Capitalize the first character
-            #print("elements", elements)
-            for element in elements[phase]:
-                file_path = glob(f'./ezfit/rsc/f1/*{element}*')[0]
-                _, element_keV, element_f1 = np.loadtxt(
-                    file_path, skiprows=1, delimiter=',').T
-                f = np.interp([self.config['Measurement']['keV']],  element_keV, element_f1)[0]
-                bi = e**2 / (4 * pi * epsilon_0 * m_e * c**2) * f
-                f1[phase].append(f)
-                self.b1[phase].append(bi)
+            elements[phase] = [
+                re.match('[A-Z][a-z]?', atom.element).group()
+                for atom in self.pgs[phase].phase.getScatterers()
+            ]
+            bi = scattering_lengths(
+                tuple(elements[phase]), self.config['Measurement']['keV']
+            )
+            self.b1[phase] = list(bi)
         return self.b1#, print("b1", self.b1)
 
     def get_avg_scat_len(self):
@@ -206,18 +209,9 @@ class GetScales():
         avg_scat_len: dictionary with phase as keys and average scatter length of unit cell as values
         """
         self.avg_scat_len = {}
-        n = {}  #n = total amount of atoms
-        f_sum = {}  #sum of scattering length
         for phase in self.phases:
-            self.avg_scat_len[phase] = 0
-            n[phase] = 0
-            f_sum[phase] = 0
-            n_x = list(self.atom_mult[phase].values()) #number of element x in unit cell
-            for i in range(len(self.b1[phase])):
-                f_sum[phase] += self.b1[phase][i] * n_x[i]
-                n[phase] += n_x[i]
-            #print('f_sum', f_sum, 'n', n)
-            self.avg_scat_len[phase] = f_sum[phase] / n[phase]
+            n_x = np.fromiter(self.atom_mult[phase].values(), float) #number of element x in unit cell
+            self.avg_scat_len[phase] = float(np.dot(self.b1[phase], n_x) / n_x.sum())
         return self.avg_scat_len#, print("avg_scat_len", self.avg_scat_len)
         
     def get_real_scales(self):
@@ -229,28 +223,23 @@ class GetScales():
         returns:
         real_scale
         """
-        self.real_scales = {}
-        s = {}
-        for phase in self.phases:
-            s[phase] = self.scales[phase] / (self.number_dens[phase] * self.avg_scat_len[phase]**2)
-        sum_scales = sum(s.values())
-        #print("s", s)
-        #print("sum_scales", sum_scales)
-        for phase in self.phases:
-            self.real_scales[phase] = s[phase] / sum_scales
+        norms = [
+            self.number_dens[phase] * self.avg_scat_len[phase]**2
+            for phase in self.phases
+        ]
+        self.scale_norms = dict(zip(self.phases, norms))
+        mol = mol_fractions([self.scales[p] for p in self.phases], norms)
+        self.real_scales = dict(zip(self.phases, mol.tolist()))
         return self.real_scales#, print("real_scales", self.real_scales)
 
     def get_weight_percent(self):
-        self.weight_percent = {}
-        total = 0
-        for phase in self.phases:
-            formula = self.formulas[phase]
-            total += Formula(formula).isotope.mass * self.real_scales[phase]
-            #print(phase, "formula", formula)
-        #print("total", total)
-        for phase in self.phases:
-            formula = self.formulas[phase]
-            self.weight_percent[phase] = Formula(formula).isotope.mass * self.real_scales[phase] / total
+        masses = [
+            molar_mass(self.formulas[phase.split('Γ')[0]])
+            for phase in self.phases
+        ]
+        self.molar_masses = dict(zip(self.phases, masses))
+        wt = weight_fractions([self.real_scales[p] for p in self.phases], masses)
+        self.weight_percent = dict(zip(self.phases, wt.tolist()))
         return self.weight_percent#, print("weight_percent", self.weight_percent)
 
 
@@ -0,0 +1,29 @@
+import importlib.util
+import sys
+import types
+
+
+def lazy_import(name: str, package: str = None) -> types.ModuleType:
+    """Import a module on first attribute access.
+
+    The module is registered in sys.modules right away, but its code only
+    runs when an attribute of it is used, so heavy dependencies it imports
+    are not loaded by ``import ezfit``. The parent package of name is
+    imported normally, so only use this for modules whose parents are
+    cheap to import.
+    """
+    name = importlib.util.resolve_name(name, package)
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
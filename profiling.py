@@ -0,0 +1,235 @@
+import json
+import time
+import typing
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+import numpy as np
+
+
+class StageProfile:
+    """Counters of one param_order stage.
+
+    residual_calls/jacobian_calls are the evaluations requested by the
+    optimizer, residual_time/jacobian_time the wall time spent in them.
+    generators maps every PDFGenerator to [calls, seconds]; with parallel
+    Jacobian workers only the calls made in this process are counted.
+    rw is the Rw after every residual evaluation.
+    """
+
+    def __init__(self, index: int, names: typing.List[str], r_range: tuple):
+        self.index = index
+        self.names = list(names)
+        self.rmin, self.rmax, self.rstep = r_range
+        self.wall_time = 0.
+        self.residual_calls = 0
+        self.residual_time = 0.
+        self.jacobian_calls = 0
+        self.jacobian_time = 0.
+        self.generators: typing.Dict[str, typing.List[float]] = {}
+        self.rw: typing.List[float] = []
+        self.status = None
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "names": self.names,
+            "rmin": self.rmin,
+            "rmax": self.rmax,
+            "rstep": self.rstep,
+            "wall_time": self.wall_time,
+            "residual_calls": self.residual_calls,
+            "residual_time": self.residual_time,
+            "jacobian_calls": self.jacobian_calls,
+            "jacobian_time": self.jacobian_time,
+            "generators": {
+                name: {"calls": int(calls), "time": t}
+                for name, (calls, t) in self.generators.items()
+            },
+            "rw": self.rw,
+            "status": self.status,
+        }
+
+
+class FitProfile:
+    """Where the time of a fit goes.
+
+    spans are the named phases of the fit (recipe building, restraints,
+    every stage, calc_scale, ...) as dicts with start and duration in
+    seconds since the profile was created; stages hold the counters of
+    every param_order stage (see StageProfile). Export with save_json, or
+    with save_chrome_trace for chrome://tracing / Perfetto.
+    """
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.spans: typing.List[dict] = []
+        self.stages: typing.List[StageProfile] = []
+        # residual and Jacobian calls, only kept for the trace
+        self._calls: typing.List[tuple] = []
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._t0
+
+    @contextmanager
+    def span(self, name: str, **args):
+        start = self._now()
+        try:
+            yield
+        finally:
+            self.spans.append({
+                "name": name,
+                "start": start,
+                "duration": self._now() - start,
+                "args": args,
+            })
+
+    @contextmanager
+    def stage(self, recipe, index: int, r_range: tuple, fc_name: str = "PDF"):
+        """Profile one refinement stage of recipe.
+
+        Yields the StageProfile. Within the stage the PDFGenerators of the
+        contribution are timed; they are restored afterwards.
+        """
+        stage = StageProfile(index, recipe.getNames(), r_range)
+        self.stages.append(stage)
+        fc = getattr(recipe, fc_name)
+        for name, pg in fc._generators.items():
+            pg.operation = _timed(
+                pg.operation, stage.generators.setdefault(name, [0, 0.])
+            )
+        start = time.perf_counter()
+        try:
+            with self.span(f"stage {index + 1}", names=stage.names):
+                yield stage
+        finally:
+            stage.wall_time = time.perf_counter() - start
+            for pg in fc._generators.values():
+                # drop the instance attribute, back to the class method
+                del pg.operation
+
+    def residual(
+            self,
+            stage: StageProfile,
+            fun: typing.Callable,
+            profile
+    ) -> typing.Callable:
+        """Wrap the residual function of an optimizer for stage."""
+        def residual(x):
+            start = self._now()
+            f = fun(x)
+            duration = self._now() - start
+            stage.residual_calls += 1
+            stage.residual_time += duration
+            stage.rw.append(rw(profile))
+            self._calls.append(
+                ("residual", stage.index, start, duration, stage.rw[-1])
+            )
+            return f
+        return residual
+
+    def jacobian(
+            self,
+            stage: StageProfile,
+            jac: typing.Callable
+    ) -> typing.Callable:
+        """Wrap the Jacobian function of an optimizer for stage."""
+        def jacobian(x):
+            start = self._now()
+            j = jac(x)
+            duration = self._now() - start
+            stage.jacobian_calls += 1
+            stage.jacobian_time += duration
+            self._calls.append(
+                ("jacobian", stage.index, start, duration, None)
+            )
+            return j
+        return jacobian
+
+    def totals(self) -> typing.Dict[str, float]:
+        """Seconds spent per span name, summed over repeated spans."""
+        totals = {}
+        for span in self.spans:
+            totals[span["name"]] = totals.get(span["name"], 0.) \
+                + span["duration"]
+        return totals
+
+    def to_dict(self) -> dict:
+        return {
+            "spans": self.spans,
+            "totals": self.totals(),
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def save_json(self, path: str) -> None:
+        Path(path).write_text(json.dumps(self.to_dict(), indent=2))
+
+    def chrome_trace(self) -> dict:
+        """The profile in the Chrome trace event format.
+
+        Spans go to thread 0, residual and Jacobian evaluations to thread 1
+        and the Rw of every residual evaluation is a counter track.
+        """
+        events = [
+            {
+                "name": span["name"], "cat": "fit", "ph": "X",
+                "ts": span["start"] * 1e6, "dur": span["duration"] * 1e6,
+                "pid": 0, "tid": 0, "args": span["args"],
+            }
+            for span in self.spans
+        ]
+        for name, index, start, duration, value in self._calls:
+            events.append({
+                "name": name, "cat": "optimizer", "ph": "X",
+                "ts": start * 1e6, "dur": duration * 1e6,
+                "pid": 0, "tid": 1, "args": {"stage": index + 1},
+            })
+            if value is not None:
+                events.append({
+                    "name": "Rw", "ph": "C", "ts": (start + duration) * 1e6,
+                    "pid": 0, "args": {"Rw": value},
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path: str) -> None:
+        Path(path).write_text(json.dumps(self.chrome_trace()))
+
+    def report(self) -> str:
+        lines = [f"{'':<24}{'time [s]':>10}"]
+        for name, t in self.totals().items():
+            lines.append(f"{name:<24}{t:>10.3f}")
+        for stage in self.stages:
+            lines.append(
+                f"stage {stage.index + 1}: {stage.residual_calls} residual "
+                f"({stage.residual_time:.3f} s), {stage.jacobian_calls} "
+                f"Jacobian ({stage.jacobian_time:.3f} s), Rw "
+                f"{stage.rw[-1] if stage.rw else float('nan'):.4f}"
+            )
+            for name, (calls, t) in stage.generators.items():
+                lines.append(f"    {name}: {int(calls)} calls, {t:.3f} s")
+        return "\n".join(lines)
+
+
+def _timed(fun: typing.Callable, counter: typing.List[float]):
+    def timed(*args):
+        start = time.perf_counter()
+        try:
+            return fun(*args)
+        finally:
+            counter[0] += 1
+            counter[1] += time.perf_counter() - start
+    return timed
+
+
+def rw(profile) -> float:
+    """Rw of a srfit Profile, computed like FitResults."""
+    y = np.abs(profile.y)
+    chi = np.abs(profile.y - profile.ycalc) / profile.dy
+    yw2 = np.dot(y / profile.dy, y / profile.dy)
+    return float(np.sqrt(np.dot(chi, chi) / (yw2 or 1.)))
+
+
+def span(profile: typing.Optional[FitProfile], name: str, **args):
+    """profile.span, or a no-op if profiling is off (profile is None)."""
+    if profile is None:
+        return nullcontext()
+    return profile.span(name, **args)
@@ -0,0 +1,184 @@
+import json
+import typing
+from pathlib import Path
+import numpy as np
+
+
+class ResultsStore:
+    """Append-only, columnar store of fit results.
+
+    A store is a directory of raw float64/int64 files that grow by one row
+    per fit and are read back lazily through numpy.memmap:
+
+    meta.json         parameter and phase names, fixed by the first fit,
+                      and the phases of the scales, fixed by the first
+                      fit with scales
+    files.txt         data file of every fit, one per line
+    values.f8         (n, n_params) refined values
+    uncertainties.f8  (n, n_params) uncertainties
+    mol_scale.f8      (n, n_scale_phases) mol fractions, NaN if unknown
+    wt_scale.f8       (n, n_scale_phases) weight fractions, NaN if unknown
+    curves.f8         (n_points, 3 + n_phases) r, gobs, gcalc and the
+                      G(r) of every phase, for all fits one after another
+    curve_index.i8    (n, 2) first row and number of rows in curves.f8
+    rw.f8             (n,) Rw, written last so an interrupted append is
+                      never counted
+
+    Fits are appended as the dicts returned by FitPDF.summary(curves=True).
+    """
+
+    def __init__(self, directory: str):
+        self.path = Path(directory).expanduser()
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta = self.path.joinpath("meta.json")
+        self.meta = json.loads(meta.read_text()) if meta.is_file() else None
+
+    def _file(self, name: str) -> Path:
+        return self.path.joinpath(name)
+
+    def _append(self, name: str, data: np.ndarray) -> None:
+        with self._file(name).open("ab") as f:
+            f.write(np.ascontiguousarray(data).tobytes())
+
+    def _memmap(self, name: str, dtype, columns: int = None) -> np.ndarray:
+        n = len(self)
+        shape = (n,) if columns is None else (n, columns)
+        if n == 0 or not self._file(name).is_file():
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode="r", shape=shape)
+
+    def __len__(self) -> int:
+        rw = self._file("rw.f8")
+        return rw.stat().st_size // 8 if rw.is_file() else 0
+
+    @property
+    def names(self) -> typing.List[str]:
+        return self.meta["names"] if self.meta else []
+
+    @property
+    def phases(self) -> typing.List[str]:
+        return self.meta["phases"] if self.meta else []
+
+    @property
+    def scale_phases(self) -> typing.List[str]:
+        return self.meta.get("scale_phases", []) if self.meta else []
+
+    @property
+    def files(self) -> typing.List[str]:
+        if not self._file("files.txt").is_file():
+            return []
+        lines = self._file("files.txt").read_text().splitlines()
+        return lines[:len(self)]
+
+    @property
+    def rw(self) -> np.ndarray:
+        return self._memmap("rw.f8", np.float64)
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._memmap("values.f8", np.float64, len(self.names))
+
+    @property
+    def uncertainties(self) -> np.ndarray:
+        return self._memmap("uncertainties.f8", np.float64, len(self.names))
+
+    @property
+    def mol_scale(self) -> np.ndarray:
+        """Mol fractions, one column per phase of scale_phases."""
+        return self._memmap("mol_scale.f8", np.float64, len(self.scale_phases))
+
+    @property
+    def wt_scale(self) -> np.ndarray:
+        """Weight fractions, one column per phase of scale_phases."""
+        return self._memmap("wt_scale.f8", np.float64, len(self.scale_phases))
+
+    def column(self, name: str) -> np.ndarray:
+        """Refined value of one parameter over all fits."""
+        return self.values[:, self.names.index(name)]
+
+    def curves(self, i: int) -> typing.Dict[str, np.ndarray]:
+        """r, gobs, gcalc and the per-phase G(r) of fit i."""
+        index = self._memmap("curve_index.i8", np.int64, 2)
+        start, length = index[i]
+        ncol = 3 + len(self.phases)
+        data = np.memmap(
+            self._file("curves.f8"), dtype=np.float64, mode="r",
+            offset=int(start) * ncol * 8, shape=(int(length), ncol)
+        )
+        curves = dict(zip(["r", "gobs", "gcalc"], data[:, :3].T))
+        curves["phases"] = dict(zip(self.phases, data[:, 3:].T))
+        return curves
+
+    def append(self, result: dict) -> None:
+        """Append one result of FitPDF.summary(curves=True)."""
+        if result.get("error"):
+            raise ValueError(f"cannot store failed fit of {result['file']}")
+        phases = list(result["phases"].keys())
+        scales = {
+            key: result.get(key) or {} for key in ("mol_scale", "wt_scale")
+        }
+        meta = dict(self.meta or {})
+        if self.meta is None:
+            self.meta = {"names": list(result["names"]), "phases": phases}
+        elif (
+            list(result["names"]) != self.names or phases != self.phases
+        ):
+            raise ValueError(
+                f"parameters of {result['file']} do not match the store"
+            )
+        if not self.scale_phases:
+            self.meta["scale_phases"] = list(
+                scales["mol_scale"] or scales["wt_scale"]
+            )
+        if self.meta != meta:
+            self._file("meta.json").write_text(json.dumps(self.meta))
+        # drop rows of an append that was interrupted before rw.f8
+        n = len(self)
+        ncol = 3 + len(phases)
+        index = self._memmap("curve_index.i8", np.int64, 2)
+        start = int(index[-1].sum()) if n else 0
+        del index
+        for name, rowsize in [
+            ("values.f8", 8 * len(self.names)),
+            ("uncertainties.f8", 8 * len(self.names)),
+            ("curve_index.i8", 16),
+        ]:
+            if self._file(name).is_file():
+                with self._file(name).open("r+b") as f:
+                    f.truncate(n * rowsize)
+        # the scale columns may start after the first fits, which get NaN
+        nscale = len(self.scale_phases)
+        for name in ("mol_scale.f8", "wt_scale.f8"):
+            with self._file(name).open("ab") as f:
+                rows = min(f.seek(0, 2) // (8 * nscale), n) if nscale else n
+                f.truncate(rows * 8 * nscale)
+                f.write(np.full((n - rows) * nscale, np.nan).tobytes())
+        if self._file("curves.f8").is_file():
+            with self._file("curves.f8").open("r+b") as f:
+                f.truncate(start * ncol * 8)
+        files = self._file("files.txt")
+        lines = files.read_text().splitlines() if files.is_file() else []
+        if len(lines) != n:
+            files.write_text("".join(f"{line}\n" for line in lines[:n]))
+        with files.open("a") as f:
+            f.write(f"{result['file']}\n")
+
+        curves = np.column_stack(
+            [result["r"], result["gobs"], result["gcalc"],
+             *result["phases"].values()]
+        ).astype(np.float64)
+        self._append("curves.f8", curves)
+        self._append("values.f8", np.asarray(result["values"], np.float64))
+        self._append(
+            "uncertainties.f8",
+            np.asarray(result["uncertainties"], np.float64)
+        )
+        for key, values in scales.items():
+            self._append(f"{key}.f8", np.array(
+                [values.get(phase, np.nan) for phase in self.scale_phases],
+                np.float64
+            ))
+        self._append(
+            "curve_index.i8", np.array([start, len(curves)], np.int64)
+        )
+        self._append("rw.f8", np.array([result["rw"]], np.float64))
@@ -0,0 +1,194 @@
+import re
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+from .contribution import Contribution
+from .ezfit import FitPDF, _failed_result, load_config
+
+
+def library(config: dict) -> typing.List[str]:
+    """Names of the CIFs in the files.cifs directory of the config."""
+    return sorted(p.stem for p in Path(config["files"]["cifs"]).glob("*.cif"))
+
+
+def _cif_formula(path: Path) -> typing.Optional[str]:
+    try:
+        text = path.read_text(errors="ignore")
+    except OSError:
+        return None
+    match = re.search(
+        r"^_chemical_formula_sum\s+['\"]?([^'\"\n]+)", text, re.M
+    )
+    if match is None:
+        return None
+    return match.group(1).replace(" ", "")
+
+
+def candidate_contributions(
+        candidates: typing.Sequence[typing.Union[str, Contribution]],
+        config: dict,
+        cf_name: str = "bulkCF"
+) -> typing.Dict[str, Contribution]:
+    """Contribution of every candidate by CIF name.
+
+    Candidates given as CIF names get cf_name and the formula of
+    _chemical_formula_sum in the CIF, or the CIF name if there is none.
+    """
+    contributions = {}
+    for candidate in candidates:
+        if isinstance(candidate, Contribution):
+            contributions[candidate.cif_name] = candidate
+            continue
+        cif = Path(config["files"]["cifs"]).joinpath(f"{candidate}.cif")
+        contributions[candidate] = Contribution(
+            cif_name=candidate,
+            cf_name=cf_name,
+            formula=_cif_formula(cif) or candidate,
+        )
+    return contributions
+
+
+def _screen_fit(file, contributions, config_location, param_order, threads):
+    try:
+        fit = FitPDF(file, contributions, config_location)
+        fit.set_threads(threads)
+        if param_order is not None:
+            fit.config["param_order"] = param_order
+        fit.config["Verbose"] = {"step": False, "results": False}
+        fit.update_recipe()
+        # e.g. no cfs restraint for combinations of bulk phases
+        tags = fit._tag_index()
+        fit.config["Restraints"] = {
+            k: v for k, v in fit.config.get("Restraints", {}).items()
+            if k in tags
+        }
+        fit.run_fit()
+        return fit.summary()
+    except Exception:
+        return _failed_result(file)
+
+
+def _fit_combinations(
+        pool: ProcessPoolExecutor,
+        file: str,
+        combos: typing.List[typing.Tuple[str, ...]],
+        contributions: typing.Dict[str, Contribution],
+        config_location: str,
+        param_order: typing.Optional[list],
+        threads: int
+) -> typing.Dict[typing.Tuple[str, ...], dict]:
+    futures = {
+        combo: pool.submit(
+            _screen_fit, file, [contributions[name] for name in combo],
+            config_location, param_order, threads
+        )
+        for combo in combos
+    }
+    results = {}
+    for combo, future in futures.items():
+        try:
+            results[combo] = future.result()
+        except Exception:
+            results[combo] = _failed_result(file)
+    return results
+
+
+def _ranked(results: typing.Dict[tuple, dict]) -> typing.List[tuple]:
+    ok = [combo for combo, result in results.items() if not result["error"]]
+    return sorted(ok, key=lambda combo: results[combo]["rw"])
+
+
+def screen(
+        file: str,
+        candidates: typing.Sequence[typing.Union[str, Contribution]] = None,
+        config_location: str = "",
+        max_phases: int = 2,
+        cf_name: str = "bulkCF",
+        jobs: int = None,
+        threads: int = 1,
+        quick_rmax: float = 20.,
+        quick_rstep: float = None,
+        prune: float = 1.5,
+        keep: int = 8,
+        top: int = 5,
+) -> typing.List[dict]:
+    """Rank combinations of candidate phases for one data file.
+
+    1. Every candidate is fitted alone in a cheap first pass: only "lat"
+       and "scale" are refined, up to quick_rmax (and with quick_rstep).
+    2. Candidates with an Rw above prune times the best single Rw are
+       dropped, at most keep candidates remain.
+    3. All combinations of up to max_phases of the remaining candidates
+       get the same first pass.
+    4. The top combinations of the first pass are refined with the full
+       param_order of the config.
+
+    Candidates are CIF names in files.cifs or Contributions, default every
+    CIF in files.cifs; CIF names get cf_name. Fits run in a pool of jobs
+    processes with threads calculator workers each.
+
+    Returns one row per fitted combination, the fully refined ones first
+    by Rw, then the others by first-pass Rw. A row holds "phases",
+    "quick_rw", "rw", "mol_scale", "wt_scale" and "error"; "rw" and the
+    scales are None for combinations that were not fully refined.
+    """
+    if config_location:
+        config_location = str(Path(config_location).expanduser().resolve())
+    config = load_config(config_location)
+    if candidates is None:
+        candidates = library(config)
+    contributions = candidate_contributions(candidates, config, cf_name)
+    quick = [{
+        "free": ["lat", "scale"],
+        "fix": [],
+        "rmax": quick_rmax,
+        "rstep": quick_rstep or config["R_val"]["rstep"],
+    }]
+    fit_args = (contributions, config_location)
+    file = str(file)
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        first = _fit_combinations(
+            pool, file, [(name,) for name in contributions], *fit_args,
+            quick, threads
+        )
+        singles = _ranked(first)
+        kept = []
+        if singles:
+            best = first[singles[0]]["rw"]
+            kept = [
+                combo[0] for combo in singles
+                if first[combo]["rw"] <= prune * best
+            ][:keep]
+        combos = [
+            combo
+            for n in range(2, max_phases + 1)
+            for combo in combinations(kept, n)
+        ]
+        first.update(
+            _fit_combinations(pool, file, combos, *fit_args, quick, threads)
+        )
+        best_combos = _ranked(first)[:top]
+        full = _fit_combinations(
+            pool, file, best_combos, *fit_args, None, threads
+        )
+
+    rows = []
+    for combo, result in first.items():
+        final = full.get(combo, {})
+        rows.append({
+            "phases": list(combo),
+            "quick_rw": None if result["error"] else result["rw"],
+            "rw": final.get("rw"),
+            "mol_scale": final.get("mol_scale"),
+            "wt_scale": final.get("wt_scale"),
+            "error": final.get("error") or result["error"],
+        })
+    inf = float("inf")
+    rows.sort(key=lambda row: (
+        row["rw"] is None,
+        inf if row["rw"] is None else row["rw"],
+        inf if row["quick_rw"] is None else row["quick_rw"],
+    ))
+    return rows
@@ -0,0 +1,214 @@
+import multiprocessing
+import os
+import signal
+import time
+import typing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from .contribution import Contribution
+from .ezfit import (
+    _failed_result, _fit_batch_file, _init_batch_worker, _store_result,
+    load_config,
+)
+
+
+class DirectoryWatcher:
+    """Report files of a directory once they have finished writing.
+
+    A file counts as finished when it is not empty and its size and mtime
+    did not change for ``settle`` seconds. Every file is reported once.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        pattern: str = "*.gr",
+        settle: float = 2.0,
+        existing: bool = True,
+    ):
+        self.directory = Path(directory).expanduser()
+        self.pattern = pattern
+        self.settle = settle
+        self.seen = set()
+        # path -> ((size, mtime), time the signature was first seen)
+        self._pending = {}
+        if not existing:
+            self.seen.update(self.directory.glob(pattern))
+
+    def poll(self) -> typing.List[Path]:
+        now = time.monotonic()
+        ready = []
+        for path in sorted(self.directory.glob(self.pattern)):
+            if path in self.seen:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self._pending.get(path)
+            if previous is None or previous[0] != signature:
+                self._pending[path] = (signature, now)
+            elif stat.st_size and now - previous[1] >= self.settle:
+                ready.append(path)
+                self.seen.add(path)
+                del self._pending[path]
+        return ready
+
+
+def _ignore_sigint() -> None:
+    # Ctrl-C reaches the whole process group; the coordinating process
+    # stops and lets the workers finish their fits
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _init_watch_worker(started) -> None:
+    _init_batch_worker(started)
+    _ignore_sigint()
+
+
+def watch(
+    directory: str,
+    contributions: typing.List[Contribution],
+    config_location: str = "",
+    pattern: str = "*.gr",
+    jobs: int = None,
+    store: str = None,
+    settle: float = 2.0,
+    poll: float = 1.0,
+    existing: bool = True,
+    idle_timeout: float = None,
+    on_result: typing.Callable[[dict], None] = None,
+) -> typing.List[dict]:
+    """Fit data files as they appear in a directory.
+
+    New files are queued once they have finished writing (see
+    DirectoryWatcher) and fitted with the FitPDF config by at most ``jobs``
+    worker processes, each reusing its recipe between files. Every result
+    is appended to the ResultsStore ``store`` as soon as it completes,
+    default ``<files.out>/store`` of the config, and passed to
+    ``on_result``. If a worker process dies, the files that were running
+    are fitted again in processes of their own, so only the file that
+    crashes fails, and watching continues with a new pool while they run.
+
+    Runs until interrupted with Ctrl-C, or until nothing was queued or
+    running for ``idle_timeout`` seconds. Running fits are finished before
+    returning. Returns the results in order of completion.
+    """
+    if config_location:
+        config_location = str(Path(config_location).expanduser().resolve())
+    config = load_config(config_location)
+    if store is None:
+        store = str(Path(config["files"]["out"]).joinpath("store"))
+    jobs = jobs or os.cpu_count() or 1
+    args = (contributions, config_location, jobs, True)
+    watcher = DirectoryWatcher(directory, pattern, settle, existing)
+    files = []
+    queue = deque()
+    running = {}
+    # retries of fits lost with a broken pool, future -> (index, pool)
+    isolated = {}
+    results = []
+
+    def done(i, result):
+        _store_result(store, result)
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    def collect(finished):
+        lost = []
+        for future in finished:
+            i = running.pop(future)
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                lost.append(i)
+                continue
+            except Exception:
+                result = _failed_result(files[i])
+            done(i, result)
+        return lost
+
+    def collect_isolated(finished):
+        for future in finished:
+            i, retry_pool = isolated.pop(future)
+            try:
+                result = future.result()
+            except Exception:
+                result = _failed_result(files[i])
+            retry_pool.shutdown()
+            done(i, result)
+
+    def new_pool(workers=jobs):
+        started = multiprocessing.SimpleQueue()
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_watch_worker,
+            initargs=(started,)
+        )
+        return pool, started
+
+    def recover(pool, started, lost):
+        # the pool is broken: the other running fits are lost as well
+        lost += collect(wait(running).done)
+        pool.shutdown()
+        # fits that had started are retried alone, so only the file that
+        # crashes fails, the others are queued. The retries are collected
+        # like the running fits, watching goes on meanwhile
+        ran = set()
+        while not started.empty():
+            ran.add(started.get())
+        queue.extendleft(files[i] for i in reversed(lost) if i not in ran)
+        for i in lost:
+            if i in ran:
+                retry_pool, _ = new_pool(1)
+                future = retry_pool.submit(_fit_batch_file, i, files[i], *args)
+                isolated[future] = i, retry_pool
+        return new_pool()
+
+    last_active = time.monotonic()
+    pool, started = new_pool()
+    try:
+        while True:
+            queue.extend(str(file) for file in watcher.poll())
+            lost = []
+            while queue and len(running) + len(isolated) < jobs:
+                file = queue.popleft()
+                files.append(file)
+                i = len(files) - 1
+                try:
+                    future = pool.submit(_fit_batch_file, i, file, *args)
+                except BrokenProcessPool:
+                    lost.append(i)
+                    break
+                running[future] = i
+            if queue or running or isolated:
+                last_active = time.monotonic()
+            elif (
+                idle_timeout is not None
+                and time.monotonic() - last_active > idle_timeout
+            ):
+                break
+            if running or isolated:
+                finished, _ = wait(
+                    [*running, *isolated], timeout=poll,
+                    return_when=FIRST_COMPLETED
+                )
+                collect_isolated([f for f in finished if f in isolated])
+                lost += collect([f for f in finished if f in running])
+            elif not lost:
+                time.sleep(poll)
+            if lost:
+                pool, started = recover(pool, started, lost)
+    except KeyboardInterrupt:
+        print(
+            f"stopping, finishing {len(running) + len(isolated)} running fits"
+        )
+    lost = collect(wait(running).done)
+    if lost:
+        pool, started = recover(pool, started, lost)
+    collect_isolated(wait(isolated).done)
+    pool.shutdown()
+    return results
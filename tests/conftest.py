@@ -0,0 +1,103 @@
+import importlib.util
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# the repository root is the ezfit package; import it under that name
+# whatever the checkout directory is called
+if "ezfit" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "ezfit", ROOT.joinpath("__init__.py"),
+        submodule_search_locations=[str(ROOT)]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["ezfit"] = module
+    spec.loader.exec_module(module)
+
+
+def _decay(name):
+    from diffpy.srfit.fitbase import ProfileGenerator
+
+    class Decay(ProfileGenerator):
+        def __init__(self, name):
+            ProfileGenerator.__init__(self, name)
+            self._newParameter("b", 1.0)
+
+        def __call__(self, x):
+            return np.exp(-self.b.value * x)
+
+    return Decay(name)
+
+
+@pytest.fixture
+def make_recipe():
+    """Factory of recipes of a * exp(-b * x) + c fitted to noisy data.
+
+    The variables are a, b and c; the contribution is "PDF".
+    """
+    from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+
+    def build(recipe=None):
+        recipe = FitRecipe() if recipe is None else recipe
+        x = np.linspace(0, 5, 50)
+        rng = np.random.default_rng(0)
+        profile = Profile()
+        profile.setObservedProfile(
+            x, 3 * np.exp(-0.7 * x) + 0.2 + rng.normal(0, 0.01, len(x))
+        )
+        fc = FitContribution("PDF")
+        fc.setProfile(profile)
+        fc.addProfileGenerator(_decay("g"))
+        fc.setEquation("a*g + c")
+        recipe.addContribution(fc)
+        recipe.addVar(fc.a, 3.1)
+        recipe.addVar(fc.g.b, 0.6)
+        recipe.addVar(fc.c, 0.25)
+        return recipe
+
+    return build
+
+
+PARAM_ORDER = [
+    {"free": ["a", "c"], "fix": [], "rmax": 4.},
+    {"free": ["b"], "fix": [], "rmax": 3., "rstep": 0.2},
+]
+
+
+@pytest.fixture
+def make_fit(make_recipe, tmp_path):
+    """Factory of FitPDFs of the make_recipe recipe in two stages.
+
+    The data file is tmp_path/data.gr, checkpoints go to
+    tmp_path/checkpoints.
+    """
+    from ezfit import diffpy_wrap as dw
+    from ezfit.ezfit import FitPDF
+
+    data = tmp_path.joinpath("data.gr")
+    data.write_text("1 2\n")
+
+    def make():
+        fit = FitPDF.__new__(FitPDF)
+        fit.file = str(data)
+        fit.phases = []
+        fit.functions = {}
+        fit.equation = "a*g + c"
+        fit.config = {
+            "param_order": [dict(order) for order in PARAM_ORDER],
+            "Restraints": {},
+            "R_val": {"rmin": 0., "rmax": 5., "rstep": 0.1},
+            "Verbose": {"step": False, "results": False},
+            "Fit": {"checkpoint": True},
+        }
+        fit.profile = None
+        fit.checkpoint_dir = str(tmp_path.joinpath("checkpoints"))
+        fit.recipe = make_recipe(dw.ArrayRestraintRecipe())
+        fit.update_recipe = None
+        fit._initial_values = None
+        fit._restraints_applied = False
+        return fit
+    return make
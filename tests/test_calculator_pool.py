@@ -0,0 +1,11 @@
+from ezfit import diffpy_wrap as dw
+
+
+def test_pools_of_other_sizes_stay_usable():
+    two = dw._shared_pool(2)
+    three = dw._shared_pool(3)
+    assert three is not two
+    assert dw._shared_pool(2) is two
+    # generators of an earlier recipe keep working on their pool
+    assert sorted(two.imap_unordered(abs, [-1, -2, 3])) == [1, 2, 3]
+    assert sorted(three.imap_unordered(abs, [-4])) == [4]
@@ -0,0 +1,53 @@
+import json
+import numpy as np
+import pytest
+
+
+def test_resume_finished_checkpoint(make_fit):
+    fit = make_fit()
+    res = fit.run_fit()
+    x = fit.recipe.PDF.profile.x
+    checkpoint = json.loads(fit.checkpoint_file().read_text())
+    assert checkpoint["done"] and checkpoint["stage"] == 1
+
+    resumed = make_fit()
+    assert resumed.recipe.PDF.profile.x.max() == pytest.approx(5.)
+    res2 = resumed.resume()
+    assert resumed.stages == []
+    np.testing.assert_allclose(resumed.recipe.PDF.profile.x, x)
+    assert x.max() <= 3.
+    assert res2.rw == pytest.approx(res.rw)
+    np.testing.assert_allclose(res2.varvals, res.varvals)
+
+
+def test_resume_after_interrupted_stage(make_fit):
+    expected = make_fit().run_fit()
+
+    fit = make_fit()
+    save = fit.save_checkpoint
+
+    def save_and_stop(stage):
+        save(stage)
+        raise KeyboardInterrupt
+
+    fit.save_checkpoint = save_and_stop
+    with pytest.raises(KeyboardInterrupt):
+        fit.run_fit()
+
+    resumed = make_fit()
+    res = resumed.resume()
+    assert [report["stage"] for report in resumed.stages] == [2]
+    assert res.rw == pytest.approx(expected.rw)
+    np.testing.assert_allclose(res.varvals, expected.varvals)
+
+
+def test_rewritten_data_discards_checkpoint(make_fit, tmp_path):
+    fit = make_fit()
+    fit.run_fit()
+    data = tmp_path.joinpath("data.gr")
+    data.write_text("1 2\n3 4\n")
+
+    resumed = make_fit()
+    assert resumed.load_checkpoint() is None
+    resumed.resume()
+    assert [report["stage"] for report in resumed.stages] == [1, 2]
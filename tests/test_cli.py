@@ -0,0 +1,43 @@
+import numpy as np
+from ezfit import cli
+from ezfit.results_store import ResultsStore
+
+
+def summary(file, rw):
+    r = np.linspace(1., 2., 5)
+    return {
+        "file": file, "rw": rw, "names": ["a"], "values": [1.],
+        "uncertainties": [0.1], "mol_scale": None, "wt_scale": None,
+        "r": r, "gobs": r, "gcalc": r, "phases": {"X": r}, "error": None,
+    }
+
+
+def test_restart_starts_a_new_store(tmp_path, monkeypatch):
+    data = tmp_path.joinpath("a.gr")
+    data.write_text("1 2\n")
+    config = tmp_path.joinpath("config.toml")
+    config.write_text(f'[files]\nout = "{tmp_path}"\n')
+    store = tmp_path.joinpath("store")
+    ResultsStore(store).append(summary(str(data), 0.2))
+
+    def fit_many(files, contributions, config_location, store=None,
+                 **kwargs):
+        results = [summary(f, 0.1) for f in files]
+        for result in results:
+            ResultsStore(store).append(result)
+        return results
+
+    monkeypatch.setattr(cli.FitPDF, "fit_many", fit_many)
+    argv = ["fit", str(data), "--phases", "X", "--config", str(config)]
+    assert cli.main(argv) == 0
+    assert len(ResultsStore(store)) == 1
+
+    assert cli.main(argv + ["--restart"]) == 0
+    assert ResultsStore(store).files == [str(data)]
+    np.testing.assert_array_equal(ResultsStore(store).rw, [0.1])
+    old = ResultsStore(tmp_path.joinpath("store.1"))
+    np.testing.assert_array_equal(old.rw, [0.2])
+
+    assert cli.main(argv + ["--restart"]) == 0
+    assert tmp_path.joinpath("store.2").is_dir()
+    assert len(ResultsStore(store)) == 1
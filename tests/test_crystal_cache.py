@@ -0,0 +1,88 @@
+import os
+import pytest
+from ezfit import crystal_cache
+
+pyobjcryst = pytest.importorskip("pyobjcryst")
+
+CIF = """data_Ni
+_symmetry_space_group_name_H-M 'F m -3 m'
+_cell_length_a {a}
+_cell_length_b {a}
+_cell_length_c {a}
+_cell_angle_alpha 90
+_cell_angle_beta 90
+_cell_angle_gamma 90
+loop_
+_atom_site_label
+_atom_site_type_symbol
+_atom_site_fract_x
+_atom_site_fract_y
+_atom_site_fract_z
+_atom_site_U_iso_or_equiv
+Ni1 Ni 0 0 0 0.005
+"""
+
+
+@pytest.fixture
+def cif(tmp_path):
+    path = tmp_path.joinpath("Ni.cif")
+    path.write_text(CIF.format(a=3.52))
+    return path
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Paths actually parsed by pyobjcryst."""
+    crystal_cache.clear_cache()
+    parsed = []
+    load = pyobjcryst.loadCrystal
+
+    def counting(path, *args, **kwargs):
+        parsed.append(path)
+        return load(path, *args, **kwargs)
+
+    monkeypatch.setattr(pyobjcryst, "loadCrystal", counting)
+    yield parsed
+    crystal_cache.clear_cache()
+
+
+def lattice_a(crystal) -> float:
+    return crystal.GetPar("a").GetValue()
+
+
+def test_in_process_hit(cif, loads):
+    first = crystal_cache.load_crystal(str(cif))
+    second = crystal_cache.load_crystal(str(cif))
+    assert len(loads) == 1
+    assert lattice_a(second) == pytest.approx(lattice_a(first))
+
+
+def test_disk_hit_after_clear_cache(cif, loads, tmp_path):
+    cache = str(tmp_path.joinpath("cache"))
+    crystal_cache.load_crystal(str(cif), cache_dir=cache)
+    crystal_cache.clear_cache()
+    crystal = crystal_cache.load_crystal(str(cif), cache_dir=cache)
+    assert len(loads) == 1
+    assert lattice_a(crystal) == pytest.approx(3.52)
+
+
+def test_rewritten_cif_is_parsed_again(cif, loads, tmp_path):
+    cache = str(tmp_path.joinpath("cache"))
+    crystal_cache.load_crystal(str(cif), cache_dir=cache)
+    stat = cif.stat()
+    cif.write_text(CIF.format(a=3.6))
+    os.utime(cif, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    crystal = crystal_cache.load_crystal(str(cif), cache_dir=cache)
+    assert len(loads) == 2
+    assert lattice_a(crystal) == pytest.approx(3.6)
+    # the old version is not kept in the process
+    assert len(crystal_cache._hashes) == 1
+    assert len(crystal_cache._structures) == 1
+
+
+def test_loads_are_independent(cif, loads):
+    first = crystal_cache.load_crystal(str(cif))
+    second = crystal_cache.load_crystal(str(cif))
+    first.GetPar("a").SetValue(4.)
+    assert lattice_a(first) == pytest.approx(4.)
+    assert lattice_a(second) == pytest.approx(3.52)
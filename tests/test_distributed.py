@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import signal
+import time
+import types
+from pathlib import Path
+import pytest
+from ezfit import distributed
+from ezfit.fit_record import FitRecord
+
+pytestmark = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="the workers inherit the patched _fit_file by fork",
+)
+
+
+def fake_fit_file(file, contributions, config_location, curves, threads,
+                  resume):
+    """Fit of a file named value.gr, plus 100 if resumed; the first fit of
+    "die" and "stall" kills or stops the worker."""
+    path = Path(file)
+    tried = path.with_suffix(".tried")
+    if path.stem in ("die", "stall") and not tried.exists():
+        tried.touch()
+        if path.stem == "die":
+            os._exit(1)
+        os.kill(os.getpid(), signal.SIGSTOP)
+    value = len(path.stem) + (100 if resume else 0)
+    return {
+        "file": file, "rw": 0.1, "names": ["a"], "values": [value],
+        "uncertainties": [0.], "error": None,
+    }
+
+
+@pytest.fixture
+def start_workers(monkeypatch):
+    monkeypatch.setattr(distributed, "_fit_file", fake_fit_file)
+    workers = []
+
+    def start(coordinator, heartbeats):
+        context = multiprocessing.get_context("fork")
+        for heartbeat in heartbeats:
+            worker = context.Process(
+                target=distributed.work,
+                args=(coordinator.address, coordinator.authkey, heartbeat),
+                daemon=True,
+            )
+            worker.start()
+            workers.append(worker)
+        return workers
+
+    yield start
+    for worker in workers:
+        if worker.is_alive():
+            worker.kill()
+        worker.join()
+
+
+def run(tmp_path, names, start_workers, heartbeats, timeout):
+    files = [str(tmp_path.joinpath(f"{name}.gr")) for name in names]
+    coordinator = distributed.Coordinator(
+        [(f, [], "", False) for f in files], timeout=timeout
+    )
+    workers = start_workers(coordinator, heartbeats)
+    results = coordinator.run()
+    for result, f in zip(results, files):
+        assert isinstance(result, FitRecord)
+        assert result.file == f
+        assert result["a"] == len(Path(f).stem)
+    return coordinator, workers
+
+
+def test_worker_dies(tmp_path, start_workers):
+    names = ["a", "bb", "die", "cccc", "ddddd", "e"]
+    coordinator, workers = run(
+        tmp_path, names, start_workers, heartbeats=(0.1, 0.1), timeout=10.
+    )
+    assert coordinator.attempts[names.index("die")] == 2
+    for worker in workers:
+        worker.join(5.)
+    assert sorted(w.exitcode for w in workers) == [0, 1]
+
+
+def test_heartbeat_timeout(tmp_path, start_workers):
+    names = ["a", "stall", "ccc", "dddd"]
+    start = time.perf_counter()
+    coordinator, workers = run(
+        tmp_path, names, start_workers, heartbeats=(0.1, 0.1), timeout=1.
+    )
+    assert time.perf_counter() - start < 10.
+    assert coordinator.attempts[names.index("stall")] == 2
+
+
+def test_authkey(monkeypatch):
+    monkeypatch.delenv("EZFIT_AUTHKEY", raising=False)
+    coordinator = distributed.Coordinator([], address=("0.0.0.0", 0))
+    other = distributed.Coordinator([])
+    try:
+        assert coordinator.authkey != other.authkey
+        assert coordinator.authkey != b"ezfit"
+        with pytest.raises(ValueError):
+            distributed.work(coordinator.address)
+    finally:
+        coordinator.close()
+        other.close()
+
+    monkeypatch.setenv("EZFIT_AUTHKEY", "secret")
+    coordinator = distributed.Coordinator([])
+    coordinator.close()
+    assert coordinator.authkey == b"secret"
+
+
+def test_serve_resumes_checkpointed_fits(tmp_path, start_workers):
+    files = [str(tmp_path.joinpath(f"{name}.gr")) for name in ["a", "bb"]]
+
+    def listen(address, authkey):
+        start_workers(types.SimpleNamespace(
+            address=address, authkey=authkey
+        ), heartbeats=(0.1,))
+
+    results = distributed.serve(
+        files, [], authkey=b"secret", on_listen=listen, resume=True
+    )
+    assert [r["file"] for r in results] == files
+    assert [r["values"] for r in results] == [[101], [102]]
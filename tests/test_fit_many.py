@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import time
+import pytest
+from ezfit import ezfit
+
+pytestmark = pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="the patched _fit_file reaches the workers only through fork"
+)
+
+
+def fake_fit_file(file, contributions, config_location, concurrent_fits=1,
+                  curves=False, threads=None, resume=False):
+    if file == "crash":
+        os._exit(1)
+    return {"file": file, "rw": 0.1, "error": None}
+
+
+def test_worker_crash_fails_only_its_file(monkeypatch):
+    monkeypatch.setattr(ezfit, "_fit_file", fake_fit_file)
+    files = [f"f{i}" for i in range(6)] + ["crash"] + [f"g{i}" for i in range(6)]
+    seen = []
+    results = ezfit.FitPDF.fit_many(
+        files, [], jobs=3, on_result=lambda r: seen.append(r["file"])
+    )
+    assert [r["file"] for r in results] == files
+    failed = [r["file"] for r in results if r["error"]]
+    assert failed == ["crash"]
+    assert "BrokenProcessPool" in results[files.index("crash")]["error"]
+    assert sorted(seen) == sorted(files)
+
+
+def test_pool_broken_before_any_fit_started(monkeypatch, tmp_path):
+    monkeypatch.setattr(ezfit, "_fit_file", fake_fit_file)
+    init = ezfit._init_batch_worker
+    marker = tmp_path.joinpath("crashed")
+
+    def crash_once(started):
+        # only the first worker process dies, before it takes a file
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return init(started)
+        os._exit(1)
+
+    monkeypatch.setattr(ezfit, "_init_batch_worker", crash_once)
+    files = [f"f{i}" for i in range(4)]
+    results = ezfit.FitPDF.fit_many(files, [], jobs=1)
+    assert [r["file"] for r in results] == files
+    assert all(r["error"] is None for r in results)
+
+
+def test_pool_that_always_breaks_fails_its_files(monkeypatch):
+    monkeypatch.setattr(ezfit, "_fit_file", fake_fit_file)
+    monkeypatch.setattr(ezfit, "_init_batch_worker", lambda started: os._exit(1))
+    files = [f"f{i}" for i in range(4)]
+    results = ezfit.FitPDF.fit_many(files, [], jobs=2)
+    assert [r["file"] for r in results] == files
+    assert all("BrokenProcessPool" in r["error"] for r in results)
+
+
+def test_isolated_fits_run_at_most_jobs_at_a_time(monkeypatch, tmp_path):
+    active = tmp_path.joinpath("active")
+    active.mkdir()
+
+    def counting_fit_file(file, *args, **kwargs):
+        mark = active.joinpath(str(os.getpid()))
+        mark.touch()
+        tmp_path.joinpath(f"{file}.count").write_text(
+            str(len(list(active.iterdir())))
+        )
+        time.sleep(0.3)
+        mark.unlink()
+        return {"file": file, "rw": 0.1, "error": None}
+
+    monkeypatch.setattr(ezfit, "_fit_file", counting_fit_file)
+    # the pool breaks before any fit started
+    monkeypatch.setattr(
+        ezfit, "_fit_batch", lambda files, indices, *args: ([], indices)
+    )
+    files = [f"f{i}" for i in range(7)]
+    results = ezfit.FitPDF.fit_many(files, [], jobs=2)
+    assert all(r["error"] is None for r in results)
+    counts = [
+        int(tmp_path.joinpath(f"{file}.count").read_text()) for file in files
+    ]
+    assert max(counts) == 2
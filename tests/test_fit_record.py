@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from ezfit.fit_record import FitRecord, stack_records
+
+
+def test_record_of_a_finished_fit(make_fit):
+    fit = make_fit()
+    res = fit.run_fit()
+    fit.molscale = {"Ni": 0.25, "NiO": 0.75}
+    fit.weightscale = {"Ni": 0.2, "NiO": 0.8}
+    record = fit.record()
+    assert record.names == tuple(res.varnames)
+    np.testing.assert_array_equal(record.values, res.varvals)
+    np.testing.assert_array_equal(record.uncertainties, res.varunc)
+    assert record.rw == res.rw
+    assert record["b"] == res.varvals[res.varnames.index("b")]
+    assert record.curves is None and record.r is None
+
+    summary = record.to_summary()
+    expected = fit.summary()
+    for key in ("file", "rw", "names", "mol_scale", "wt_scale", "error"):
+        assert summary[key] == expected[key]
+    np.testing.assert_array_equal(summary["values"], expected["values"])
+    again = FitRecord.from_summary(summary)
+    assert again.names == record.names
+    np.testing.assert_array_equal(again.values, record.values)
+    assert again.mol_scale == record.mol_scale
+    assert again.wt_scale == record.wt_scale
+
+
+def test_curves_round_trip():
+    r = np.linspace(1., 2., 4)
+    curves = np.column_stack([r, r + 1, r + 2, r * 3, r * 4])
+    record = FitRecord(
+        "a.gr", ["a"], [1.], [0.1], 0.2, phases=["Ni", "NiO"], curves=curves
+    )
+    np.testing.assert_array_equal(record.gcalc, r + 2)
+    np.testing.assert_array_equal(record.gr("NiO"), r * 4)
+    again = FitRecord.from_summary(record.to_summary())
+    assert again.phases == ("Ni", "NiO")
+    np.testing.assert_array_equal(again.curves, curves)
+    with pytest.raises(ValueError):
+        FitRecord.from_summary({"file": "b.gr", "error": "Traceback"})
+
+
+def test_stack_records_of_a_mixed_batch():
+    records = [
+        FitRecord(
+            "a.gr", ["a", "b"], [1., 2.], [0.1, 0.2], 0.1,
+            {"Ni": 0.3, "NiO": 0.7}, {"Ni": 0.2, "NiO": 0.8},
+            ["Ni", "NiO"], np.zeros((5, 5)),
+        ),
+        # no scales and no curves
+        FitRecord("b.gr", ["a", "b"], [3., 4.], [0.3, 0.4], 0.2),
+        # a scale missing
+        FitRecord(
+            "c.gr", ["a", "b"], [5., 6.], [0.5, 0.6], 0.3, {"Ni": 1.}
+        ),
+    ]
+    table = stack_records(records)
+    assert table.shape == (3,)
+    assert table.dtype.names == (
+        "file", "rw", "a", "b", "a_unc", "b_unc", "Ni_mol_scale",
+        "NiO_mol_scale", "Ni_wt_scale", "NiO_wt_scale",
+    )
+    assert table.dtype["file"] == np.dtype("O")
+    assert all(
+        table.dtype[name] == np.float64 for name in table.dtype.names[1:]
+    )
+    assert list(table["file"]) == ["a.gr", "b.gr", "c.gr"]
+    np.testing.assert_array_equal(table["b"], [2., 4., 6.])
+    np.testing.assert_array_equal(table["a_unc"], [0.1, 0.3, 0.5])
+    np.testing.assert_array_equal(table["Ni_mol_scale"], [0.3, np.nan, 1.])
+    np.testing.assert_array_equal(
+        table["NiO_wt_scale"], [0.8, np.nan, np.nan]
+    )
+
+
+def test_stack_records_checks_parameters():
+    assert stack_records([]).shape == (0,)
+    records = [
+        FitRecord("a.gr", ["a"], [1.], [0.1], 0.1),
+        FitRecord("b.gr", ["b"], [1.], [0.1], 0.1),
+    ]
+    with pytest.raises(ValueError):
+        stack_records(records)
@@ -0,0 +1,45 @@
+from pathlib import Path
+import numpy as np
+import pytest
+from ezfit import formfactor
+
+# a few of the per-element CSV tables rsc/f1.npz was converted from
+TABLES = Path(__file__).resolve().parent.joinpath("data", "f1")
+ELEMENTS = {"H": 1, "O": 8, "Ni": 28, "Ce": 58, "Os": 76, "U": 92}
+ENERGIES = np.array([1., 2.080733, 8.04, 17.48, 29.2, 58.5, 100., 1000.])
+
+
+def old_f1(symbol, keV):
+    path = TABLES.joinpath(f"{ELEMENTS[symbol]}_{symbol}_f1.csv")
+    _, energy, f1 = np.loadtxt(path, skiprows=1, delimiter=",").T
+    return np.interp(keV, energy, f1)
+
+
+@pytest.mark.parametrize("symbol", ELEMENTS)
+def test_matches_the_old_tables(symbol):
+    np.testing.assert_allclose(
+        formfactor.f1(symbol, ENERGIES), old_f1(symbol, ENERGIES),
+        rtol=1e-12
+    )
+    np.testing.assert_array_equal(
+        formfactor.f1(ELEMENTS[symbol], ENERGIES),
+        formfactor.f1(symbol, ENERGIES)
+    )
+
+
+def test_o_is_not_os():
+    f = formfactor.f1(["O", "Os", "O"], 17.48)
+    np.testing.assert_allclose(f, [
+        old_f1("O", 17.48), old_f1("Os", 17.48), old_f1("O", 17.48)
+    ], rtol=1e-12)
+    assert f[0] < 9 < 70 < f[1]
+
+
+def test_broadcast():
+    symbols = np.array(list(ELEMENTS))[:, None]
+    f = formfactor.f1(symbols, ENERGIES)
+    assert f.shape == (len(ELEMENTS), len(ENERGIES))
+    for row, symbol in zip(f, ELEMENTS):
+        np.testing.assert_allclose(row, old_f1(symbol, ENERGIES), rtol=1e-12)
+    with pytest.raises(ValueError):
+        formfactor.f1("Xx", 10.)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from ezfit import diffpy_wrap as dw
+
+R = np.linspace(0., 20., 401)
+
+
+def decay(r, a, b):
+    return a * np.exp(-r / b)
+
+
+@pytest.fixture
+def counted():
+    calls = []
+
+    def f(r, a, b):
+        calls.append((a, b))
+        return decay(r, a, b)
+
+    f.calls = calls
+    return f
+
+
+def test_hit_returns_uncached_value(counted):
+    f = dw.CachedFunction(counted)
+    y = f(R, 1., 5.)
+    y2 = f(R, 1., 5.)
+    assert len(counted.calls) == 1
+    assert y2 is y
+    np.testing.assert_array_equal(y2, decay(R, 1., 5.))
+    assert not y.flags.writeable
+
+
+def test_eviction_returns_uncached_value(counted):
+    f = dw.CachedFunction(counted, maxsize=2)
+    f(R, 1., 5.)
+    f(R, 2., 5.)
+    f(R, 1., 5.)
+    # 2. is the least recently used and is evicted
+    f(R, 3., 5.)
+    assert len(counted.calls) == 3
+    np.testing.assert_array_equal(f(R, 1., 5.), decay(R, 1., 5.))
+    assert len(counted.calls) == 3
+    np.testing.assert_array_equal(f(R, 2., 5.), decay(R, 2., 5.))
+    assert len(counted.calls) == 4
+    assert len(f._cache) == 2
+
+
+def test_changed_arguments_are_not_stale(counted):
+    f = dw.CachedFunction(counted)
+    f(R, 1., 5.)
+    step = 5. * (1 + np.finfo(float).eps ** 0.5)
+    np.testing.assert_array_equal(f(R, 1., step), decay(R, 1., step))
+    r = np.linspace(0., 10., 401)
+    np.testing.assert_array_equal(f(r, 1., 5.), decay(r, 1., 5.))
+    # the same grid in another array is a hit
+    f(R.copy(), 1., 5.)
+    assert len(counted.calls) == 3
+
+
+def test_grid_changed_in_place(counted):
+    f = dw.CachedFunction(counted)
+    r = R.copy()
+    f(r, 1., 5.)
+    r *= 0.5
+    np.testing.assert_array_equal(f(r, 1., 5.), decay(r, 1., 5.))
+    assert len(counted.calls) == 2
+
+
+def test_functions_know_their_phase():
+    from ezfit.ezfit import create_functions
+    # "NiOsphericalCF" also starts with "NiOs"
+    functions, phases = create_functions(
+        ["NiO", "NiOs", "Ni"], ["sphericalCF", "bulkCF", "sheetCF"]
+    )
+    assert list(functions) == ["NiOsphericalCF", "NisheetCF"]
+    assert phases == {"NiOsphericalCF": "NiO", "NisheetCF": "Ni"}
+
+
+def test_function_without_phase(make_recipe):
+    recipe = make_recipe()
+    functions = {"NiOsphericalCF": (decay, ["r", "NiO_a", "NiO_b"])}
+    with pytest.raises(ValueError, match="NiOsphericalCF"):
+        dw._initialize_recipe(
+            recipe, functions, {}, function_phases={"NiOsphericalCF": "NiO"}
+        )
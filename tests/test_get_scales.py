@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import pytest
+from ezfit import get_scales as gs
+
+
+class SpaceGroup:
+    """Space group given by its (rotation, translation) operations."""
+
+    def __init__(self, name, operations):
+        self.name = name
+        self.operations = operations
+        self.expanded = 0
+
+    def GetName(self):
+        return self.name
+
+    def GetNbSymmetrics(self):
+        return len(self.operations)
+
+    def GetAllSymmetrics(self, x, y, z):
+        self.expanded += 1
+        xyz = np.array([x, y, z])
+        return np.array([rot @ xyz + t for rot, t in self.operations])
+
+
+def centered(name, inversion=True):
+    """Face centered, with or without inversion."""
+    rotations = [np.eye(3), -np.eye(3)] if inversion else [np.eye(3)]
+    translations = [
+        np.zeros(3), np.array([0, .5, .5]), np.array([.5, 0, .5]),
+        np.array([.5, .5, 0])
+    ]
+    return SpaceGroup(
+        name, [(rot, t) for rot in rotations for t in translations]
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_memo(monkeypatch):
+    monkeypatch.setattr(gs, "_multiplicities", OrderedDict())
+
+
+def test_unique_positions():
+    group = centered("F-1")
+    images = np.array([
+        group.GetAllSymmetrics(*xyz)
+        for xyz in [(0, 0, 0), (.5, .5, .5), (.1, .2, .3), (.25, .25, .25)]
+    ])
+    unique = gs.unique_positions(images)
+    assert [len(u) for u in unique] == [4, 4, 8, 8]
+    assert all(((u >= 0) & (u < 1)).all() for u in unique)
+
+
+def test_site_multiplicities_memoized():
+    group = centered("F-1")
+    xyz = [(0, 0, 0), (.1, .2, .3)]
+    np.testing.assert_array_equal(gs.site_multiplicities(group, xyz), [4, 8])
+    assert group.expanded == 2
+    # the same sites within tol
+    gs.site_multiplicities(group, np.array(xyz) + 1e-6)
+    assert group.expanded == 2
+    gs.site_multiplicities(group, [(0, 0, 0), (.1, .2, .31)])
+    assert group.expanded == 4
+    # another space group with the same coordinates
+    other = centered("F1", inversion=False)
+    np.testing.assert_array_equal(gs.site_multiplicities(other, xyz), [4, 4])
+    assert other.expanded == 2
+
+
+def test_site_multiplicities_bounded(monkeypatch):
+    monkeypatch.setattr(gs, "_max_multiplicities", 2)
+    group = centered("F-1")
+    for x in (.1, .2, .1, .3):
+        gs.site_multiplicities(group, [(x, .2, .3)])
+    # .1 was used again before .3 came in, so .2 was dropped
+    assert group.expanded == 3
+    assert len(gs._multiplicities) == 2
+    gs.site_multiplicities(group, [(.1, .2, .3)])
+    assert group.expanded == 3
+    gs.site_multiplicities(group, [(.2, .2, .3)])
+    assert group.expanded == 4
+
+
+# site multiplicities, cell volume (A^3) and x-ray scattering lengths (m)
+# at 59.79489 keV of rsc/d4Al2O3.cif from the CIF text parser that
+# GetScales used before it read the loaded structure; for O from the O
+# table (that parser's glob for "*O*" picked the Os table)
+AL2O3_MULT = dict(
+    {f"Al{i}": 4. for i in range(1, 19)}, Al7=2., Al8=2., Al10=2., Al12=2.,
+    Al99=4., **{f"O{i}": 4. for i in range(1, 25)}
+)
+AL2O3_VOLUME = 1521.472871
+AL2O3_B = {"Al": 3.666115792242199e-14, "O": 2.2548027598372956e-14}
+
+
+def test_structure_values_match_the_cif_parser():
+    pytest.importorskip("pyobjcryst")
+    pytest.importorskip("diffpy.srreal")
+    from ezfit import diffpy_wrap as dw
+    from ezfit.crystal_cache import load_crystal
+    cif = Path(__file__).resolve().parents[1].joinpath("rsc", "d4Al2O3.cif")
+    pg = dw.PDFGenerator("Al2O3")
+    pg.setStructure(load_crystal(str(cif)), periodic=True)
+    scales = gs.GetScales()
+    scales.phases = ["Al2O3"]
+    scales.pgs = {"Al2O3": pg}
+    scales.config = {"Measurement": {"keV": 59.79489}}
+
+    volume = scales.get_cell_volume()["Al2O3"]
+    assert volume == pytest.approx(AL2O3_VOLUME * 1e-30, rel=1e-6)
+    assert scales.count_atom()["Al2O3"] == pytest.approx(AL2O3_MULT)
+    names = list(scales.atom_mult["Al2O3"])
+    b1 = scales.get_xray_scat_len()["Al2O3"]
+    expected = [AL2O3_B[name.rstrip("0123456789")] for name in names]
+    np.testing.assert_allclose(b1, expected, rtol=1e-6)
+    n = sum(AL2O3_MULT.values())
+    assert scales.get_number_density()["Al2O3"] == pytest.approx(
+        n / (AL2O3_VOLUME * 1e-30), rel=1e-6
+    )
+
+
+def test_fractions_of_a_batch():
+    scales = np.array([[0.2, 0.6], [0.5, 0.5], [0.1, 0.0]])
+    norms = np.array([2., 3.])
+    masses = np.array([74.69, 58.69])
+    mol = gs.mol_fractions(scales, norms)
+    wt = gs.weight_fractions(mol, masses)
+    assert mol.shape == wt.shape == scales.shape
+    np.testing.assert_allclose(mol.sum(axis=-1), 1.)
+    np.testing.assert_allclose(wt.sum(axis=-1), 1.)
+    for row, m, w in zip(scales, mol, wt):
+        np.testing.assert_allclose(m, gs.mol_fractions(row, norms))
+        np.testing.assert_allclose(w, gs.weight_fractions(m, masses))
+    np.testing.assert_allclose(mol[0], [0.2 / 2, 0.6 / 3] / np.float64(0.3))
+    np.testing.assert_array_equal(mol[2], [1., 0.])
+
+
+def test_weight_percent_of_duplicated_phases():
+    pytest.importorskip("molmass")
+    scales = gs.GetScales()
+    scales.phases = ["NiOΓ0", "NiOΓ1", "Ni"]
+    scales.formulas = {"NiO": "NiO", "Ni": "Ni"}
+    scales.real_scales = {"NiOΓ0": 0.25, "NiOΓ1": 0.25, "Ni": 0.5}
+    wt = scales.get_weight_percent()
+    assert scales.molar_masses["NiOΓ0"] == scales.molar_masses["NiOΓ1"]
+    assert scales.molar_masses["NiOΓ0"] == gs.molar_mass("NiO")
+    assert wt["NiOΓ0"] == wt["NiOΓ1"]
+    assert sum(wt.values()) == pytest.approx(1.)
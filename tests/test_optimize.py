@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from ezfit import diffpy_wrap as dw
+from ezfit.profiling import FitProfile
+
+STEPS = [
+    {"free": ["a", "c"], "fix": []},
+    {"free": ["b"], "fix": []},
+]
+
+
+def fit(recipe, **kwargs):
+    dw.optimize_params(recipe, STEPS, print_step=False, **kwargs)
+    return recipe.getValues()
+
+
+def test_finite_difference_matches_2_point(make_recipe):
+    assert dw._approx_derivative() is not None
+    expected = fit(make_recipe())
+    profile = FitProfile()
+    np.testing.assert_allclose(fit(make_recipe(), profile=profile), expected)
+    assert all(stage.jacobian_calls for stage in profile.stages)
+
+
+@pytest.mark.parametrize("profiled", [False, True])
+def test_without_approx_derivative(make_recipe, monkeypatch, profiled):
+    expected = fit(make_recipe())
+    monkeypatch.setattr(dw, "_approx_derivative", lambda: None)
+    profile = FitProfile() if profiled else None
+    values = fit(make_recipe(), profile=profile, rw_tol=1e-12)
+    np.testing.assert_allclose(values, expected, rtol=1e-6)
+    if profiled:
+        assert all(stage.residual_calls for stage in profile.stages)
+        assert not any(stage.jacobian_calls for stage in profile.stages)
+
+
+def reports(recipe, **kwargs):
+    return dw.optimize_params(recipe, STEPS, print_step=False, **kwargs)
+
+
+def test_reports_without_callback(make_recipe, monkeypatch):
+    expected = reports(make_recipe())
+    monkeypatch.setattr(dw, "_has_callback", lambda: False)
+    stages = reports(make_recipe(), rw_tol=1e-12)
+    assert [s["iterations"] for s in stages] == [
+        s["iterations"] for s in expected
+    ]
+    assert all(s["iterations"] > 0 for s in stages)
+    assert all(s["saved"] is None for s in stages)
+
+
+def test_reports_count_jacobian_evaluations(make_recipe):
+    expected = reports(make_recipe())
+    stages = reports(make_recipe(), rw_tol=1e-3, early_stop=False)
+    assert [s["iterations"] for s in stages] == [
+        s["iterations"] for s in expected
+    ]
+    assert all(s["saved"] is not None for s in stages)
+
+
+def test_skip_check_jacobian_is_reused(make_recipe, monkeypatch):
+    approx_derivative = dw._approx_derivative()
+    calls = []
+
+    def counted(*args, **kwargs):
+        calls.append(args[1])
+        return approx_derivative(*args, **kwargs)
+
+    monkeypatch.setattr(dw, "_approx_derivative", lambda: counted)
+    stages = reports(make_recipe(), rw_tol=1e-12)
+    assert "skipped" not in [s["status"] for s in stages]
+    assert len(calls) == sum(s["iterations"] for s in stages)
+
+
+def test_two_point_steps_match_scipy():
+    from scipy.optimize import _numdiff
+    x = np.array([0., 1e-3, -2.5, 3e4, -7e-9, 0.999999999, -1., 5.])
+    lb = np.array([-np.inf, 0., -3., 0., -1e-8, 0., -1., 5. - 1e-9])
+    ub = np.array([np.inf, 1., -2.5, np.inf, 0., 1., 1e-9, 5. + 1e-9])
+    h = _numdiff._compute_absolute_step(None, x, x, "2-point")
+    h, _ = _numdiff._adjust_scheme_to_bounds(x, h, 1, "1-sided", lb, ub)
+    np.testing.assert_array_equal(dw._two_point_steps(x, lb, ub), (x + h) - x)
+
+
+@pytest.mark.skipif(not dw._can_fork(), reason="forks the Jacobian workers")
+def test_parallel_jacobian_matches_2_point(make_recipe):
+    recipe = make_recipe()
+    recipe.a.value = -3.1
+    recipe.c.value = -0.25
+    recipe.b.boundRange(0.2, 0.6)
+    bounds = recipe.getBounds2()
+    x = recipe.getValues()
+    jac = dw.ParallelJacobian(recipe, 2, bounds)
+    try:
+        np.testing.assert_array_equal(jac(x), dw._approx_derivative()(
+            recipe.residual, x, method="2-point", bounds=bounds
+        ))
+    finally:
+        jac.close()
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from ezfit import diffpy_wrap as dw
+
+pytest.importorskip("diffpy.srreal")
+from diffpy.structure import Atom, Lattice, Structure  # noqa: E402
+
+R = np.arange(1., 10., 0.05)
+
+
+def nickel() -> Structure:
+    atoms = [
+        Atom("Ni", xyz) for xyz in
+        [(0, 0, 0), (0.5, 0.5, 0), (0.5, 0, 0.5), (0, 0.5, 0.5)]
+    ]
+    for atom in atoms:
+        atom.Uisoequiv = 0.005
+    return Structure(atoms, lattice=Lattice(3.52, 3.52, 3.52, 90, 90, 90))
+
+
+def generator(cls=dw.CachedPDFGenerator):
+    gen = cls("G")
+    gen.setStructure(nickel(), "phase")
+    gen.setQmax(25.)
+    gen.scale.setValue(0.8)
+    return gen
+
+
+@pytest.fixture
+def calculations(monkeypatch):
+    """Number of PDF calculations of all generators."""
+    calls = []
+    calculate = dw.PDFGenerator.__call__
+
+    def counted(self, r):
+        calls.append(self.name)
+        return calculate(self, r)
+
+    monkeypatch.setattr(dw.PDFGenerator, "__call__", counted)
+    return calls
+
+
+def test_scale_only_reuses_the_pdf(calculations):
+    gen = generator()
+    y = gen(R)
+    gen.scale.setValue(0.4)
+    y2 = gen(R)
+    assert len(calculations) == 1
+    np.testing.assert_array_equal(y2, 0.4 * gen._cache_y)
+    np.testing.assert_array_equal(y, 0.8 * gen._cache_y)
+
+
+def test_structure_change_recalculates(calculations):
+    gen = generator()
+    gen(R)
+    gen.phase.lattice.a.setValue(3.55)
+    y = gen(R)
+    assert len(calculations) == 2
+    expected = generator()
+    expected.phase.lattice.a.setValue(3.55)
+    np.testing.assert_array_equal(y, expected(R))
+
+
+def test_grid_change_recalculates(calculations):
+    gen = generator()
+    gen(R)
+    r = np.arange(1., 10., 0.02)
+    y = gen(r)
+    assert len(calculations) == 2
+    assert y.shape == r.shape
+    np.testing.assert_array_equal(y, generator()(r))
+
+
+@pytest.mark.parametrize("name, value", [
+    ("qdamp", 0.04), ("qbroad", 0.02), ("delta2", 2.),
+])
+def test_metadata_change_recalculates(calculations, name, value):
+    gen = generator()
+    y = gen(R)
+    gen.get(name).setValue(value)
+    y2 = gen(R)
+    assert len(calculations) == 2
+    assert not np.array_equal(y, y2)
+    expected = generator()
+    expected.get(name).setValue(value)
+    np.testing.assert_array_equal(y2, expected(R))
+
+
+def test_processed_metadata_recalculates(calculations):
+    gen = generator()
+    gen(R)
+    gen.meta["qmax"] = 20.
+    gen.processMetaData()
+    gen(R)
+    assert len(calculations) == 2
+
+
+def test_cached_equals_uncached():
+    gen = generator()
+    plain = generator(dw.PDFGenerator)
+    gen.scale.setValue(1.)
+    plain.scale.setValue(1.)
+    np.testing.assert_array_equal(gen(R), plain(R))
+    for name, value in [("scale", 0.3), ("qdamp", 0.03), ("scale", 1.2)]:
+        gen.get(name).setValue(value)
+        plain.get(name).setValue(value)
+        # srreal scales the PDF while applying its envelopes, the cache
+        # after, so away from unit scale they agree to rounding
+        np.testing.assert_allclose(gen(R), plain(R), rtol=1e-14, atol=0)
+        # a warm cache gives the same bits as a cold one
+        cold = generator()
+        cold.get(name).setValue(value)
+        cold.get("qdamp").setValue(gen.qdamp.value)
+        cold.scale.setValue(gen.scale.value)
+        np.testing.assert_array_equal(gen(R), cold(R))
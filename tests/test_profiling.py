@@ -0,0 +1,102 @@
+import json
+import pytest
+from ezfit import diffpy_wrap as dw
+from ezfit.profiling import FitProfile
+
+STEPS = [
+    {"free": ["a", "c"], "fix": []},
+    {"free": ["b"], "fix": [], "rmax": 3.},
+]
+
+
+@pytest.fixture
+def profiled(make_recipe):
+    recipe = make_recipe()
+    profile = FitProfile()
+    with profile.span("fit"):
+        dw.optimize_params(recipe, STEPS, print_step=False, profile=profile)
+    return recipe, profile
+
+
+def test_stage_times_add_up_to_the_fit(profiled):
+    _, profile = profiled
+    totals = profile.totals()
+    assert list(totals) == ["stage 1", "stage 2", "fit"]
+    stages = sum(stage.wall_time for stage in profile.stages)
+    assert stages <= totals["fit"]
+    assert stages == pytest.approx(totals["fit"], rel=0.3)
+    for stage in profile.stages:
+        assert totals[f"stage {stage.index + 1}"] == pytest.approx(
+            stage.wall_time, rel=0.05, abs=1e-3
+        )
+        assert stage.residual_time + stage.jacobian_time <= stage.wall_time
+        calls, seconds = stage.generators["g"]
+        assert calls > 0
+        assert 0 < seconds <= stage.wall_time
+        assert len(stage.rw) == stage.residual_calls
+
+
+def test_json(profiled, tmp_path):
+    _, profile = profiled
+    path = tmp_path.joinpath("profile.json")
+    profile.save_json(path)
+    saved = json.loads(path.read_text())
+    assert saved == json.loads(json.dumps(profile.to_dict()))
+    assert [span["name"] for span in saved["spans"]] == [
+        "stage 1", "stage 2", "fit"
+    ]
+    first, second = saved["stages"]
+    assert first["names"] == ["a", "c"]
+    assert sorted(second["names"]) == ["a", "b", "c"]
+    assert second["rmax"] == 3.
+    assert set(first["generators"]) == {"g"}
+    assert first["generators"]["g"]["calls"] > 0
+    assert first["status"] > 0
+
+
+def test_chrome_trace(profiled, tmp_path):
+    _, profile = profiled
+    path = tmp_path.joinpath("trace.json")
+    profile.save_chrome_trace(path)
+    trace = json.loads(path.read_text())
+    events = trace["traceEvents"]
+    complete = [e for e in events if e["ph"] == "X"]
+    counters = [e for e in events if e["ph"] == "C"]
+    for event in complete:
+        assert set(event) >= {"name", "ph", "ts", "dur", "pid", "tid"}
+        assert event["ts"] >= 0 and event["dur"] >= 0
+    for event in counters:
+        assert set(event) >= {"name", "ph", "ts", "pid", "args"}
+        assert event["name"] == "Rw"
+    assert len(complete) + len(counters) == len(events)
+
+    spans = {e["name"]: e for e in complete if e["tid"] == 0}
+    assert set(spans) == {"stage 1", "stage 2", "fit"}
+    calls = [e for e in complete if e["tid"] == 1]
+    assert {e["name"] for e in calls} <= {"residual", "jacobian"}
+    assert len(counters) == sum(s.residual_calls for s in profile.stages)
+    # every evaluation lies within the span of its stage
+    for event in calls:
+        stage = spans[f"stage {event['args']['stage']}"]
+        assert stage["ts"] <= event["ts"] + 1e-3
+        assert event["ts"] + event["dur"] <= stage["ts"] + stage["dur"] + 1e-3
+
+
+def test_generators_are_restored(make_recipe):
+    recipe = make_recipe()
+    pg = recipe.PDF.g
+    operation = pg.operation
+    profile = FitProfile()
+    with profile.stage(recipe, 0, (None, None, None)) as stage:
+        assert pg.operation != operation
+        recipe.PDF.evaluate()
+    assert "operation" not in vars(pg)
+    assert pg.operation == operation
+    assert stage.generators["g"][0] == 1
+
+    with pytest.raises(RuntimeError):
+        with profile.stage(recipe, 1, (None, None, None)):
+            raise RuntimeError
+    assert "operation" not in vars(pg)
+    assert pg.operation == operation
+    assert profile.stages[1].wall_time > 0
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from diffpy.srfit.fitbase import FitRecipe, FitResults
+from ezfit import diffpy_wrap as dw
+
+
+# (name, lb, ub, sig), the last two violated
+BOUNDS = [("a", 0., 10., 0.1), ("b", 0.65, 1., 0.05), ("c", 0., 0.2, 0.01)]
+
+
+def test_restraint_array_matches_srfit_restraints(make_recipe):
+    plain = make_recipe(FitRecipe())
+    for name, lb, ub, sig in BOUNDS:
+        plain.restrain(name, lb=lb, ub=ub, sig=sig)
+    array = make_recipe(dw.ArrayRestraintRecipe())
+    for name, lb, ub, sig in BOUNDS:
+        array.restraint_array.add([array.get(name)], lb, ub, sig)
+
+    res, expected_res = array.residual(), plain.residual()
+    n = len(array.PDF.profile.x)
+    np.testing.assert_allclose(res[:n], expected_res[:n])
+    # srfit does not keep the restraints in the order they were added
+    np.testing.assert_allclose(np.sort(res[n:]), np.sort(expected_res[n:]))
+
+    expected = FitResults(plain)
+    results = dw.ArrayFitResults(array)
+    assert results.penalty > 0
+    for key in ("chi2", "rchi2", "rw", "penalty", "residual"):
+        assert getattr(results, key) == pytest.approx(getattr(expected, key))
+    np.testing.assert_allclose(results.varunc, expected.varunc)
+
+
+def test_penalty_is_unscaled(make_recipe):
+    recipe = make_recipe(dw.ArrayRestraintRecipe())
+    restraints = [
+        recipe.restrain(name, lb=lb, ub=ub, sig=sig)
+        for name, lb, ub, sig in BOUNDS
+    ]
+    for name, lb, ub, sig in BOUNDS:
+        recipe.restraint_array.add([recipe.get(name)], lb, ub, sig)
+    for w in (1., 3.5):
+        assert recipe.restraint_array.penalty() == pytest.approx(
+            sum(r.penalty(w) for r in restraints)
+        )
+    with pytest.raises(TypeError):
+        recipe.restraint_array.penalty(2.)
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from ezfit.results_store import ResultsStore
+
+
+def summary(i, n=5, scales=True):
+    r = np.linspace(1., 2., n)
+    result = {
+        "file": f"data/{i}.gr", "rw": 0.1 * (i + 1),
+        "names": ["a", "b"], "values": [i, 2. * i],
+        "uncertainties": [0.1, 0.2], "mol_scale": None, "wt_scale": None,
+        "r": r, "gobs": r + i, "gcalc": r + i + 0.5,
+        "phases": {"G1": r * i, "G2": -r}, "error": None,
+    }
+    if scales:
+        result["mol_scale"] = {"Ni": 0.25, "NiO": 0.75}
+        result["wt_scale"] = {"Ni": 0.2, "NiO": 0.8}
+    return result
+
+
+def check(store, results):
+    assert len(store) == len(results)
+    assert store.files == [r["file"] for r in results]
+    assert isinstance(store.values, np.memmap)
+    np.testing.assert_array_equal(store.rw, [r["rw"] for r in results])
+    np.testing.assert_array_equal(
+        store.values, [r["values"] for r in results]
+    )
+    np.testing.assert_array_equal(
+        store.uncertainties, [r["uncertainties"] for r in results]
+    )
+    for i, result in enumerate(results):
+        curves = store.curves(i)
+        for key in ("r", "gobs", "gcalc"):
+            np.testing.assert_array_equal(curves[key], result[key])
+        for phase, gr in result["phases"].items():
+            np.testing.assert_array_equal(curves["phases"][phase], gr)
+
+
+def test_append_and_read_back(tmp_path):
+    store = ResultsStore(tmp_path)
+    results = [summary(i, n=5 + i) for i in range(3)]
+    for result in results:
+        store.append(result)
+    check(store, results)
+    assert store.names == ["a", "b"]
+    assert store.phases == ["G1", "G2"]
+    np.testing.assert_array_equal(store.column("b"), [0., 2., 4.])
+    assert store.scale_phases == ["Ni", "NiO"]
+    np.testing.assert_array_equal(store.mol_scale, [[0.25, 0.75]] * 3)
+    np.testing.assert_array_equal(store.wt_scale, [[0.2, 0.8]] * 3)
+
+
+def test_reopen(tmp_path):
+    results = [summary(i) for i in range(2)]
+    for result in results:
+        ResultsStore(tmp_path).append(result)
+    store = ResultsStore(tmp_path)
+    check(store, results)
+    assert store.scale_phases == ["Ni", "NiO"]
+    results.append(summary(2))
+    store.append(results[-1])
+    check(ResultsStore(tmp_path), results)
+
+
+def test_empty(tmp_path):
+    store = ResultsStore(tmp_path)
+    assert len(store) == 0
+    assert store.files == []
+    assert store.values.shape == (0, 0)
+
+
+@pytest.mark.parametrize("partial", [
+    # interrupted before rw.f8: every other file has the new row
+    ["files.txt", "values.f8", "uncertainties.f8", "mol_scale.f8",
+     "wt_scale.f8", "curves.f8", "curve_index.i8"],
+    # interrupted while writing: half rows
+    ["values.f8", "curves.f8"],
+    ["curve_index.i8"],
+])
+def test_recover_interrupted_append(tmp_path, partial):
+    results = [summary(i) for i in range(2)]
+    store = ResultsStore(tmp_path)
+    for result in results:
+        store.append(result)
+    for name in partial:
+        with tmp_path.joinpath(name).open("ab") as f:
+            f.write(b"garbage\n" + bytes(13))
+    store = ResultsStore(tmp_path)
+    check(store, results)
+    results.append(summary(2, n=7))
+    store.append(results[-1])
+    check(ResultsStore(tmp_path), results)
+    np.testing.assert_array_equal(store.mol_scale, [[0.25, 0.75]] * 3)
+
+
+def test_scales_after_the_first_fit(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append(summary(0, scales=False))
+    assert store.scale_phases == []
+    store.append(summary(1))
+    store.append(summary(2, scales=False))
+    store = ResultsStore(tmp_path)
+    assert store.scale_phases == ["Ni", "NiO"]
+    np.testing.assert_array_equal(
+        store.wt_scale, [[np.nan, np.nan], [0.2, 0.8], [np.nan, np.nan]]
+    )
+
+
+def test_mismatch(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append(summary(0))
+    other = summary(1)
+    other["names"] = ["a", "c"]
+    with pytest.raises(ValueError):
+        store.append(other)
+    failed = {"file": "x.gr", "error": "Traceback"}
+    with pytest.raises(ValueError):
+        store.append(failed)
+    assert len(store) == 1
@@ -0,0 +1,137 @@
+import multiprocessing
+import pytest
+from ezfit import screening
+
+pytestmark = pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="the patched _screen_fit reaches the workers only through fork"
+)
+
+# first-pass and full Rw of every combination, "X" fails
+QUICK = {
+    "A": 0.2, "B": 0.25, "C": 0.28, "D": 0.5,
+    "AB": 0.1, "AC": 0.15, "BC": 0.3, "ABC": 0.12,
+}
+FULL = {"AB": 0.09, "ABC": 0.08}
+
+
+def fake_screen_fit(file, contributions, config_location, param_order,
+                    threads):
+    combo = "".join(c.cif_name for c in contributions)
+    if "X" in combo:
+        return {"file": file, "error": "Traceback: no structure"}
+    if param_order is None:
+        rw, scale = FULL[combo], {c.cif_name: 1. for c in contributions}
+    else:
+        assert param_order == [
+            {"free": ["lat", "scale"], "fix": [], "rmax": 10., "rstep": 0.1}
+        ]
+        rw, scale = QUICK[combo], None
+    return {
+        "file": file, "rw": rw, "mol_scale": scale, "wt_scale": scale,
+        "error": None,
+    }
+
+
+@pytest.fixture
+def config(tmp_path):
+    cifs = tmp_path.joinpath("cifs")
+    cifs.mkdir()
+    for name in "ABCDX":
+        cifs.joinpath(f"{name}.cif").write_text(
+            f"_chemical_formula_sum '{name}2 O'\n"
+        )
+    config = tmp_path.joinpath("config.toml")
+    config.write_text(f'[files]\ncifs = "{cifs}/"\n[R_val]\nrstep = 0.1\n')
+    return str(config)
+
+
+def screen(config, monkeypatch, **kwargs):
+    monkeypatch.setattr(screening, "_screen_fit", fake_screen_fit)
+    return screening.screen(
+        "data.gr", config_location=config, jobs=2, quick_rmax=10., **kwargs
+    )
+
+
+def test_candidates_from_the_library(config):
+    contributions = screening.candidate_contributions(
+        screening.library(screening.load_config(config)),
+        screening.load_config(config),
+    )
+    assert list(contributions) == list("ABCDX")
+    assert contributions["A"].formula == "A2O"
+    assert contributions["A"].cf_name == "bulkCF"
+
+
+def test_pruning_and_combinations(config, monkeypatch):
+    rows = screen(config, monkeypatch, max_phases=3, prune=1.5, keep=3, top=2)
+    combos = ["".join(row["phases"]) for row in rows]
+    # D is above 1.5 times the best single Rw and X failed, so neither
+    # is combined
+    assert sorted(combos) == sorted(
+        ["A", "B", "C", "D", "X", "AB", "AC", "BC", "ABC"]
+    )
+
+
+def test_keep_limits_the_combined_candidates(config, monkeypatch):
+    rows = screen(config, monkeypatch, max_phases=3, prune=1.5, keep=2, top=2)
+    combos = ["".join(row["phases"]) for row in rows]
+    assert sorted(combos) == sorted(["A", "B", "C", "D", "X", "AB"])
+
+
+def test_max_phases(config, monkeypatch):
+    rows = screen(config, monkeypatch, max_phases=2, prune=1.5, keep=3, top=2)
+    combos = ["".join(row["phases"]) for row in rows]
+    assert "ABC" not in combos
+    assert {"AB", "AC", "BC"} <= set(combos)
+
+
+def test_ranking(config, monkeypatch):
+    rows = screen(config, monkeypatch, max_phases=3, prune=1.5, keep=3, top=2)
+    assert ["".join(row["phases"]) for row in rows] == [
+        "ABC", "AB", "AC", "A", "B", "C", "BC", "D", "X"
+    ]
+    best = rows[0]
+    assert best["rw"] == 0.08 and best["quick_rw"] == 0.12
+    assert best["mol_scale"] == {"A": 1., "B": 1., "C": 1.}
+    # only the top two are fully refined
+    assert all(row["rw"] is None for row in rows[2:])
+    assert rows[2]["mol_scale"] is None and rows[2]["quick_rw"] == 0.15
+    assert rows[-1]["quick_rw"] is None
+    assert "no structure" in rows[-1]["error"]
+
+
+class FakeFit:
+    """FitPDF without a recipe, recording the restraints it fits with."""
+
+    restraints = None
+
+    def __init__(self, file, contributions, config_location):
+        self.file = file
+        self.config = {
+            "param_order": [],
+            "Restraints": {"lat": [0.9, 1.1], "cfs": [10., 50.]},
+        }
+
+    def set_threads(self, threads):
+        pass
+
+    def update_recipe(self):
+        pass
+
+    def _tag_index(self):
+        return {"lat": [], "scale": []}
+
+    def run_fit(self):
+        FakeFit.restraints = self.config["Restraints"]
+
+    def summary(self):
+        return {"file": self.file, "rw": 0.1, "error": None}
+
+
+def test_screen_fit_skips_restraints_without_variables(monkeypatch):
+    monkeypatch.setattr(screening, "FitPDF", FakeFit)
+    order = [{"free": ["lat", "scale"], "fix": [], "rmax": 10.}]
+    result = screening._screen_fit("data.gr", [], "", order, 1)
+    assert result["error"] is None
+    assert FakeFit.restraints == {"lat": [0.9, 1.1]}
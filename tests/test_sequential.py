@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+from ezfit import diffpy_wrap as dw
+from ezfit.ezfit import FitPDF
+
+
+def write_data(path, b):
+    x = np.linspace(0, 5, 51)
+    np.savetxt(path, np.column_stack(
+        [x, 3 * np.exp(-b * x) + 0.2, np.zeros_like(x), np.full_like(x, 0.02)]
+    ))
+    return str(path)
+
+
+@pytest.fixture
+def frames(tmp_path):
+    return [
+        write_data(tmp_path.joinpath(f"frame{i}.gr"), b)
+        for i, b in enumerate([0.7, 0.72, 0.74])
+    ]
+
+
+@pytest.fixture
+def toy_fit(make_fit, make_recipe):
+    """FitPDF class of the make_fit recipe, recording builds and fits."""
+
+    class ToyFit(FitPDF):
+        builds = []
+        fits = []
+        sequential = {}
+        interrupt = None
+
+        def __init__(self, file, contributions, config_location):
+            state = vars(make_fit())
+            # make_fit sets it to None on the instance
+            state.pop("update_recipe")
+            self.__dict__.update(state)
+            self.file = file
+            self.config["PDF"] = {}
+            self.config["Sequential"] = dict(self.sequential)
+
+        def update_recipe(self):
+            ToyFit.builds.append(self.file)
+            self.recipe = make_recipe(dw.ArrayRestraintRecipe())
+            dw.swap_profile(self.recipe, self.file)
+            self._restraints_applied = False
+            self._initial_values = None
+
+        def run_fit(self, start_stage=0, max_nfev=None, free=None):
+            ToyFit.fits.append({
+                "file": self.file, "start": start_stage,
+                "max_nfev": max_nfev, "values": self.get_values(),
+            })
+            return super().run_fit(start_stage, max_nfev, free)
+
+        def save_checkpoint(self, stage):
+            super().save_checkpoint(stage)
+            if (self.file, stage) == ToyFit.interrupt:
+                raise KeyboardInterrupt
+
+    return ToyFit
+
+
+def stages(result):
+    return [report["stage"] for report in result["stages"]]
+
+
+def test_frames_start_from_the_previous_frame(toy_fit, frames):
+    results = toy_fit.fit_sequential(frames, [])
+    assert all(r["error"] is None for r in results)
+    assert toy_fit.builds == frames[:1]
+    assert [stages(r) for r in results] == [[1, 2], [2], [2]]
+    first, second, _ = toy_fit.fits
+    assert first["start"] == 0 and first["max_nfev"] is None
+    assert second["start"] == -1
+    assert second["values"] == pytest.approx(
+        dict(zip(results[0]["names"], results[0]["values"]))
+    )
+    assert results[0]["values"] != results[1]["values"]
+
+
+def test_defaults_from_the_sequential_section(toy_fit, frames):
+    toy_fit.sequential = {"start_stage": 0, "max_nfev": 7}
+    results = toy_fit.fit_sequential(frames[:2], [])
+    assert [stages(r) for r in results] == [[1, 2], [1, 2]]
+    assert toy_fit.fits[1]["start"] == 0
+    assert toy_fit.fits[1]["max_nfev"] == 7
+    assert all(r["nfev"] <= 7 for r in results[1]["stages"])
+
+    toy_fit.fits.clear()
+    toy_fit.fit_sequential(frames[:2], [], start_stage=1, max_nfev=20)
+    assert toy_fit.fits[1]["start"] == 1
+    assert toy_fit.fits[1]["max_nfev"] == 20
+
+
+def test_failed_frame_rebuilds_and_seeds_from_the_last_good_one(
+        toy_fit, frames, tmp_path):
+    broken = tmp_path.joinpath("broken.gr")
+    broken.write_text("not a PDF\n")
+    files = [frames[0], str(broken), frames[1]]
+    results = toy_fit.fit_sequential(files, [])
+    assert results[0]["error"] is None
+    assert results[1]["error"] and results[1]["file"] == str(broken)
+    assert results[2]["error"] is None
+    # the recipe the failed frame left behind is not reused
+    assert toy_fit.builds == [frames[0], frames[1]]
+    last = toy_fit.fits[-1]
+    assert last["file"] == frames[1] and last["start"] == -1
+    assert last["values"] == pytest.approx(
+        dict(zip(results[0]["names"], results[0]["values"]))
+    )
+    assert stages(results[2]) == [2]
+
+
+def test_resume_from_checkpoints(toy_fit, frames):
+    expected = toy_fit.fit_sequential(frames[:2], [], start_stage=0)
+
+    toy_fit.interrupt = (frames[1], 0)
+    with pytest.raises(KeyboardInterrupt):
+        toy_fit.fit_sequential(frames[:2], [], start_stage=0)
+
+    toy_fit.interrupt = None
+    toy_fit.fits.clear()
+    results = toy_fit.fit_sequential(
+        frames[:2], [], start_stage=0, resume=True
+    )
+    # the first frame is finished, the second continues after stage 1
+    assert [stages(r) for r in results] == [[], [2]]
+    assert [fit["start"] for fit in toy_fit.fits] == [2, 1]
+    for result, reference in zip(results, expected):
+        assert result["rw"] == pytest.approx(reference["rw"], rel=1e-4)
+        np.testing.assert_allclose(
+            result["values"], reference["values"], rtol=1e-4
+        )
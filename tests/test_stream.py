@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+import pytest
+from ezfit import ezfit, stream
+
+pytestmark = pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="the patched _fit_file reaches the workers only through fork"
+)
+
+
+def slow_fit_file(file, contributions, config_location, concurrent_fits=1,
+                  curves=False, threads=None, resume=False):
+    if Path(file).stem == "crash":
+        os._exit(1)
+    time.sleep(3. if Path(file).stem == "slow" else 1.5)
+    return {"file": file, "rw": 0.1, "error": None}
+
+
+def run_watch(directory, config, results):
+    # a process group of its own, like a terminal running ezfit
+    os.setpgrp()
+    ezfit._fit_file = slow_fit_file
+    stream._store_result = lambda store, result: None
+    out = stream.watch(directory, [], str(config), settle=0., poll=0.1)
+    results.put(out)
+
+
+def test_ctrl_c_finishes_running_fits(tmp_path):
+    data = tmp_path.joinpath("data")
+    data.mkdir()
+    data.joinpath("a.gr").write_text("1 2\n")
+    config = tmp_path.joinpath("config.toml")
+    config.write_text(f'[files]\nout = "{tmp_path}"\n')
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=run_watch, args=(str(data), config, results)
+    )
+    process.start()
+    time.sleep(0.8)
+    os.killpg(process.pid, signal.SIGINT)
+    out = results.get(timeout=10)
+    process.join(10)
+    assert [r["file"] for r in out] == [str(data.joinpath("a.gr"))]
+    assert out[0]["error"] is None
+
+
+def test_worker_crash_fails_only_its_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(ezfit, "_fit_file", slow_fit_file)
+    monkeypatch.setattr(stream, "_store_result", lambda store, result: None)
+    data = tmp_path.joinpath("data")
+    data.mkdir()
+    names = ["a", "b", "crash", "c", "d"]
+    for name in names:
+        data.joinpath(f"{name}.gr").write_text("1 2\n")
+    config = tmp_path.joinpath("config.toml")
+    config.write_text(f'[files]\nout = "{tmp_path}"\n')
+    out = stream.watch(
+        str(data), [], str(config), jobs=2, settle=0., poll=0.1,
+        idle_timeout=1.
+    )
+    files = {Path(r["file"]).stem: r for r in out}
+    assert sorted(files) == sorted(names)
+    assert len(out) == len(names)
+    failed = [name for name, r in files.items() if r["error"]]
+    assert failed == ["crash"]
+    assert "BrokenProcessPool" in files["crash"]["error"]
+
+
+def test_watching_goes_on_while_crashed_fits_are_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(ezfit, "_fit_file", slow_fit_file)
+    monkeypatch.setattr(stream, "_store_result", lambda store, result: None)
+    data = tmp_path.joinpath("data")
+    data.mkdir()
+    for name in ["slow", "crash"]:
+        data.joinpath(f"{name}.gr").write_text("1 2\n")
+    config = tmp_path.joinpath("config.toml")
+    config.write_text(f'[files]\nout = "{tmp_path}"\n')
+    # arrives while slow is fitted again after the crash
+    threading.Timer(
+        0.5, data.joinpath("new.gr").write_text, args=("1 2\n",)
+    ).start()
+    out = stream.watch(
+        str(data), [], str(config), jobs=2, settle=0., poll=0.1,
+        idle_timeout=1.
+    )
+    assert [Path(r["file"]).stem for r in out] == ["crash", "new", "slow"]
+    assert [bool(r["error"]) for r in out] == [True, False, False]
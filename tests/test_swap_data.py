@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+
+def write_data(path, b, c=0.2, dy=0.02):
+    x = np.linspace(0, 5, 51)
+    np.savetxt(path, np.column_stack(
+        [x, 3 * np.exp(-b * x) + c, np.zeros_like(x), np.full_like(x, dy)]
+    ))
+    return str(path)
+
+
+@pytest.fixture
+def swap_fit(make_fit):
+    fit = make_fit()
+    fit.config["PDF"] = {}
+    fit.checkpoint_dir = None
+    return fit
+
+
+def test_failed_calc_scale_leaves_no_stale_scales(swap_fit, tmp_path):
+    fit = swap_fit
+    fit.calc_scale = lambda: ({"A": 1.}, {"A": 2.})
+    fit.run_fit()
+    assert fit.summary()["mol_scale"] == {"A": 1.}
+
+    def fail():
+        raise ValueError("no structure")
+
+    fit.calc_scale = fail
+    fit.swap_data(write_data(tmp_path.joinpath("b.gr"), 0.5))
+    fit.run_fit()
+    summary = fit.summary()
+    assert summary["file"] == str(tmp_path.joinpath("b.gr"))
+    for key in ("mol_scale", "wt_scale", "scale_norm", "molar_mass"):
+        assert summary[key] is None
+    assert fit.record().mol_scale == {}
+
+
+def test_reset_initial_restores_the_first_starting_values(swap_fit, tmp_path):
+    fit = swap_fit
+    start = fit.get_values()
+    fit.run_fit()
+    assert fit.get_values() != pytest.approx(start)
+    fit.swap_data(write_data(tmp_path.joinpath("b.gr"), 0.5))
+    assert fit.get_values() == start
+
+
+def test_reset_previous_keeps_the_refined_values(swap_fit, tmp_path):
+    fit = swap_fit
+    fit.run_fit()
+    refined = fit.get_values()
+    fit.swap_data(write_data(tmp_path.joinpath("b.gr"), 0.5), "previous")
+    assert fit.get_values() == refined
+    with pytest.raises(ValueError):
+        fit.swap_data(str(tmp_path.joinpath("b.gr")), "last")
+
+
+def test_next_residual_uses_the_swapped_profile(swap_fit, tmp_path):
+    fit = swap_fit
+    fit.run_fit()
+    file = write_data(tmp_path.joinpath("b.gr"), 0.5, c=0.1, dy=0.05)
+    fit.swap_data(file, reset="previous")
+    profile = fit.recipe.PDF.profile
+    data = np.loadtxt(file)
+    np.testing.assert_array_equal(profile.xobs, data[:, 0])
+    np.testing.assert_array_equal(profile.yobs, data[:, 1])
+    np.testing.assert_array_equal(profile.dyobs, data[:, 3])
+    assert fit.file == file
+
+    # only the last stage, on its own calculation range
+    fit.run_fit(start_stage=-1)
+    x = profile.x
+    assert x[0] == pytest.approx(0.) and x[-1] <= 3.
+    np.testing.assert_allclose(np.diff(x), 0.2)
+    values = fit.get_values()
+    gcalc = values["a"] * np.exp(-values["b"] * x) + values["c"]
+    y = np.interp(x, data[:, 0], data[:, 1])
+    np.testing.assert_allclose(
+        fit.recipe.PDF.residual(), (gcalc - y) / 0.05, atol=1e-8
+    )
+    assert values["c"] == pytest.approx(0.1, abs=1e-3)